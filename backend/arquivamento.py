@@ -0,0 +1,408 @@
+from contextlib import contextmanager
+from datetime import datetime, date, time, timedelta
+import argparse
+import glob
+import os
+import uuid
+import pandas as pd
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import engine, db_path, trava_escrita, sem_acento, nova_versao_dados, Product, PriceHistory, PriceLatest, ArchivedFingerprint, ArchivedFacet, FORMATO_DATA_IMPRESSAO
+from busca import garantir_indice_busca, TABELA_BUSCA, TABELA_ARQUIVO_CARREGADO, arquivo_carregado
+from gap_precos import reconstruir_gap
+from consultas import normalizar_filtros, limites_periodo
+from facetas import consulta_contagens, cache_facetas
+from metricas import etapa
+
+# --- ARQUIVO FRIO (Parquet) ---
+# Linhas do price_history mais antigas que o horizonte saem do SQLite para Parquet
+# (zstd), uma partição por mês ao lado do banco:
+#   tireforce_arquivo/mes=2023-01/parte-20240610T120000123456-1a2b3c4d.parquet
+# O price_daily não é arquivado (o /timeseries com date_from antigo sai dele), as
+# impressões digitais vão para archived_fingerprints (reenvio antigo não duplica) e
+# as contagens das facetas para archived_facets (listas dos filtros completas).
+# Os arquivos são escritos como .tmp e só ganham o nome final depois do commit;
+# a leitura ignora .tmp. O marcador "limite" (data até onde o arquivo vai) é
+# regravado a cada execução e avisa o servidor para descartar os caches.
+#
+# Leitura sem date_from fica só na janela quente (a recente; é o que o dashboard
+# pede), inclusive no /timeseries (janela_padrao). Se date_from é anterior ao
+# limite, só as partições do período são lidas, com projeção de colunas e filtros
+# empurrados para o Parquet. A fatia vai para uma tabela temporária da conexão e
+# uma view temporária "price_history" (tabela quente UNION ALL fatia) encobre a
+# tabela: as consultas não mudam.
+# Requer pyarrow (opcional enquanto nada for arquivado).
+
+ARQUIVO_HORIZONTE_DIAS = int(os.getenv("ARQUIVO_HORIZONTE_DIAS", "365"))
+PASTA_ARQUIVO = os.getenv("TIREFORCE_ARQUIVO", os.path.splitext(db_path)[0] + "_arquivo")
+TAMANHO_LOTE_ARQUIVO = 100000  # linhas por leitura do SQLite e por row group do Parquet
+MARCADOR_LIMITE = os.path.join(PASTA_ARQUIVO, "limite")
+
+COLUNAS = [coluna.name for coluna in PriceHistory.__table__.columns]
+# A impressão digital fica no Parquet, mas a leitura não precisa dela
+COLUNAS_LEITURA = [nome for nome in COLUNAS if nome != "fingerprint"]
+
+class ErroArquivo(Exception):
+    pass
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ErroArquivo("pyarrow não instalado (pip install pyarrow): necessário para o arquivo Parquet")
+    return pyarrow
+
+def _esquema(pa):
+    tipos = {"id": pa.int64(), "product_id": pa.int64(), "date_collected": pa.timestamp("us"),
+             "price": pa.float64(), "mkp": pa.float64(), "sell_in": pa.float64()}
+    return pa.schema([(nome, tipos.get(nome, pa.string())) for nome in COLUNAS])
+
+def particoes(inicio=None, fim=None):
+    # Arquivos das partições mensais que cruzam [inicio, fim] (date, inclusivos)
+    if not os.path.isdir(PASTA_ARQUIVO):
+        return []
+    arquivos = []
+    for nome in sorted(os.listdir(PASTA_ARQUIVO)):
+        if not nome.startswith("mes="):
+            continue
+        mes = datetime.strptime(nome[4:], "%Y-%m").date()
+        proximo = (mes + timedelta(days=32)).replace(day=1)
+        if (fim and mes > fim) or (inicio and proximo <= inicio):
+            continue
+        # *.parquet não pega os .parquet.tmp de um arquivamento em andamento ou interrompido
+        arquivos += sorted(glob.glob(os.path.join(PASTA_ARQUIVO, nome, "*.parquet")))
+    return arquivos
+
+def limite_arquivo():
+    # Data (exclusiva) até onde vão as linhas arquivadas; None sem marcador
+    try:
+        with open(MARCADOR_LIMITE) as marcador:
+            return date.fromisoformat(marcador.read().strip())
+    except FileNotFoundError:
+        return None
+
+def versao_arquivo():
+    # Muda a cada arquivamento concluído (o marcador é regravado); None sem arquivo
+    try:
+        return os.stat(MARCADOR_LIMITE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _gravar_limite(limite):
+    anterior = limite_arquivo()
+    temporario = MARCADOR_LIMITE + ".tmp"
+    with open(temporario, "w") as marcador:
+        marcador.write(max(limite, anterior or limite).isoformat())
+    os.replace(temporario, MARCADOR_LIMITE)
+
+# --- ARQUIVAMENTO ---
+
+def _recuperar_temporarios(conn, pa):
+    # .tmp de uma execução interrompida. Se a primeira linha dele ainda está no SQLite,
+    # o commit não aconteceu (descarta); senão as linhas só existem ali (publica).
+    # Devolve [(temporário, final, limite)]
+    recuperados = []
+    for temporario in sorted(glob.glob(os.path.join(PASTA_ARQUIVO, "mes=*", "*.parquet.tmp"))):
+        try:
+            tabela = pa.parquet.read_table(temporario, columns=["id", "date_collected"])
+        except (pa.ArrowInvalid, OSError):
+            tabela = None  # escrita interrompida: foi antes do commit
+        if tabela is None or not len(tabela) or conn.execute(
+            select(PriceHistory.id).where(PriceHistory.id == tabela.column("id")[0].as_py())
+        ).first():
+            os.remove(temporario)
+            continue
+        ultimo = tabela.column("date_collected").to_pandas().max()
+        recuperados.append((temporario, temporario[:-len(".tmp")], ultimo.date() + timedelta(days=1)))
+    return recuperados
+
+def _contar_facetas_do_arquivo(conn, pa):
+    # Arquivo gravado antes do archived_facets existir: conta uma vez a partir do Parquet.
+    # Devolve (contagens, limite); o limite serve a arquivo sem marcador (ainda mais antigo)
+    arquivos = particoes()
+    if not arquivos or conn.execute(select(ArchivedFacet.faceta).limit(1)).first():
+        return [], None
+    quadro = pa.dataset.dataset(arquivos, format="parquet", schema=_esquema(pa))\
+        .to_table(columns=["product_id", "competitor", "competitor_brand", "date_collected"]).to_pandas()
+    limite = quadro["date_collected"].max().date() + timedelta(days=1) if len(quadro) else None
+    produtos = pd.DataFrame(
+        conn.execute(select(Product.id, Product.marca_interna, Product.width)).all(), columns=["product_id", "marca_interna", "width"]
+    )
+    quadro = quadro.merge(produtos, on="product_id", how="left")
+    colunas = {"competitors_list": "competitor", "brands_list": "marca_interna",
+               "concorrente_brands_list": "competitor_brand", "measures_list": "width"}
+    return [
+        {"faceta": faceta, "valor": valor, "n": int(n)}
+        for faceta, coluna in colunas.items()
+        for valor, n in quadro[coluna].value_counts().items() if valor
+    ], limite
+
+def arquivar(horizonte_dias=ARQUIVO_HORIZONTE_DIAS):
+    # Move para o Parquet as linhas com date_collected anterior a hoje - horizonte_dias
+    pa = _pyarrow()
+    esquema = _esquema(pa)
+    limite = date.today() - timedelta(days=horizonte_dias)
+    parametros = {"corte": datetime.combine(limite, time.min).strftime(FORMATO_DATA_IMPRESSAO)}
+    # A linha de maior id nunca sai: o SQLite reaproveitaria ids a partir do maior restante.
+    # O preço mais recente de cada chave (price_latest) também fica: "latest=true" não lê o arquivo
+    condicao = (
+        "date_collected < :corte AND id < (SELECT max(id) FROM price_history) "
+        f"AND id NOT IN (SELECT price_id FROM {PriceLatest.__tablename__})"
+    )
+    # Microssegundos + sufixo aleatório: duas execuções no mesmo segundo não escrevem no mesmo arquivo
+    carimbo = f"{datetime.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    arquivos = []  # (temporário, final)
+    total = 0
+    garantir_indice_busca()  # antes da transação (ver IngestaoPrecos.__init__)
+
+    with trava_escrita:
+        try:
+            with engine.begin() as conn:
+                recuperados = _recuperar_temporarios(conn, pa)
+                contagens, limite_antigo = _contar_facetas_do_arquivo(conn, pa)
+                resultado = conn.exec_driver_sql(
+                    f"SELECT {', '.join(COLUNAS)} FROM price_history WHERE {condicao} ORDER BY date_collected, id", parametros
+                )
+                escritor, mes_atual = None, None
+                # Ordenado por data: cada mês chega inteiro, um arquivo aberto por vez
+                while lote := resultado.cursor.fetchmany(TAMANHO_LOTE_ARQUIVO):
+                    quadro = pd.DataFrame(lote, columns=COLUNAS)
+                    quadro["date_collected"] = pd.to_datetime(quadro["date_collected"], format="ISO8601")
+                    for mes, parte in quadro.groupby(quadro["date_collected"].dt.strftime("%Y-%m"), sort=False):
+                        if mes != mes_atual:
+                            if escritor:
+                                escritor.close()
+                            pasta = os.path.join(PASTA_ARQUIVO, f"mes={mes}")
+                            os.makedirs(pasta, exist_ok=True)
+                            final = os.path.join(pasta, f"parte-{carimbo}.parquet")
+                            arquivos.append((final + ".tmp", final))
+                            escritor = pa.parquet.ParquetWriter(final + ".tmp", esquema, compression="zstd")
+                            mes_atual = mes
+                        escritor.write_table(pa.Table.from_pandas(parte, schema=esquema, preserve_index=False))
+                    total += len(lote)
+                resultado.close()
+                if escritor:
+                    escritor.close()
+
+                if total:
+                    arquivadas = PriceHistory.id.in_(text(f"SELECT id FROM price_history WHERE {condicao}").bindparams(**parametros))
+                    contagens += [
+                        {"faceta": faceta, "valor": valor, "n": n}
+                        for faceta, valor, n in conn.execute(consulta_contagens(arquivadas)) if valor
+                    ]
+                if contagens:
+                    comando = sqlite_insert(ArchivedFacet)
+                    conn.execute(comando.on_conflict_do_update(
+                        index_elements=["faceta", "valor"], set_={"n": ArchivedFacet.n + comando.excluded.n}
+                    ), contagens)
+                if total:
+                    nova_versao_dados(conn)
+                    conn.exec_driver_sql(
+                        f"INSERT OR IGNORE INTO {ArchivedFingerprint.__tablename__}(fingerprint) "
+                        f"SELECT fingerprint FROM price_history WHERE {condicao} AND fingerprint IS NOT NULL", parametros
+                    )
+                    if garantir_indice_busca():
+                        conn.exec_driver_sql(f"DELETE FROM {TABELA_BUSCA} WHERE rowid IN (SELECT id FROM price_history WHERE {condicao})", parametros)
+                    conn.exec_driver_sql(f"DELETE FROM price_history WHERE {condicao}", parametros)
+                    # O /price-gap sem date_from lê só a tabela quente (ver alcanca_arquivo)
+                    reconstruir_gap(conn)
+        except BaseException:
+            for temporario, _ in arquivos:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+            raise
+
+        # Só depois do commit: antes dele um leitor veria as mesmas linhas no SQLite e no
+        # Parquet (e guardaria a contagem dobrada no cache). Se cair aqui, a próxima
+        # execução publica os .tmp
+        for temporario, final, _ in recuperados:
+            os.replace(temporario, final)
+        for temporario, final in arquivos:
+            os.replace(temporario, final)
+        limites = [limite_recuperado for _, _, limite_recuperado in recuperados] + ([limite] if total else [])
+        if contagens and (limite_arquivo() or limite_antigo):
+            # Facetas recém-contadas também regravam o marcador (mesmo limite, ou o do Parquet)
+            limites.append(limite_arquivo() or limite_antigo)
+        if limites:
+            # O marcador regravado muda a versão dos dados (cache de respostas) e avisa
+            # as facetas de todo processo (ver main.acompanhar_dados)
+            _gravar_limite(max(limites))
+            cache_facetas.invalidar()
+    return total
+
+# --- LEITURA (fatia do arquivo encobrindo o price_history) ---
+
+def _filtro_parquet(ds, db, filtros, periodo):
+    # Mesmos filtros de consultas.aplicar_filtros, como expressão do pyarrow.dataset
+    region, origin, marcas, aros, concorrentes, marcas_concorrentes, _ = normalizar_filtros(*filtros)
+    condicoes = []
+    if periodo:
+        inicio, fim = limites_periodo(periodo)
+        if inicio:
+            condicoes.append(ds.field("date_collected") >= inicio)
+        if fim:
+            condicoes.append(ds.field("date_collected") < fim)
+    if region:
+        condicoes.append(ds.field("region") == region)
+    if origin:
+        condicoes.append(ds.field("origin") == origin)
+    if concorrentes:
+        condicoes.append(ds.field("competitor").isin(list(concorrentes)))
+    if marcas_concorrentes:
+        condicoes.append(ds.field("competitor_brand").isin(list(marcas_concorrentes)))
+    if marcas or aros:
+        # Marca interna e aro estão no produto: vira lista de product_id
+        query = db.query(Product.id)
+        if marcas:
+            query = query.filter(Product.marca_interna.in_(marcas))
+        if aros:
+            query = query.filter(Product.rim.in_(aros))
+        condicoes.append(ds.field("product_id").isin([id_ for id_, in query]))
+    filtro = None
+    for condicao in condicoes:
+        filtro = condicao if filtro is None else filtro & condicao
+    return filtro
+
+def _casa_busca(db, quadro, search):
+    # Mesma semântica do índice FTS (substring sem acento nos 8 campos de busca.py)
+    termo = sem_acento(search.strip())
+    contem = lambda valor: valor is not None and termo in sem_acento(valor)
+    produtos = db.execute(select(
+        Product.id, Product.name, Product.marca_interna, Product.marca_concorrente, Product.width, Product.rim
+    )).all()
+    ids = [id_ for id_, *campos in produtos if any(contem(campo) for campo in campos)]
+    mascara = quadro["product_id"].isin(ids)
+    for coluna in ("competitor", "city", "competitor_brand"):
+        # Testa cada valor distinto uma vez
+        mascara |= quadro[coluna].isin([valor for valor in quadro[coluna].dropna().unique() if contem(valor)])
+    return mascara
+
+def ler_arquivo(db, filtros, periodo=None):
+    # DataFrame com as linhas arquivadas que os filtros/período pedem (None = não alcança o arquivo)
+    inicio, fim = periodo or (None, None)
+    arquivos = particoes(inicio, fim)
+    if not arquivos:
+        return None
+    pa = _pyarrow()
+    tabela = pa.dataset.dataset(arquivos, format="parquet", schema=_esquema(pa))\
+        .to_table(columns=COLUNAS_LEITURA, filter=_filtro_parquet(pa.dataset, db, filtros, periodo))
+    quadro = tabela.to_pandas()
+    if filtros[-1] and len(quadro):
+        quadro = quadro[_casa_busca(db, quadro, filtros[-1])]
+    return quadro
+
+def _conexao_bruta(db):
+    return db.connection().connection.driver_connection
+
+def _carregar(db, quadro):
+    bruta = _conexao_bruta(db)
+    tipos = {linha[1]: linha[2] for linha in bruta.execute("PRAGMA main.table_info(price_history)")}
+    colunas = ", ".join(COLUNAS)
+    quadro = quadro.assign(
+        date_collected=quadro["date_collected"].dt.strftime(FORMATO_DATA_IMPRESSAO), fingerprint=None
+    )[COLUNAS].astype(object)
+    quadro = quadro.where(quadro.notna(), None)
+    # Conexão de leitura é query_only; objetos temporários não tocam o arquivo do banco
+    bruta.execute("PRAGMA query_only = OFF")
+    try:
+        bruta.execute(f"CREATE TEMP TABLE {TABELA_ARQUIVO_CARREGADO} ({', '.join(f'{nome} {tipos[nome]}' for nome in COLUNAS)})")
+        bruta.executemany(
+            f"INSERT INTO temp.{TABELA_ARQUIVO_CARREGADO} VALUES ({', '.join('?' * len(COLUNAS))})",
+            quadro.itertuples(index=False, name=None)
+        )
+        bruta.execute(
+            f"CREATE TEMP VIEW price_history AS SELECT {colunas} FROM main.price_history "
+            f"UNION ALL SELECT {colunas} FROM temp.{TABELA_ARQUIVO_CARREGADO}"
+        )
+        bruta.commit()
+    except BaseException:
+        bruta.rollback()
+        _descarregar(db)
+        raise
+    finally:
+        bruta.execute("PRAGMA query_only = ON")
+
+def _descarregar(db):
+    # A conexão volta para o pool sem a view (senão a próxima requisição veria a fatia)
+    bruta = _conexao_bruta(db)
+    bruta.execute("PRAGMA query_only = OFF")
+    try:
+        bruta.execute("DROP VIEW IF EXISTS temp.price_history")
+        bruta.execute(f"DROP TABLE IF EXISTS temp.{TABELA_ARQUIVO_CARREGADO}")
+        bruta.commit()
+    finally:
+        bruta.execute("PRAGMA query_only = ON")
+
+def alcanca_arquivo(periodo):
+    # Só um date_from anterior ao limite do arquivo lê o Parquet; sem date_from a
+    # leitura fica na janela quente. Sem marcador (arquivo anterior a ele) decidem as partições
+    inicio = periodo[0] if periodo else None
+    if not inicio:
+        return False
+    limite = limite_arquivo()
+    return limite is None or inicio < limite
+
+def janela_padrao(periodo):
+    # Sem date_from = janela quente, também para quem lê o price_daily (que guarda a
+    # história inteira): /timeseries com e sem "search" devolvem o mesmo período
+    inicio, fim = periodo or (None, None)
+    limite = limite_arquivo()
+    if inicio or limite is None:
+        return periodo
+    return (limite, fim)
+
+@contextmanager
+def historico_completo(db, filtros, periodo=None, ultimos=False):
+    # Dentro do bloco, price_history nesta sessão = tabela quente + fatia do arquivo.
+    # filtros: (region, brand, rim, competitor, competitor_brand, origin, search)
+    # ultimos: só preços mais recentes, que nunca são arquivados; nada a carregar
+    if ultimos or not alcanca_arquivo(periodo):
+        yield 0
+        return
+    with etapa("arquivo"):
+        quadro = ler_arquivo(db, filtros, periodo)
+        if quadro is not None and len(quadro):
+            _carregar(db, quadro)
+    if quadro is None or not len(quadro):
+        yield 0
+        return
+    token = arquivo_carregado.set(True)
+    try:
+        yield len(quadro)
+    finally:
+        try:
+            arquivo_carregado.reset(token)
+        except ValueError:
+            # Gerador (ex.: /export) retomado em outro contexto pelo threadpool
+            arquivo_carregado.set(False)
+        _descarregar(db)
+
+def impressoes_arquivadas(db, chaves, lote=900):
+    # Subconjunto de chaves que já foi para o arquivo
+    encontradas = set()
+    for inicio in range(0, len(chaves), lote):
+        consulta = select(ArchivedFingerprint.fingerprint).where(ArchivedFingerprint.fingerprint.in_(chaves[inicio:inicio + lote]))
+        encontradas.update(db.execute(consulta).scalars())
+    return encontradas
+
+def tem_arquivo(db):
+    return db.execute(select(ArchivedFingerprint.fingerprint).limit(1)).first() is not None
+
+if __name__ == "__main__":
+    # Uso: python arquivamento.py [--dias 365] [--vacuum]   (ex.: num cron noturno)
+    parser = argparse.ArgumentParser(description="Move o histórico antigo de preços para Parquet")
+    parser.add_argument("--dias", type=int, default=ARQUIVO_HORIZONTE_DIAS, help="mantém no SQLite só os últimos N dias")
+    parser.add_argument("--vacuum", action="store_true", help="devolve ao disco o espaço liberado (bloqueia o banco enquanto roda)")
+    args = parser.parse_args()
+    movidas = arquivar(args.dias)
+    print(f"{movidas} linhas arquivadas em {PASTA_ARQUIVO}")
+    if movidas and args.vacuum:
+        # Fora de transação (o evento "begin" do engine abriria um BEGIN IMMEDIATE)
+        bruta = engine.raw_connection()
+        try:
+            bruta.driver_connection.execute("VACUUM")
+        finally:
+            bruta.close()
+        print("VACUUM concluído.")
@@ -0,0 +1,147 @@
+# Benchmark de regressão do /analytics e do /price-gap: mede a latência com o
+# price_history crescendo e calcula o expoente de crescimento (tempo ~ linhas^k).
+# O histórico cresce como na produção, com dias novos (LINHAS_POR_DIA), e cada filtro
+# do /analytics lê a janela dos últimos JANELA_DIAS dias por índice (price_daily.day,
+# concorrente, região); o custo deve acompanhar a janela, não o tamanho do histórico.
+# O /price-gap sem filtro por linha (tudo, só marca interna/aro) lê o price_gap, uma
+# linha por célula: o custo acompanha o número de medidas. O "search" fica de fora:
+# filtra coleta a coleta pelo índice de busca e cresce com o histórico.
+# Uso: python bench_analytics.py [10000 50000 100000 200000]
+import os
+import sys
+import math
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+
+FILTROS = [
+    {},
+    {"brand": "BARUM"},
+    {"rim": "15,16", "region": "NO"},
+    {"competitor": "Caiado Pneus,Pmz Distribuidora"},
+    {"competitor_brand": "GOODYEAR", "origin": "NACIONAL"},
+]
+FILTROS_GAP = [
+    {},
+    {"brand": "BARUM", "rim": "15,16"},
+]
+LINHAS_POR_DIA = 200
+JANELA_DIAS = 30
+REPETICOES = 5
+EXPOENTE_MAXIMO = 0.8  # sub-linear com folga; uma varredura completa simples fica perto de 1.0
+
+CIDADES = [("Manaus", "NO"), ("Cuiabá - MT", "CO"), ("São Paulo - SP", "SE")]
+INICIO = datetime(2024, 1, 1)
+
+def catalogo():
+    # Mesmos produtos em todas as faixas (semente fixa)
+    rng = random.Random(0)
+    produtos = []
+    for marca in ["BARUM", "CONTINENTAL"]:
+        for modelo in ["5HM", "CONTICROSS", "POWERCONTACT"]:
+            for largura in [165, 175, 185, 195, 205, 215, 225]:
+                for perfil in [55, 60, 65, 70]:
+                    produtos.append({
+                        "marca_interna": marca, "modelo_interno": modelo, "medida": f"{largura}/{perfil}",
+                        "aro": rng.choice(["13", "14", "15", "16", "17"]),
+                        "marca_concorrente": rng.choice(["FIRESTONE", "GOODYEAR", "PIRELLI"]),
+                    })
+    return produtos
+
+def popular(db, alvo, IngestaoPrecos, PriceHistory):
+    # Completa o banco até "alvo" linhas de price_history pelo mesmo caminho da
+    # importação: impressões digitais, índice de busca, resumo diário e último
+    # preço ficam em dia a cada faixa (senão a busca mediria um índice velho)
+    rng = random.Random(alvo)
+    atual = db.query(PriceHistory).count()
+    if alvo <= atual:
+        return
+    produtos = catalogo()
+    linhas = []
+    for i in range(atual, alvo):
+        produto = rng.choice(produtos)
+        linhas.append({
+            **produto,
+            "marca_concorrente": rng.choice(["FIRESTONE", "GOODYEAR", "PIRELLI", "MICHELIN", "BRIDGESTONE"]),
+            "modelo_concorrente": rng.choice(["F700", "EDGE", "P7", "PRIMACY"]),
+            "competitor": rng.choice(["Caiado Pneus", "Pmz Distribuidora", "Jl Pneus", "Roda Forte", "Pneu Center"]),
+            "data": INICIO + timedelta(days=i // LINHAS_POR_DIA, seconds=rng.randint(0, 86399)),
+            "origem": rng.choice(["NACIONAL", "IMPORTADO"]),
+            "preco": round(rng.uniform(250, 900), 2), "sell_in": round(rng.uniform(200, 600), 2),
+            "mkp": round(rng.uniform(0, 0.8), 3), "cidade": rng.randrange(len(CIDADES)),
+        })
+    quadro = pd.DataFrame(linhas)
+    quadro["unique_code"] = (quadro["marca_interna"] + "-" + quadro["modelo_interno"] + "-" + quadro["medida"]).str.replace("/", "", regex=False)
+    for indice, limpo in quadro.groupby("cidade"):
+        ingestao = IngestaoPrecos(db, *CIDADES[indice])
+        ingestao.gravar(limpo.drop(columns="cidade"))
+        ingestao.concluir()
+
+def janela(n):
+    # Últimos JANELA_DIAS dias com coleta quando o histórico tem n linhas
+    fim = (INICIO + timedelta(days=(n - 1) // LINHAS_POR_DIA)).date()
+    return (fim - timedelta(days=JANELA_DIAS - 1), fim)
+
+def medir(db, calcular, filtros, periodo):
+    # Mede o cálculo direto (sem passar pelo cache de respostas do endpoint)
+    tempos = []
+    brutos = tuple(filtros.get(k) for k in ("region", "brand", "rim", "competitor", "competitor_brand", "origin", "search"))
+    for _ in range(REPETICOES):
+        t = time.perf_counter()
+        calcular(db, brutos, periodo)
+        tempos.append(time.perf_counter() - t)
+    return sorted(tempos)[len(tempos) // 2]
+
+def main(tamanhos):
+    pasta = tempfile.mkdtemp(prefix="bench_analytics_")
+    os.environ["TIREFORCE_DB"] = os.path.join(pasta, "bench.db")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from database import SessionLocal, Product, PriceHistory
+    from ingest import IngestaoPrecos
+    from consultas import aplicar_filtros, calcular_indicadores, calcular_indicadores_diarios, calcular_gap_resumido
+
+    def get_analytics(db, brutos, periodo):
+        # Mesmo caminho do endpoint: resumo diário sem "search", price_history com ele
+        if not brutos[-1]:
+            return calcular_indicadores_diarios(db, brutos, periodo)
+        query = aplicar_filtros(db.query(PriceHistory).join(Product), *brutos, periodo=periodo)
+        return calcular_indicadores(db, query)
+
+    def get_price_gap(db, brutos, periodo):
+        # Caminho do endpoint sem filtro por linha nem período: matriz pronta do price_gap
+        return calcular_gap_resumido(db, brutos[1], brutos[2])
+
+    cenarios = [("analytics", get_analytics, f) for f in FILTROS] + [("price-gap", get_price_gap, f) for f in FILTROS_GAP]
+
+    # Estruturas auxiliares antes da primeira transação de escrita (ver IngestaoPrecos.__init__)
+    from busca import garantir_indice_busca
+    from historico import garantir_resumo_diario
+    from ultimos_precos import garantir_ultimos_precos
+    from gap_precos import garantir_gap
+    garantir_indice_busca()
+    garantir_resumo_diario()
+    garantir_ultimos_precos()
+    garantir_gap()
+
+    db = SessionLocal()
+    resultados = {}
+    for n in tamanhos:
+        popular(db, n, IngestaoPrecos, PriceHistory)
+        resultados[n] = {i: medir(db, calcular, f, janela(n)) for i, (_, calcular, f) in enumerate(cenarios)}
+        print(f"{n:>9} linhas: " + "  ".join(f"f{i}={t * 1000:7.1f}ms" for i, t in resultados[n].items()))
+    db.close()
+
+    falhou = False
+    menor, maior = tamanhos[0], tamanhos[-1]
+    for i, (rota, _, filtros) in enumerate(cenarios):
+        k = math.log(resultados[maior][i] / resultados[menor][i]) / math.log(maior / menor)
+        status = "OK" if k <= EXPOENTE_MAXIMO else "REGRESSÃO"
+        falhou |= k > EXPOENTE_MAXIMO
+        print(f"f{i} /{rota} {filtros or 'sem filtro'}: expoente {k:.2f} [{status}]")
+    return 1 if falhou else 0
+
+if __name__ == "__main__":
+    tamanhos = sorted(int(x) for x in sys.argv[1:]) or [10000, 50000, 100000, 200000]
+    sys.exit(main(tamanhos))
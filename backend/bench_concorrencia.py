@@ -0,0 +1,90 @@
+# Teste de carga: latência das leituras do dashboard enquanto uma importação
+# grande (100k linhas por padrão) roda na fila. Mede antes e durante a importação
+# e conta erros "database is locked".
+# Uso: python bench_concorrencia.py [linhas] [leitores]
+#      SQLITE_JOURNAL_MODE=DELETE python bench_concorrencia.py  (compara sem WAL)
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from gerar_planilha import gerar_planilha
+
+LINHAS_BASE = 10000
+SEGUNDOS_BASE = 3.0
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def main(linhas, leitores):
+    pasta = tempfile.mkdtemp(prefix="bench_concorrencia_")
+    os.environ["TIREFORCE_DB"] = os.path.join(pasta, "bench.db")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from database import SessionLeitura, SessionLocal, Product, PriceHistory, SQLITE_JOURNAL_MODE
+    from consultas import aplicar_filtros, interpretar_ordem, escolher_campos, paginar, calcular_indicadores
+    from historico import calcular_serie
+    from ingest import importar_planilha
+    from jobs import fila_importacao
+
+    # Carga inicial para as leituras terem o que devolver
+    base = os.path.join(pasta, "base_manaus.csv")
+    gerar_planilha(base, LINHAS_BASE, 1)
+    with SessionLocal() as db:
+        importar_planilha(db, base, os.path.basename(base))
+
+    def ler(db):
+        query = aplicar_filtros(db.query(PriceHistory).join(Product), "NO", None, None, None, None, None, None)
+        paginar(query, escolher_campos(None), interpretar_ordem(None), 100)
+        calcular_indicadores(db, query)
+        calcular_serie(db, ("NO", None, None, None, None, None, None), "week")
+
+    medicoes = {"antes": [], "durante": []}
+    erros = []
+    fase = {"atual": "antes", "parar": False}
+
+    def leitor():
+        while not fase["parar"]:
+            atual = fase["atual"]
+            db = SessionLeitura()
+            t = time.perf_counter()
+            try:
+                ler(db)
+                medicoes[atual].append(time.perf_counter() - t)
+            except Exception as e:
+                erros.append(f"{atual}: {e}")
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=leitor, daemon=True) for _ in range(leitores)]
+    for thread in threads:
+        thread.start()
+    time.sleep(SEGUNDOS_BASE)
+
+    grande = os.path.join(pasta, "carga_manaus.csv")
+    gerar_planilha(grande, linhas, 2)
+    fase["atual"] = "durante"
+    inicio = time.perf_counter()
+    job = fila_importacao.enviar(grande, os.path.basename(grande), linhas)
+    while job.status not in ("concluido", "erro"):
+        time.sleep(0.05)
+    duracao = time.perf_counter() - inicio
+    fase["parar"] = True
+    for thread in threads:
+        thread.join()
+
+    print(f"journal_mode={SQLITE_JOURNAL_MODE}  leitores={leitores}")
+    print(f"importação: {job.status} - {job.mensagem} em {duracao:.1f}s ({job.inseridas / duracao:,.0f} linhas/s)")
+    for nome, tempos in medicoes.items():
+        print(f"leituras {nome:>7}: n={len(tempos):5d}  p50={percentil(tempos, 0.5) * 1000:7.1f}ms  "
+              f"p95={percentil(tempos, 0.95) * 1000:7.1f}ms  max={max(tempos, default=0) * 1000:7.1f}ms")
+    print(f"erros: {len(erros)}" + (f" (ex.: {erros[0]})" if erros else ""))
+    return 1 if erros or job.status != "concluido" else 0
+
+if __name__ == "__main__":
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    leitores = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    sys.exit(main(linhas, leitores))
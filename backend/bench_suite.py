@@ -0,0 +1,228 @@
+# Suíte de benchmark: para cada tamanho gera (uma vez) uma planilha sintética com
+# gerar_planilha.py, importa num banco descartável pelo mesmo caminho do /upload e
+# mede as rotas de leitura em várias combinações de filtro, sem cache de respostas.
+# Grava linhas/s da importação, p50/p95 das leituras e pico de memória (RSS) num
+# JSON por commit, para comparar uma versão com a outra.
+# Uso: python bench_suite.py                                 (10k, 100k e 1m em CSV)
+#      python bench_suite.py --tamanhos 10k 100k --formato xlsx --repeticoes 5
+#      python bench_suite.py --comparar bench_resultados/abc1234.json
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from gerar_planilha import gerar_planilha, TAMANHOS
+from bench_concorrencia import percentil
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+
+# Combinações de filtro (valores existentes na planilha sintética)
+FILTROS = {
+    "sem_filtro": {},
+    "regiao": {"region": "NO"},
+    "marca_aro": {"brand": "CONTINENTAL", "rim": "15,16"},
+    "concorrente": {"competitor": "Caiado Pneus", "competitor_brand": "PIRELLI,MICHELIN"},
+    "busca": {"search": "powercontact"},
+}
+
+# Rota -> parâmetros fixos; None = rota sem filtros
+ROTAS = [
+    ("/dashboard-data", {"limit": 100}),
+    ("/dashboard-data", {"limit": 5000, "format": "columnar"}),
+    ("/summary", {}),
+    ("/analytics", {}),
+    ("/timeseries", {"bucket": "week"}),
+    ("/timeseries", {"bucket": "month", "group_by": "marca_concorrente"}),
+    ("/price-gap", {}),
+    ("/facets", None),
+]
+
+def pico_rss_mb():
+    # Pico de memória do processo (ru_maxrss: KB no Linux, bytes no macOS)
+    try:
+        import resource
+    except ImportError:
+        return _pico_rss_windows()
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _pico_rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class Contadores(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (nome, ctypes.c_size_t) for nome in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+            )
+        ]
+
+    contadores = Contadores(cb=ctypes.sizeof(Contadores))
+    processo = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(processo, ctypes.byref(contadores), contadores.cb):
+        return None
+    return round(contadores.PeakWorkingSetSize / (1024 * 1024), 1)
+
+def versao_codigo():
+    # Commit atual (+ "-sujo" com alterações não commitadas) para nomear o resultado
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PASTA, capture_output=True, text=True, check=True).stdout.strip()
+        sujo = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PASTA, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "sem-git"
+    return commit + ("-sujo" if sujo else "")
+
+def preparar_planilha(pasta, linhas, formato, semente):
+    # Mesma semente = mesmo arquivo; reaproveitado entre execuções
+    caminho = os.path.join(pasta, f"coleta_manaus_{linhas}_{semente}.{formato}")
+    if not os.path.exists(caminho):
+        print(f"  gerando {os.path.basename(caminho)}...", file=sys.stderr)
+        parcial = caminho + ".parcial." + formato
+        gerar_planilha(parcial, linhas, semente)
+        os.replace(parcial, caminho)
+    return caminho
+
+def rodada(planilha, repeticoes):
+    # Roda num processo próprio: banco (TIREFORCE_DB) e pico de RSS são só deste tamanho
+    from fastapi import UploadFile
+    from fastapi.testclient import TestClient
+    import main
+    from database import SessionLeitura, db_path
+    from jobs import fila_importacao
+
+    resultado = {"planilha_mb": round(os.path.getsize(planilha) / (1024 * 1024), 1)}
+    inicio = time.perf_counter()
+    with open(planilha, "rb") as arquivo, SessionLeitura() as db:
+        resposta = main.upload_file(UploadFile(arquivo, filename=os.path.basename(planilha)), "skip", db)
+    job = fila_importacao.obter(resposta["job_id"])
+    while job.status not in ("concluido", "erro"):
+        time.sleep(0.05)
+    duracao = time.perf_counter() - inicio
+    resultado["ingestao"] = {
+        "status": job.status,
+        "segundos": round(duracao, 2),
+        "inseridas": job.inseridas,
+        "linhas_por_segundo": round(job.inseridas / duracao, 1) if duracao else 0.0,
+    }
+    resultado["pico_rss_mb_ingestao"] = pico_rss_mb()
+    resultado["banco_mb"] = round(os.path.getsize(db_path) / (1024 * 1024), 1)
+    print(f"  importação: {job.status} - {job.inseridas} linhas em {duracao:.1f}s", file=sys.stderr)
+
+    cliente = TestClient(main.app)
+    leituras = []
+    for rota, fixos in ROTAS:
+        filtros = {"-": {}} if fixos is None else FILTROS
+        rotulo = rota + ("?" + "&".join(f"{k}={v}" for k, v in fixos.items()) if fixos else "")
+        for nome, filtro in filtros.items():
+            tempos, erros, tamanho = [], 0, 0
+            for _ in range(repeticoes):
+                t = time.perf_counter()
+                r = cliente.get(rota, params={**filtro, **(fixos or {})})
+                tempos.append(time.perf_counter() - t)
+                erros += r.status_code != 200
+                tamanho = len(r.content)
+            leituras.append({
+                "rota": rotulo, "filtro": nome, "n": len(tempos), "erros": erros, "bytes": tamanho,
+                "p50_ms": round(percentil(tempos, 0.5) * 1000, 1),
+                "p95_ms": round(percentil(tempos, 0.95) * 1000, 1),
+                "max_ms": round(max(tempos) * 1000, 1),
+            })
+            print(f"  {rotulo:<52} {nome:<12} p50={leituras[-1]['p50_ms']:8.1f}ms  p95={leituras[-1]['p95_ms']:8.1f}ms", file=sys.stderr)
+    resultado["leituras"] = leituras
+    resultado["pico_rss_mb"] = pico_rss_mb()
+    return resultado
+
+def comparar(anterior, atual):
+    # Diferença por (tamanho, formato): importação em linhas/s e leituras em p50
+    antigas = {(r["linhas"], r["formato"]): r for r in anterior["rodadas"]}
+    print(f"\ncomparação: {anterior['commit']} -> {atual['commit']}")
+    for rodada_atual in atual["rodadas"]:
+        base = antigas.get((rodada_atual["linhas"], rodada_atual["formato"]))
+        if not base:
+            continue
+        variacao = lambda antes, depois: f"{(depois / antes - 1) * 100:+6.1f}%" if antes else "   n/d"
+        antes, depois = base["ingestao"]["linhas_por_segundo"], rodada_atual["ingestao"]["linhas_por_segundo"]
+        print(f"{rodada_atual['linhas']} linhas ({rodada_atual['formato']}): importação {antes:,.0f} -> {depois:,.0f} linhas/s ({variacao(antes, depois)})")
+        print(f"  pico RSS {base['pico_rss_mb']} -> {rodada_atual['pico_rss_mb']} MB")
+        leituras = {(l["rota"], l["filtro"]): l for l in base["leituras"]}
+        for leitura in rodada_atual["leituras"]:
+            antiga = leituras.get((leitura["rota"], leitura["filtro"]))
+            if antiga:
+                print(f"  {leitura['rota']:<52} {leitura['filtro']:<12} p50 {antiga['p50_ms']:8.1f} -> {leitura['p50_ms']:8.1f}ms ({variacao(antiga['p50_ms'], leitura['p50_ms'])})")
+
+def main(args):
+    if args.rodada:
+        planilha, saida = args.rodada
+        with open(saida, "w", encoding="utf-8") as f:
+            json.dump(rodada(planilha, args.repeticoes), f)
+        return 0
+
+    os.makedirs(args.planilhas, exist_ok=True)
+    commit = versao_codigo()
+    resultados = {
+        "commit": commit,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeticoes": args.repeticoes,
+        "filtros": FILTROS,
+        "rodadas": [],
+    }
+    falhas = 0
+    for tamanho in args.tamanhos:
+        linhas = TAMANHOS.get(tamanho.lower()) or int(tamanho)
+        print(f"{linhas} linhas ({args.formato}):", file=sys.stderr)
+        inicio = time.perf_counter()
+        planilha = preparar_planilha(args.planilhas, linhas, args.formato, args.semente)
+        geracao = time.perf_counter() - inicio
+
+        pasta = tempfile.mkdtemp(prefix="bench_suite_")
+        saida = os.path.join(pasta, "rodada.json")
+        # Banco descartável e cache de respostas desligado: toda leitura vai ao banco
+        ambiente = {**os.environ, "TIREFORCE_DB": os.path.join(pasta, "bench.db"), "RESPONSE_CACHE_MB": "0"}
+        try:
+            processo = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--rodada", planilha, saida, "--repeticoes", str(args.repeticoes)],
+                env=ambiente, cwd=PASTA, stdout=subprocess.DEVNULL,
+            )
+            if processo.returncode != 0 or not os.path.exists(saida):
+                print(f"  falhou (código {processo.returncode})", file=sys.stderr)
+                falhas += 1
+                continue
+            with open(saida, encoding="utf-8") as f:
+                medicao = json.load(f)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+        falhas += medicao["ingestao"]["status"] != "concluido" or any(l["erros"] for l in medicao["leituras"])
+        resultados["rodadas"].append({"linhas": linhas, "formato": args.formato, "geracao_s": round(geracao, 2), **medicao})
+
+    destino = args.saida or os.path.join(PASTA, "bench_resultados", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"resultados -> {destino}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(json.load(f), resultados)
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de importação e rotas de leitura")
+    parser.add_argument("--tamanhos", nargs="+", default=["10k", "100k", "1m"], help="10k, 100k, 1m ou um número de linhas")
+    parser.add_argument("--formato", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--repeticoes", type=int, default=10, help="chamadas por rota e filtro")
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--planilhas", default=os.path.join(tempfile.gettempdir(), "tireforce_bench"), help="pasta das planilhas geradas (reaproveitadas)")
+    parser.add_argument("--saida", help="JSON de resultado (padrão: bench_resultados/<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--rodada", nargs=2, metavar=("PLANILHA", "SAIDA"), help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
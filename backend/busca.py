@@ -0,0 +1,86 @@
+from contextvars import ContextVar
+from sqlalchemy import text, or_
+from database import engine, sem_acento, Product, PriceHistory
+
+# --- ÍNDICE DE BUSCA (SQLite FTS5) ---
+# Uma linha por price_history (rowid = id) com os mesmos 8 campos que o filtro
+# "search" olhava via ILIKE '%termo%'. O tokenizador trigram mantém a semântica
+# de substring e o texto entra sem acento, então "cuiaba" acha "Cuiabá".
+
+TABELA_BUSCA = "busca_precos"
+MINIMO_TRIGRAMA = 3  # termos menores não geram trigramas; caem no ILIKE antigo
+
+COLUNAS_BUSCA = [
+    ("produto", "p.name"),
+    ("marca_interna", "p.marca_interna"),
+    ("marca_concorrente", "p.marca_concorrente"),
+    ("medida", "p.width"),
+    ("aro", "p.rim"),
+    ("concorrente", "ph.competitor"),
+    ("cidade", "ph.city"),
+    ("marca_concorrente_preco", "ph.competitor_brand"),
+]
+
+# Linhas do arquivo Parquet carregadas na conexão (arquivamento.py) não estão no
+# índice; já chegam filtradas pelo termo, então entram direto no resultado
+TABELA_ARQUIVO_CARREGADO = "price_history_arquivo"
+arquivo_carregado = ContextVar("arquivo_carregado", default=False)
+
+_disponivel = None
+
+def garantir_indice_busca():
+    # Cria (e popula na primeira vez) a tabela FTS; devolve False se o SQLite não tiver FTS5
+    global _disponivel
+    if _disponivel is not None:
+        return _disponivel
+    try:
+        with engine.begin() as conn:
+            existe = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :nome"), {"nome": TABELA_BUSCA}
+            ).first()
+            if not existe:
+                colunas = ", ".join(nome for nome, _ in COLUNAS_BUSCA)
+                conn.execute(text(f"CREATE VIRTUAL TABLE {TABELA_BUSCA} USING fts5({colunas}, tokenize='trigram')"))
+                _indexar(conn, 0)
+        _disponivel = True
+    except Exception as e:
+        print(f"Busca FTS5 indisponível, usando ILIKE: {e}")
+        _disponivel = False
+    return _disponivel
+
+def _indexar(conn, a_partir_de_id):
+    colunas = ", ".join(nome for nome, _ in COLUNAS_BUSCA)
+    valores = ", ".join(f"sem_acento({expr})" for _, expr in COLUNAS_BUSCA)
+    conn.execute(text(
+        f"INSERT INTO {TABELA_BUSCA}(rowid, {colunas}) "
+        f"SELECT ph.id, {valores} FROM price_history ph JOIN products p ON p.id = ph.product_id "
+        f"WHERE ph.id > :id"
+    ), {"id": a_partir_de_id})
+
+def indexar_novos(db, a_partir_de_id):
+    # Chamado pela ingestão, na mesma transação dos inserts
+    if garantir_indice_busca():
+        _indexar(db.connection(), a_partir_de_id)
+
+def filtro_busca(search):
+    termo = sem_acento(search.strip())
+    if len(termo) >= MINIMO_TRIGRAMA and garantir_indice_busca():
+        consulta = '"' + termo.replace('"', '""') + '"'
+        indice = PriceHistory.id.in_(
+            text(f"SELECT rowid FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH :consulta").bindparams(consulta=consulta)
+        )
+        if arquivo_carregado.get():
+            return or_(indice, PriceHistory.id.in_(text(f"SELECT id FROM temp.{TABELA_ARQUIVO_CARREGADO}")))
+        return indice
+
+    termo = f"%{search}%"
+    return or_(
+        Product.name.ilike(termo),
+        Product.marca_interna.ilike(termo),
+        Product.marca_concorrente.ilike(termo),
+        Product.width.ilike(termo),  # busca por medida
+        Product.rim.ilike(termo),
+        PriceHistory.competitor.ilike(termo),
+        PriceHistory.city.ilike(termo),
+        PriceHistory.competitor_brand.ilike(termo)
+    )
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import os
+import threading
+
+# --- CACHE DE RESPOSTAS DOS ENDPOINTS DE LEITURA ---
+# Guarda o corpo JSON já serializado (e comprimido, se for o caso), com chave =
+# (versão dos dados, endpoint, filtros normalizados, parâmetros extras). A versão
+# vem do banco (data_version, somada na transação da importação/arquivamento) e
+# do marcador do arquivo Parquet, lida por requisição: com vários workers do
+# uvicorn, todos percebem a importação feita por qualquer um deles.
+
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "64"))
+
+class CacheRespostas:
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.itens = OrderedDict()
+        self.bytes = 0
+        self.versao = None
+        self.hits = 0
+        self.misses = 0
+        self.descartes = 0
+        self.lock = threading.Lock()
+
+    def sincronizar(self, versao):
+        # Versão lida pela requisição; só anda para a frente (uma requisição que abriu
+        # a leitura antes da importação não volta o cache para a versão velha)
+        with self.lock:
+            if self.versao is None or versao > self.versao:
+                self.versao = versao
+                self.itens.clear()
+                self.bytes = 0
+
+    def obter(self, chave):
+        # Devolve (corpo, codificacao) ou None
+        with self.lock:
+            item = self.itens.get(chave)
+            if item is None:
+                self.misses += 1
+                return None
+            self.itens.move_to_end(chave)
+            self.hits += 1
+            return item
+
+    def guardar(self, chave, corpo, codificacao=None):
+        # Respostas grandes demais não entram (ocupariam o cache inteiro)
+        if len(corpo) > self.limite_bytes // 4 or chave[0] != self.versao:
+            return
+        with self.lock:
+            antigo = self.itens.pop(chave, None)
+            if antigo is not None:
+                self.bytes -= len(antigo[0])
+            self.itens[chave] = (corpo, codificacao)
+            self.bytes += len(corpo)
+            while self.bytes > self.limite_bytes:
+                _, (removido, _) = self.itens.popitem(last=False)
+                self.bytes -= len(removido)
+                self.descartes += 1
+
+    def estatisticas(self):
+        total = self.hits + self.misses
+        return {
+            "versao_dados": self.versao,
+            "entradas": len(self.itens),
+            "bytes": self.bytes,
+            "limite_bytes": self.limite_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "descartes": self.descartes,
+            "taxa_acerto": round(self.hits / total, 4) if total else 0.0,
+        }
+
+cache_respostas = CacheRespostas(int(RESPONSE_CACHE_MB * 1024 * 1024))
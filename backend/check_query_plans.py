@@ -0,0 +1,23 @@
+# Roda EXPLAIN QUERY PLAN na página padrão do /dashboard-data para as combinações de
+# filtro padrão e acusa varredura completa ou ordenação temporária (USE TEMP B-TREE).
+# Uso: python check_query_plans.py   (TIREFORCE_DB=... para outro banco)
+import sys
+from database import SessionLeitura
+from consultas import verificar_planos
+
+def main():
+    db = SessionLeitura()
+    problemas = 0
+    try:
+        for filtros, plano, varreduras, ordenacoes in verificar_planos(db):
+            status = [nome for nome, linhas in (("VARREDURA COMPLETA", varreduras), ("ORDENAÇÃO TEMPORÁRIA", ordenacoes)) if linhas]
+            print(f"[{', '.join(status) or 'OK'}] {filtros or 'sem filtro'}")
+            for linha in plano:
+                print(f"    {linha}")
+            problemas += bool(status)
+    finally:
+        db.close()
+    return 1 if problemas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# Confere que reenviar a mesma planilha não duplica o histórico, inclusive nas linhas
+# sem data legível (célula vazia, texto, data inválida ou planilha sem coluna Data).
+# Cada planilha vai uma vez e volta com um byte a mais (o hash do arquivo muda, então
+# só a impressão digital das linhas segura o reenvio), por /upload e por /upload/batch.
+# Uso: python check_reimportacao.py   (banco descartável; não toca no tireforce.db)
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+CABECALHO = "Medida;MARCA;MODELO;PREÇO SELL IN;Marca;Modelo;ORIGEM;Aro;Preco_Sell_Out;Empresa;{data}MKP"
+DATAS = ["2024-06-28", "", "sem data", "31/02/2024"]  # uma legível, três não
+
+def planilha(com_data):
+    cabecalho = CABECALHO.format(data="Data;" if com_data else "")
+    corpo = [
+        f"175/70;BARUM;5HM;250,00;PIRELLI;P7;NACIONAL;R15;{300 + i},90;Caiado Pneus;{data + ';' if com_data else ''}0,20"
+        for i, data in enumerate(DATAS)
+    ]
+    return "\n".join([cabecalho] + corpo) + "\n"
+
+def esperar(cliente, job_id):
+    while (estado := cliente.get(f"/upload/{job_id}").json())["status"] not in ("concluido", "erro"):
+        time.sleep(0.05)
+    return estado
+
+def main():
+    pasta = tempfile.mkdtemp(prefix="check_reimportacao_")
+    os.environ["TIREFORCE_DB"] = os.path.join(pasta, "check.db")
+    os.environ["RESPONSE_CACHE_MB"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from database import SessionLeitura, PriceHistory
+
+    cliente = TestClient(app_main.app)
+    problemas = 0
+    try:
+        for com_data in (True, False):
+            conteudo = planilha(com_data).encode("utf-8")
+            nome = f"coleta_manaus_{'com' if com_data else 'sem'}_data.csv"
+            resposta = cliente.post("/upload", files={"file": (nome, conteudo)}).json()
+            primeira = esperar(cliente, resposta["job_id"])
+            # Um byte a mais: outro sha256, mesmas linhas
+            resposta = cliente.post("/upload", files={"file": (nome, conteudo + b"\n")}).json()
+            segunda = esperar(cliente, resposta["job_id"])
+            resposta = cliente.post("/upload/batch", files=[("files", (nome, conteudo + b"\n\n"))]).json()
+            lote = esperar(cliente, resposta["job_id"])
+            for rotulo, estado, esperadas in (("primeiro envio", primeira, len(DATAS)),
+                                              ("reenvio /upload", segunda, 0),
+                                              ("reenvio /upload/batch", lote, 0)):
+                ok = estado["status"] == "concluido" and estado["inseridas"] == esperadas
+                problemas += not ok
+                print(f"[{'OK' if ok else 'FALHOU'}] {nome} {rotulo}: {estado['inseridas']} inseridas "
+                      f"(esperado {esperadas}), {estado['ignoradas']} ignoradas")
+        with SessionLeitura() as db:
+            total = db.query(PriceHistory).count()
+        ok = total == 2 * len(DATAS)
+        problemas += not ok
+        print(f"[{'OK' if ok else 'FALHOU'}] price_history: {total} linhas (esperado {2 * len(DATAS)})")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return 1 if problemas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,492 @@
+from sqlalchemy import func, select, case, literal, union_all, text, and_, or_, Float, String
+import base64
+import numpy as np
+import pandas as pd
+import json
+from datetime import datetime, date, time, timedelta
+from database import Product, PriceHistory, PriceDaily, PriceGap
+from busca import filtro_busca
+from ultimos_precos import filtro_ultimos
+from gap_precos import CELULA, celulas_dos_produtos, ler_precos, consulta_precos, agregar_gap, desempacotar_gap
+
+def limites_periodo(periodo):
+    # (inicio, fim) em date, fim inclusivo -> [inicio 00:00, fim + 1 dia 00:00) em datetime
+    inicio, fim = periodo
+    return (
+        datetime.combine(inicio, time.min) if inicio else None,
+        datetime.combine(fim + timedelta(days=1), time.min) if fim else None,
+    )
+
+def aplicar_filtros(query, region, brand, rim, competitor, competitor_brand, origin, search, tabela=PriceHistory, periodo=None, ultimos=False):
+    # tabela: PriceHistory ou PriceDaily (mesmas colunas de filtro; "search" só no PriceHistory)
+    # periodo: (inicio, fim) de interpretar_periodo
+    # ultimos: só o preço mais recente por produto/concorrente/modelo/cidade (price_latest)
+    if ultimos:
+        query = query.filter(filtro_ultimos())
+    if periodo:
+        if hasattr(tabela, "date_collected"):
+            inicio, fim = limites_periodo(periodo)
+            coluna_data = tabela.date_collected
+            if inicio:
+                query = query.filter(coluna_data >= inicio)
+            if fim:
+                query = query.filter(coluna_data < fim)
+        else:
+            inicio, fim = periodo
+            if inicio:
+                query = query.filter(tabela.day >= inicio)
+            if fim:
+                query = query.filter(tabela.day <= fim)
+    if region and "Toda" not in region:
+        query = query.filter(tabela.region == region)
+    if origin and "Toda" not in origin:
+        query = query.filter(tabela.origin == origin)
+
+    if brand and "Toda" not in brand:
+        lista = [x for x in brand.split(',') if x and "Toda" not in x]
+        if lista:
+            query = query.filter(Product.marca_interna.in_(lista))
+
+    if rim and "Todo" not in rim:
+        lista = [x for x in rim.split(',') if x and "Todo" not in x]
+        if lista:
+            query = query.filter(Product.rim.in_(lista))
+
+    if competitor and "Todo" not in competitor:
+        lista = [x for x in competitor.split(',') if x and "Todo" not in x]
+        if lista:
+            query = query.filter(tabela.competitor.in_(lista))
+
+    # Filtro por marca concorrente
+    if competitor_brand and "Toda" not in competitor_brand:
+        lista = [x for x in competitor_brand.split(',') if x and "Toda" not in x]
+        if lista:
+            query = query.filter(tabela.competitor_brand.in_(lista))
+
+    if search:
+        # Índice FTS5 (substring, sem acento); termos curtos caem no ILIKE
+        query = query.filter(filtro_busca(search))
+    return query
+
+def _lista_normalizada(valor, marcador):
+    if not valor or marcador in valor:
+        return None
+    lista = sorted({x for x in valor.split(',') if x and marcador not in x})
+    return tuple(lista) or None
+
+def normalizar_filtros(region, brand, rim, competitor, competitor_brand, origin, search):
+    # Tupla equivalente ao que aplicar_filtros realmente filtra (chave de cache)
+    return (
+        region if region and "Toda" not in region else None,
+        origin if origin and "Toda" not in origin else None,
+        _lista_normalizada(brand, "Toda"),
+        _lista_normalizada(rim, "Todo"),
+        _lista_normalizada(competitor, "Todo"),
+        _lista_normalizada(competitor_brand, "Toda"),
+        search or None,
+    )
+
+# --- COLUNAS EXPOSTAS NO /dashboard-data ---
+# Nome no JSON -> coluna do banco (mesma ordem da resposta original)
+CAMPOS = {
+    "id": PriceHistory.id,
+    "produto": Product.name,
+    "medida": Product.width,
+    "marca_interna": Product.marca_interna,
+    "modelo_interno": Product.model_interno,
+    "marca_concorrente": PriceHistory.competitor_brand,
+    "modelo_concorrente": PriceHistory.competitor_model,
+    "aro": Product.rim,
+    "origin": PriceHistory.origin,
+    "concorrente": PriceHistory.competitor,
+    "city": PriceHistory.city,
+    "preco": PriceHistory.price,
+    "sell_in": PriceHistory.sell_in,
+    "mkp": PriceHistory.mkp,
+    "data": PriceHistory.date_collected,
+}
+
+ORDEM_PADRAO = "-data"
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 5000
+
+class ParametroInvalido(ValueError):
+    pass
+
+# --- PERÍODO (date_from / date_to) ---
+
+def _data_parametro(valor, nome):
+    try:
+        return date.fromisoformat(valor) if valor else None
+    except ValueError:
+        raise ParametroInvalido(f"{nome} inválida: {valor}. Use AAAA-MM-DD.")
+
+def interpretar_periodo(date_from, date_to):
+    # "AAAA-MM-DD" (ambos inclusivos) -> (inicio, fim) em date; None = sem limite
+    inicio = _data_parametro(date_from, "date_from")
+    fim = _data_parametro(date_to, "date_to")
+    if inicio and fim and inicio > fim:
+        raise ParametroInvalido("date_from depois de date_to")
+    return (inicio, fim) if inicio or fim else None
+
+def escolher_campos(fields):
+    if not fields:
+        return list(CAMPOS)
+    nomes = [f.strip() for f in fields.split(',') if f.strip()]
+    invalidos = [f for f in nomes if f not in CAMPOS]
+    if invalidos:
+        raise ParametroInvalido(f"Campos inválidos: {', '.join(invalidos)}")
+    return nomes
+
+def _expressao_ordem(coluna):
+    # NULL vira sentinela para a comparação do cursor funcionar (NULL fica primeiro, como no SQLite)
+    if isinstance(coluna.type, Float):
+        return func.coalesce(coluna, -1e308)
+    if isinstance(coluna.type, String):
+        return func.coalesce(coluna, '')
+    return coluna
+
+def interpretar_ordem(sort):
+    # "preco,-data" -> [(campo, descendente)], sempre desempatando por id
+    ordem = []
+    for item in (sort or ORDEM_PADRAO).split(','):
+        item = item.strip()
+        if not item:
+            continue
+        desc_ = item.startswith('-')
+        nome = item.lstrip('+-')
+        if nome not in CAMPOS:
+            raise ParametroInvalido(f"Ordenação inválida: {nome}")
+        if nome != "id":
+            ordem.append((nome, desc_))
+    if not ordem or ordem[-1][0] != "id":
+        ordem.append(("id", ordem[-1][1] if ordem else True))
+    return ordem
+
+def codificar_cursor(valores):
+    valores = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+def decodificar_cursor(cursor, ordem):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(valores) != len(ordem):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if nome == "data" and v is not None else v
+            for (nome, _), v in zip(ordem, valores)
+        ]
+    except Exception:
+        raise ParametroInvalido("Cursor inválido")
+
+def _depois_do_cursor(expressoes, ordem, valores):
+    # (a, b, id) > (x, y, z) expandido, respeitando a direção de cada coluna
+    condicoes = []
+    for i, ((_, desc_), expr, valor) in enumerate(zip(ordem, expressoes, valores)):
+        anteriores = [e == v for e, v in zip(expressoes[:i], valores[:i])]
+        passo = expr < valor if desc_ else expr > valor
+        condicoes.append(and_(*anteriores, passo))
+    return or_(*condicoes)
+
+# --- PÁGINA NA ORDEM PADRÃO SEM ORDENAÇÃO TEMPORÁRIA ---
+# Todo índice do SQLite termina no rowid (= id), então (competitor, date_collected) já
+# entrega "-data, -id" pronto para o LIMIT. Dois casos caíam em "USE TEMP B-TREE FOR
+# ORDER BY" (ordenar tudo o que casou para devolver 100 linhas):
+#  - IN com vários valores numa coluna do price_history: o índice só sai ordenado com
+#    igualdade, então a página vira um UNION ALL por valor, intercalado pelo SQLite (MERGE)
+#  - marca/aro ficam em products e o planejador entra por lá. Com NOT INDEXED em products o
+#    price_history é percorrido na ordem do índice e o produto é conferido pela chave
+#    primária. Só quando o filtro pega uma fatia razoável dos produtos: valor raro (ou que
+#    não existe) faria percorrer o histórico inteiro, então continua entrando por products
+#    e ordenando as poucas linhas que casaram.
+FRACAO_MINIMA_PRODUTOS = 0.01
+MAXIMO_UNION = 64
+
+def _caminho_ordenado(query, ordem, filtros):
+    # Devolve (coluna, valores) para dividir em UNION ALL e se products vai sem índice
+    region, brand, rim, competitor, competitor_brand, origin, search = filtros
+    if search or [nome for nome, _ in ordem] != ["data", "id"] or ordem[0][1] != ordem[1][1]:
+        return None, False
+    divisao = None
+    for coluna, valor in ((PriceHistory.competitor, competitor), (PriceHistory.competitor_brand, competitor_brand)):
+        valores = _lista_normalizada(valor, "Todo" if coluna is PriceHistory.competitor else "Toda")
+        if valores and 1 < len(valores) <= MAXIMO_UNION:
+            divisao = (coluna, valores)
+            break
+    sem_indice = False
+    if _lista_normalizada(brand, "Toda") or _lista_normalizada(rim, "Todo"):
+        db = query.session
+        total = db.query(func.count(Product.id)).scalar()
+        casados = aplicar_filtros(db.query(func.count(Product.id)), None, brand, rim, None, None, None, None).scalar()
+        sem_indice = bool(total) and casados / total >= FRACAO_MINIMA_PRODUTOS
+    return divisao, sem_indice
+
+def consulta_paginada(query, campos, ordem, limit=None, cursor=None, filtros=None):
+    # filtros: os 7 filtros brutos de aplicar_filtros, para escolher o caminho pelo índice
+    # (None mantém o plano do SQLite: latest, por exemplo, já parte do price_latest)
+    expressoes = [_expressao_ordem(CAMPOS[nome]) for nome, _ in ordem]
+    query = query.with_entities(*[CAMPOS[nome] for nome in campos], *expressoes)
+    if cursor:
+        query = query.filter(_depois_do_cursor(expressoes, ordem, decodificar_cursor(cursor, ordem)))
+    if limit is not None and filtros:
+        divisao, sem_indice = _caminho_ordenado(query, ordem, filtros)
+        if sem_indice:
+            query = query.with_hint(Product, "NOT INDEXED", "sqlite")
+        if divisao:
+            coluna, valores = divisao
+            bracos = [query.filter(coluna == valor) for valor in valores]
+            query = bracos[0].union_all(*bracos[1:])
+    query = query.order_by(*[e.desc() if desc_ else e.asc() for e, (_, desc_) in zip(expressoes, ordem)])
+    return query.limit(limit + 1) if limit is not None else query
+
+def paginar_tuplas(query, campos, ordem, limit=None, cursor=None, filtros=None):
+    # Keyset pagination: devolve (tuplas, proximo_cursor); sem limit devolve tudo
+    linhas = consulta_paginada(query, campos, ordem, limit, cursor, filtros).all()
+    proximo = None
+    if limit is not None:
+        proximo = codificar_cursor(list(linhas[limit - 1][len(campos):])) if len(linhas) > limit else None
+        linhas = linhas[:limit]
+
+    return [linha[:len(campos)] for linha in linhas], proximo
+
+def paginar(query, campos, ordem, limit=None, cursor=None, filtros=None):
+    linhas, proximo = paginar_tuplas(query, campos, ordem, limit, cursor, filtros)
+    return [dict(zip(campos, linha)) for linha in linhas], proximo
+
+def contar(query):
+    return query.with_entities(func.count(PriceHistory.id)).scalar()
+
+# --- RESUMO AGREGADO (/summary) ---
+# Tudo calculado no SQLite a partir da mesma subquery filtrada.
+
+def _mais_frequentes(base, colunas):
+    # Um GROUP BY por dimensão, unidos, e ROW_NUMBER() escolhe o mais frequente de cada uma
+    grupos = union_all(*[
+        select(literal(nome).label("dim"), base.c[nome].label("valor"), func.count().label("n"))
+        .where(base.c[nome].isnot(None), base.c[nome] != '')
+        .group_by(base.c[nome])
+        for nome in colunas
+    ]).subquery()
+    ranking = select(
+        grupos.c.dim, grupos.c.valor,
+        func.row_number().over(partition_by=grupos.c.dim, order_by=(grupos.c.n.desc(), grupos.c.valor)).label("pos")
+    ).subquery()
+    return select(ranking.c.dim, ranking.c.valor).where(ranking.c.pos == 1)
+
+def _menor_por_medida(base):
+    ranking = select(
+        base.c.width, base.c.price, base.c.competitor, base.c.competitor_brand,
+        func.row_number().over(partition_by=base.c.width, order_by=(base.c.price.asc(), base.c.id.desc())).label("pos")
+    ).where(base.c.price.isnot(None)).subquery()
+    return select(ranking.c.width, ranking.c.price, ranking.c.competitor, ranking.c.competitor_brand)\
+        .where(ranking.c.pos == 1).order_by(ranking.c.price.asc(), ranking.c.width)
+
+def calcular_resumo(db, query):
+    base = query.with_entities(
+        PriceHistory.id, PriceHistory.price, PriceHistory.mkp, PriceHistory.competitor,
+        PriceHistory.competitor_brand, Product.rim, Product.width
+    ).subquery()
+
+    total, media, minimo, maximo, margem = db.execute(select(
+        func.count(base.c.id),
+        func.avg(base.c.price),
+        func.min(base.c.price),
+        func.max(base.c.price),
+        # mesma regra do dashboard: MKP zerado/nulo não entra na média
+        func.avg(case((base.c.mkp != 0, base.c.mkp))),
+    )).one()
+
+    tops = dict(db.execute(_mais_frequentes(base, ["rim", "competitor_brand", "competitor"])).all())
+    por_medida = [
+        {"medida": medida, "preco": preco, "concorrente": concorrente, "marca": marca}
+        for medida, preco, concorrente, marca in db.execute(_menor_por_medida(base))
+    ]
+    competitivo = por_medida[0] if por_medida else {"preco": 0, "medida": "", "marca": "", "concorrente": ""}
+
+    return {
+        "total": total,
+        "media": round(media or 0, 2),
+        "minimo": round(minimo or 0, 2),
+        "maximo": round(maximo or 0, 2),
+        "margem_media": round((margem or 0) * 100, 2),
+        "top_aro": tops.get("rim", "-"),
+        "top_marca_concorrente": tops.get("competitor_brand", "-"),
+        "concorrente_mais_frequente": tops.get("competitor", "-"),
+        "top_concorrente": competitivo["concorrente"] or "-",  # mais barato, como no /analytics
+        "preco_competitivo": competitivo,
+        "por_medida": por_medida,
+    }
+
+# --- INDICADORES DO /analytics ---
+
+def _indicadores(total, media, minimo, top_aro, concorrente_top):
+    if not total:
+        return {"total": 0, "media": 0, "minimo": 0, "top_aro": "-", "top_concorrente": "-"}
+    return {
+        "total": total,
+        "media": round(media, 2) if media is not None else 0,
+        "minimo": round(minimo, 2) if minimo is not None else 0,
+        "top_aro": top_aro if top_aro is not None else "-",
+        "top_concorrente": concorrente_top or "-",
+    }
+
+def calcular_indicadores(db, query):
+    # Reaproveita a subquery filtrada: 1 agregado (com o mais barato como subquery escalar) + 1 GROUP BY.
+    # Só coletas com preço (as mesmas que entram no price_daily); empate no menor preço
+    # fica com o dia mais antigo e depois o nome do concorrente, como em calcular_indicadores_diarios
+    query = query.filter(PriceHistory.price.isnot(None))
+    base = query.with_entities(
+        PriceHistory.price, PriceHistory.competitor, func.date(PriceHistory.date_collected).label("dia"), Product.rim
+    ).subquery()
+    mais_barato = select(base.c.competitor)\
+        .order_by(base.c.price.asc(), base.c.dia, base.c.competitor)\
+        .limit(1).scalar_subquery()
+
+    total, media, minimo, concorrente_top = db.execute(select(
+        func.count(), func.avg(base.c.price), func.min(base.c.price), mais_barato
+    )).one()
+    if total == 0:
+        return _indicadores(0, None, None, None, None)
+
+    top_aro = db.execute(
+        select(base.c.rim).group_by(base.c.rim).order_by(func.count().desc(), base.c.rim).limit(1)
+    ).scalar()
+    return _indicadores(total, media, minimo, top_aro, concorrente_top)
+
+def calcular_indicadores_diarios(db, filtros, periodo=None):
+    # Sem "search": os mesmos indicadores somando o price_daily (uma linha por
+    # produto/concorrente/marca/região/origem/dia, mantido pela importação) em vez de
+    # ler cada coleta do price_history
+    query = db.query(PriceDaily).join(Product, Product.id == PriceDaily.product_id)
+    query = aplicar_filtros(query, *filtros[:-1], None, tabela=PriceDaily, periodo=periodo)
+    base = query.with_entities(
+        PriceDaily.price_count, PriceDaily.price_sum, PriceDaily.price_min, PriceDaily.competitor, PriceDaily.day, Product.rim
+    ).subquery()
+    mais_barato = select(base.c.competitor)\
+        .order_by(base.c.price_min.asc(), base.c.day, base.c.competitor)\
+        .limit(1).scalar_subquery()
+
+    total, soma, minimo, concorrente_top = db.execute(select(
+        func.sum(base.c.price_count), func.sum(base.c.price_sum), func.min(base.c.price_min), mais_barato
+    )).one()
+    if not total:
+        return _indicadores(0, None, None, None, None)
+
+    top_aro = db.execute(
+        select(base.c.rim).group_by(base.c.rim).order_by(func.sum(base.c.price_count).desc(), base.c.rim).limit(1)
+    ).scalar()
+    return _indicadores(total, soma / total, minimo, top_aro, concorrente_top)
+
+# --- MATRIZ DE GAP DE PREÇO (/price-gap) ---
+# Linhas = medida/aro/marca interna, colunas = marca concorrente. Sem filtro por linha
+# (só marca interna/aro, que escolhem células inteiras) a matriz sai do price_gap, uma
+# linha pronta por célula mantida pela importação (ver gap_precos.py). Com região,
+# concorrente, marca concorrente, origem, período, busca ou latest o SQLite lê as linhas
+# filtradas em ordem cronológica (índice data+id, sem ordenação) e último preço, mediana
+# e o pivot saem de groupby/unstack no pandas; agregar no SQLite (GROUP BY, ROW_NUMBER())
+# foi medido e sai mais lento que trazer as 4 colunas.
+# Preço interno = PREÇO SELL IN do nosso artigo; gap % = (concorrente / interno - 1) * 100.
+
+def _gap(preco, referencia):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(referencia > 0, (preco / referencia - 1) * 100, np.nan)
+
+def _lista(matriz):
+    # NaN -> None (JSON válido), arredondado em 2 casas
+    return np.where(np.isnan(matriz), None, np.round(matriz, 2)).tolist()
+
+def _matriz_gap(celulas, por_marca, internos):
+    # celulas: MultiIndex (medida, aro, marca interna) pelo código da célula;
+    # por_marca/internos como em gap_precos.agregar_gap
+    matriz = por_marca.unstack("marca")
+    indice = matriz.index.union(internos.index)
+    ordem = np.lexsort([celulas[indice].get_level_values(nivel).astype(str) for nivel in reversed(range(len(CELULA)))])
+    indice = indice[ordem]
+    marcas = sorted(por_marca.index.get_level_values("marca").unique())
+    matriz = matriz.reindex(index=indice)
+    internos = internos.reindex(index=indice)
+
+    def pivo(valor):
+        if valor not in matriz.columns.get_level_values(0):
+            return np.full((len(indice), len(marcas)), np.nan)
+        return matriz[valor].reindex(columns=marcas).to_numpy(dtype=float)
+
+    ultimo, mediana = pivo("ultimo"), pivo("mediana")
+    interno_ultimo = internos["ultimo"].to_numpy(dtype=float)
+    interno_mediana = internos["mediana"].to_numpy(dtype=float)
+    colunas = {
+        "interno_ultimo": _lista(interno_ultimo),
+        "interno_mediana": _lista(interno_mediana),
+        "ultimo": _lista(ultimo),
+        "mediana": _lista(mediana),
+        "gap_ultimo": _lista(_gap(ultimo, interno_ultimo[:, None])),
+        "gap_mediana": _lista(_gap(mediana, interno_mediana[:, None])),
+        "n": np.nan_to_num(pivo("n")).astype(int).tolist(),
+    }
+    return {
+        "marcas": marcas,
+        "linhas": [
+            {"medida": medida, "aro": aro, "marca_interna": marca, **{nome: valores[i] for nome, valores in colunas.items()}}
+            for i, (medida, aro, marca) in enumerate(celulas[indice])
+        ],
+    }
+
+def calcular_gap_precos(db, query):
+    precos = ler_precos(db.connection(), query.with_entities(*consulta_precos().selected_columns)
+                        .order_by(PriceHistory.date_collected, PriceHistory.id).statement)
+    produtos = pd.DataFrame(
+        db.connection().execute(select(Product.id, *[getattr(Product, c) for c in CELULA])).all(), columns=["id"] + CELULA
+    )
+    # Cada produto cai numa célula (medida, aro, marca interna)
+    celula_do_produto, celulas = celulas_dos_produtos(produtos)
+    return _matriz_gap(celulas, *agregar_gap(precos, celula_do_produto))
+
+def calcular_gap_resumido(db, brand=None, rim=None):
+    # Mesma resposta de calcular_gap_precos sem filtro por linha, lida do price_gap
+    query = db.query(*[getattr(PriceGap, c) for c in CELULA], PriceGap.interno_ultimo, PriceGap.interno_mediana, PriceGap.marcas, PriceGap.valores)
+    if marcas := _lista_normalizada(brand, "Toda"):
+        query = query.filter(PriceGap.marca_interna.in_(marcas))
+    if aros := _lista_normalizada(rim, "Todo"):
+        query = query.filter(PriceGap.rim.in_(aros))
+    linhas = query.all()
+    if not linhas:
+        return {"marcas": [], "linhas": []}
+    return _matriz_gap(*desempacotar_gap(linhas))
+
+# --- VERIFICAÇÃO DE PLANOS (EXPLAIN QUERY PLAN) ---
+# Combinações de filtro que o dashboard usa de verdade, na página padrão do
+# /dashboard-data (-data, -id, LIMIT). Acusa "SCAN tabela" sem índice (varredura
+# completa) e "USE TEMP B-TREE FOR ORDER BY" (ordena tudo o que casou para uma página).
+COMBINACOES_PADRAO = [
+    {},
+    {"region": "NO"},
+    {"origin": "NACIONAL"},
+    {"brand": "BARUM,CONTINENTAL"},
+    {"rim": "15,16"},
+    {"competitor": "Caiado Pneus,Pmz Distribuidora"},
+    {"competitor_brand": "GOODYEAR"},
+    {"region": "CO", "brand": "BARUM", "rim": "15"},
+    {"region": "SE", "competitor": "Caiado Pneus", "competitor_brand": "FIRESTONE"},
+]
+
+def _varreduras_completas(plano):
+    return [
+        linha for linha in plano
+        if linha.startswith("SCAN ") and " USING " not in linha and not linha.startswith("SCAN CONSTANT")
+    ]
+
+def _ordenacoes_temporarias(plano):
+    return [linha for linha in plano if linha.startswith("USE TEMP B-TREE FOR ORDER BY")]
+
+def verificar_planos(db, combinacoes=COMBINACOES_PADRAO):
+    # Devolve [(filtros, plano, varreduras_completas, ordenacoes_temporarias)]
+    resultado = []
+    filtros_vazios = dict.fromkeys(("region", "brand", "rim", "competitor", "competitor_brand", "origin", "search"))
+    for filtros in combinacoes:
+        brutos = filtros_vazios | filtros
+        query = aplicar_filtros(db.query(PriceHistory, Product).join(Product), **brutos)
+        query = consulta_paginada(query, escolher_campos(None), interpretar_ordem(None), LIMITE_PADRAO, filtros=tuple(brutos.values()))
+        sql = str(query.statement.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}))
+        plano = [linha[-1] for linha in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        resultado.append((filtros, plano, _varreduras_completas(plano), _ordenacoes_temporarias(plano)))
+    return resultado
@@ -1,15 +1,94 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, Date, ForeignKey, Index, LargeBinary, text
+from sqlalchemy.dialects.sqlite.base import SQLiteCompiler
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import multiprocessing
 import os 
+import threading
+import unicodedata
+from metricas import instrumentar_engine
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(BASE_DIR, "tireforce.db")
+# TIREFORCE_DB permite apontar para outro arquivo (benchmarks, bancos descartáveis)
+db_path = os.getenv("TIREFORCE_DB", os.path.join(BASE_DIR, "tireforce.db"))
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{db_path}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# --- CONEXÕES (SQLite em WAL) ---
+# Em WAL as leituras não esperam a transação longa da importação. As rotas GET
+# usam um pool só de leitura (query_only); a escrita é uma só por vez (trava_escrita)
+# e abre a transação com BEGIN IMMEDIATE, então quem espera é o busy_timeout.
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # seguro em WAL; FULL = fsync a cada commit
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_READ_POOL = int(os.getenv("SQLITE_READ_POOL", "8"))
+
+_conexao = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=_conexao)
+engine_leitura = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args=_conexao, pool_size=SQLITE_READ_POOL, max_overflow=SQLITE_READ_POOL
+)
+
+class CompiladorSQLite(SQLiteCompiler):
+    # O compilador do SQLite descarta o with_hint; aqui ele vira "tabela NOT INDEXED" /
+    # "tabela INDEXED BY ..." (usado na paginação, ver consultas.paginar_tuplas)
+    def get_from_hint_text(self, table, text):
+        return text
+
+engine.dialect.statement_compiler = CompiladorSQLite
+engine_leitura.dialect.statement_compiler = CompiladorSQLite
+
+# Uma importação grava por vez dentro do processo (outras esperam na fila)
+trava_escrita = threading.Lock()
+
+@lru_cache(maxsize=65536)
+def sem_acento(valor):
+    # "Cuiabá" -> "cuiaba" (usado pelo índice de busca; os valores se repetem muito)
+    if valor is None:
+        return None
+    return ''.join(c for c in unicodedata.normalize('NFKD', str(valor)) if not unicodedata.combining(c)).lower()
+
+def _configurar(conexao):
+    conexao.create_function("sem_acento", 1, sem_acento, deterministic=True)
+    cursor = conexao.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_MB * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    return cursor
+
+@event.listens_for(engine, "connect")
+def _conectar_escrita(conexao, _):
+    cursor = _configurar(conexao)
+    cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    cursor.close()
+    # O BEGIN fica por conta do evento abaixo (o sqlite3 abriria um BEGIN DEFERRED)
+    conexao.isolation_level = None
+
+@event.listens_for(engine, "begin")
+def _begin_immediate(conn):
+    # Pega a trava de escrita já no início: evita SQLITE_BUSY ao promover leitura -> escrita
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+@event.listens_for(engine_leitura, "connect")
+def _conectar_leitura(conexao, _):
+    cursor = _configurar(conexao)
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+# Contagem e tempo das consultas (por requisição/job e no /metrics)
+instrumentar_engine(engine, "escrita")
+instrumentar_engine(engine_leitura, "leitura")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLeitura = sessionmaker(autocommit=False, autoflush=False, bind=engine_leitura)
 Base = declarative_base()
 
 class User(Base):
@@ -24,18 +103,18 @@ class Product(Base):
     id = Column(Integer, primary_key=True, index=True)
     
     name = Column(String, index=True)
-    marca_interna = Column(String)  # Barum/Continental (MARCA)
+    marca_interna = Column(String, index=True)  # Barum/Continental (MARCA)
     model_interno = Column(String)  # 5HM/ContiCrossContact (MODELO)
     marca_concorrente = Column(String)  # Firestone/Goodyear (Marca)
-    width = Column(String)
+    width = Column(String, index=True)
     profile = Column(String)
-    rim = Column(String)
+    rim = Column(String, index=True)
     unique_code = Column(String, unique=True, index=True)
 
 class PriceHistory(Base):
     __tablename__ = "price_history"
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"))  # coberto por ix_price_history_product_date
     competitor = Column(String)
     competitor_brand = Column(String)  # Marca Concorrente
     competitor_model = Column(String)  # Modelo Concorrente
@@ -47,6 +126,209 @@ class PriceHistory(Base):
     source = Column(String)
     region = Column(String, default="BR")
     city = Column(String, default="")
+    # Impressão digital da linha (produto, concorrente, modelo, cidade, data, preço):
+    # reenvio da mesma planilha não duplica o histórico. Ver impressao_digital().
+    fingerprint = Column(String)
+
+    # Índices casados com os filtros de aplicar_filtros (IN) + ordenação por data
+    __table_args__ = (
+        Index("ix_price_history_date_id", "date_collected", "id"),
+        Index("ix_price_history_region_date", "region", "date_collected"),
+        Index("ix_price_history_origin_date", "origin", "date_collected"),
+        Index("ix_price_history_competitor_date", "competitor", "date_collected"),
+        Index("ix_price_history_competitor_brand_date", "competitor_brand", "date_collected"),
+        # Região + concorrente juntos é o filtro mais comum do dashboard; com a igualdade
+        # nas duas colunas a página sai na ordem da data (ver consultas.paginar_tuplas)
+        Index("ix_price_history_region_competitor_date", "region", "competitor", "date_collected"),
+        Index("ix_price_history_product_date", "product_id", "date_collected"),
+        Index("ux_price_history_fingerprint", "fingerprint", unique=True),
+    )
+
+class PriceDaily(Base):
+    # Resumo diário de price_history (mantido pela ingestão; ver historico.py)
+    __tablename__ = "price_daily"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    competitor = Column(String, default="")
+    competitor_brand = Column(String, default="")
+    region = Column(String, default="")
+    origin = Column(String, default="")
+    day = Column(Date)
+    price_count = Column(Integer, default=0)
+    price_sum = Column(Float, default=0.0)
+    price_min = Column(Float)
+    price_max = Column(Float)
+    last_price = Column(Float)  # preço da coleta mais recente do dia
+    last_collected = Column(DateTime)
+    last_id = Column(Integer)
+
+    __table_args__ = (
+        Index("ux_price_daily_chave", "product_id", "competitor", "competitor_brand", "region", "origin", "day", unique=True),
+        Index("ix_price_daily_day", "day"),
+        # Filtro de marca/aro entra por products; com o dia no fim do índice lê só a janela
+        Index("ix_price_daily_product_day", "product_id", "day"),
+    )
+
+class PriceLatest(Base):
+    # Preço mais recente por produto/concorrente/modelo concorrente/cidade (mantido
+    # pela ingestão; ver ultimos_precos.py). Aponta para a linha do price_history
+    __tablename__ = "price_latest"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    competitor = Column(String, default="")
+    competitor_model = Column(String, default="")
+    city = Column(String, default="")
+    price_id = Column(Integer)
+    price = Column(Float)
+    date_collected = Column(DateTime)
+
+    __table_args__ = (
+        Index("ux_price_latest_chave", "product_id", "competitor", "competitor_model", "city", unique=True),
+        Index("ix_price_latest_price_id", "price_id"),
+    )
+
+class PriceGap(Base):
+    # Linha pronta da matriz do /price-gap por célula medida/aro/marca interna (mantida
+    # pela importação e pelo arquivamento; ver gap_precos.py)
+    __tablename__ = "price_gap"
+    id = Column(Integer, primary_key=True)
+    width = Column(String)
+    rim = Column(String)
+    marca_interna = Column(String)
+    interno_ultimo = Column(Float)  # sell in da coleta mais recente da célula
+    interno_mediana = Column(Float)
+    marcas = Column(String)  # marcas concorrentes separadas por SEPARADOR_MARCAS (gap_precos.py)
+    valores = Column(LargeBinary)  # float64 (último preço, mediana, coletas) por marca, na mesma ordem
+
+    __table_args__ = (
+        Index("ix_price_gap_celula", "width", "rim", "marca_interna"),
+    )
+
+class ImportedFile(Base):
+    # Arquivos já importados (sha256 do conteúdo + cidade, que vem do nome do arquivo)
+    __tablename__ = "imported_files"
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String)
+    city = Column(String)
+    filename = Column(String)
+    imported_at = Column(DateTime, default=datetime.utcnow)
+    rows_new = Column(Integer, default=0)
+    rows_updated = Column(Integer, default=0)
+    rows_skipped = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ux_imported_files_sha256_city", "sha256", "city", unique=True),
+    )
+
+class ArchivedFingerprint(Base):
+    # Impressões das linhas movidas para o arquivo Parquet (arquivamento.py): o
+    # reenvio de uma planilha antiga continua sendo reconhecido como repetido
+    __tablename__ = "archived_fingerprints"
+    fingerprint = Column(String, primary_key=True)
+
+class ArchivedFacet(Base):
+    # Contagem por valor das facetas (facetas.py) nas linhas arquivadas: as listas dos
+    # filtros continuam com concorrentes/marcas/medidas que só existem no arquivo
+    __tablename__ = "archived_facets"
+    faceta = Column(String, primary_key=True)
+    valor = Column(String, primary_key=True)
+    n = Column(Integer, default=0)
+
+class DataVersion(Base):
+    # Versão dos dados, uma linha só: a importação e o arquivamento somam 1 na mesma
+    # transação em que gravam. Todo processo/worker lê daqui a chave do cache de respostas
+    __tablename__ = "data_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)
+
+def nova_versao_dados(conn):
+    # Dentro da transação de escrita (conn: Session ou Connection)
+    conn.execute(text(
+        "INSERT INTO data_version (id, version) VALUES (1, 1) "
+        "ON CONFLICT(id) DO UPDATE SET version = version + 1"
+    ))
+
+def versao_dados(conn):
+    return conn.execute(text("SELECT version FROM data_version WHERE id = 1")).scalar() or 0
+
+FORMATO_DATA_IMPRESSAO = "%Y-%m-%d %H:%M:%S.%f"
+
+def texto_impressao(product_id, competitor, competitor_model, city, data, price):
+    # Mesma montagem da versão por coluna em ingest.impressoes()
+    return "|".join([
+        str(product_id), competitor or "", competitor_model or "", city or "",
+        data.strftime(FORMATO_DATA_IMPRESSAO), f"{price:.2f}",
+    ])
+
+def impressao_digital(texto):
+    return hashlib.md5(texto.encode("utf-8")).hexdigest()
+
+def migrar_colunas():
+    # create_all também não adiciona colunas novas em tabelas existentes
+    adicionadas = []
+    with engine.begin() as conn:
+        for tabela in Base.metadata.sorted_tables:
+            existentes = {linha[1] for linha in conn.execute(text(f"PRAGMA table_info({tabela.name})"))}
+            for coluna in tabela.columns:
+                if coluna.name not in existentes:
+                    tipo = coluna.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}"))
+                    adicionadas.append(f"{tabela.name}.{coluna.name}")
+    if adicionadas:
+        print(f"Colunas criadas: {', '.join(adicionadas)}")
+    return adicionadas
+
+def preencher_impressoes():
+    # Roda uma vez, quando a coluna fingerprint acaba de ser criada. Duplicatas que
+    # já estavam no banco ficam sem impressão (só a primeira ocorrência recebe).
+    vistas = set()
+    with engine.begin() as conn:
+        linhas = conn.execute(text(
+            "SELECT id, product_id, competitor, competitor_model, city, date_collected, price "
+            "FROM price_history WHERE fingerprint IS NULL AND price IS NOT NULL AND date_collected IS NOT NULL ORDER BY id"
+        )).all()
+        lote = []
+        for id_, product_id, competitor, competitor_model, city, data, price in linhas:
+            if isinstance(data, str):
+                data = datetime.fromisoformat(data)
+            impressao = impressao_digital(texto_impressao(product_id, competitor, competitor_model, city, data, price))
+            if impressao in vistas:
+                continue
+            vistas.add(impressao)
+            lote.append({"id": id_, "impressao": impressao})
+        if lote:
+            conn.execute(text("UPDATE price_history SET fingerprint = :impressao WHERE id = :id"), lote)
+    print(f"Impressões calculadas: {len(vistas)} de {len(linhas)} linhas")
+
+# Índices que versões anteriores criaram e que outro índice composto já cobre
+# (só pesariam nos inserts)
+INDICES_OBSOLETOS = ["ix_price_history_product_id"]
+
+def migrar_indices():
+    # create_all não cria índices novos em tabelas que já existem; cria aqui os que faltam
+    criados = []
+    with engine.begin() as conn:
+        for nome in INDICES_OBSOLETOS:
+            conn.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+    for tabela in Base.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            with engine.begin() as conn:
+                existe = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :nome"), {"nome": indice.name}
+                ).first()
+                if not existe:
+                    indice.create(bind=conn)
+                    criados.append(indice.name)
+    if criados:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        print(f"Índices criados: {', '.join(criados)}")
+    return criados
 
-# Cria as tabelas
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# Cria as tabelas (só no processo principal: os processos da limpeza em lote,
+# jobs.py, importam este módulo mas não tocam no banco)
+if multiprocessing.parent_process() is None:
+    Base.metadata.create_all(bind=engine)
+    if "price_history.fingerprint" in migrar_colunas():
+        preencher_impressoes()
+    migrar_indices()
\ No newline at end of file
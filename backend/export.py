@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from sqlalchemy import literal
+from database import SessionLeitura, Product, PriceHistory
+from consultas import aplicar_filtros
+from arquivamento import historico_completo
+
+# --- EXPORTAÇÃO EM STREAMING ---
+# Mesmo layout de colunas da planilha de upload, para a exportação poder ser
+# importada de volta. As linhas saem do banco em lotes (yield_per), então a
+# memória não cresce com o tamanho do resultado. O histórico arquivado em Parquet
+# só entra com date_from anterior ao limite do arquivo (ver arquivamento.py).
+
+TAMANHO_LOTE_EXPORTACAO = 2000
+
+# Cabeçalho da planilha original -> coluna do banco (None = sem equivalente)
+COLUNAS_EXPORTACAO = [
+    ("ARTIGO", None),
+    ("Medida", Product.width),
+    ("MARCA", Product.marca_interna),
+    ("MODELO", Product.model_interno),
+    ("PREÇO SELL IN", PriceHistory.sell_in),
+    ("Marca", PriceHistory.competitor_brand),
+    ("Modelo", PriceHistory.competitor_model),
+    ("ORIGEM", PriceHistory.origin),
+    ("Aro", Product.rim),
+    ("Preco_Sell_Out", PriceHistory.price),
+    ("Empresa", PriceHistory.competitor),
+    ("Data", PriceHistory.date_collected),
+    ("MKP", PriceHistory.mkp),
+    # A cidade na importação vem do nome do arquivo; aqui vai como coluna informativa
+    ("Cidade", PriceHistory.city),
+    ("Regiao", PriceHistory.region),
+]
+CABECALHO = [nome for nome, _ in COLUNAS_EXPORTACAO]
+INDICE_DATA = CABECALHO.index("Data")
+
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+def _formatar_data(valor):
+    if valor is None:
+        return ""
+    if valor.hour == valor.minute == valor.second == 0:
+        return valor.strftime('%d/%m/%Y')
+    return valor.strftime('%Y-%m-%d %H:%M:%S')
+
+def _linhas(filtros, periodo=None, ultimos=False):
+    # Sessão própria: o gerador roda depois que a requisição já devolveu a resposta
+    db = SessionLeitura()
+    try:
+        with historico_completo(db, filtros, periodo, ultimos):
+            colunas = [literal("").label(nome) if coluna is None else coluna for nome, coluna in COLUNAS_EXPORTACAO]
+            query = db.query(PriceHistory, Product).join(Product)
+            query = aplicar_filtros(query, *filtros, periodo=periodo, ultimos=ultimos).with_entities(*colunas)
+            query = query.order_by(PriceHistory.date_collected.desc(), PriceHistory.id.desc())
+            for linha in query.yield_per(TAMANHO_LOTE_EXPORTACAO):
+                valores = list(linha)
+                valores[INDICE_DATA] = _formatar_data(valores[INDICE_DATA])
+                yield valores
+    finally:
+        db.close()
+
+def _em_lotes(linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE_EXPORTACAO:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def exportar_csv(filtros, periodo=None, ultimos=False):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    escritor.writerow(CABECALHO)
+    yield buffer.getvalue().encode('utf-8')
+    for lote in _em_lotes(_linhas(filtros, periodo, ultimos)):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(["" if v is None else v for v in linha] for linha in lote)
+        yield buffer.getvalue().encode('utf-8')
+
+def exportar_ndjson(filtros, periodo=None, ultimos=False):
+    for lote in _em_lotes(_linhas(filtros, periodo, ultimos)):
+        yield ''.join(
+            json.dumps(dict(zip(CABECALHO, linha)), ensure_ascii=False) + '\n' for linha in lote
+        ).encode('utf-8')
+
+def exportar_xlsx(filtros, periodo=None, ultimos=False):
+    # openpyxl em write_only grava as linhas direto em disco; o .xlsx (zip) só
+    # fica pronto no save(), então o arquivo é montado antes de começar a enviar.
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Precos")
+    ws.append(CABECALHO)
+    for linha in _linhas(filtros, periodo, ultimos):
+        ws.append(linha)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as destino:
+        caminho = destino.name
+    try:
+        wb.save(caminho)
+        with open(caminho, 'rb') as f:
+            while bloco := f.read(1024 * 1024):
+                yield bloco
+    finally:
+        os.remove(caminho)
+
+EXPORTADORES = {"csv": exportar_csv, "ndjson": exportar_ndjson, "xlsx": exportar_xlsx}
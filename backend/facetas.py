@@ -0,0 +1,95 @@
+from sqlalchemy import select, func, literal, union_all
+from collections import Counter
+import hashlib
+import json
+import threading
+from database import Product, PriceHistory, ArchivedFacet
+
+# --- CACHE DAS LISTAS DOS FILTROS (facetas) ---
+# As listas de concorrentes, marcas e medidas só mudam quando entra planilha nova.
+# Materializa uma vez (com contagem por valor), soma os valores novos de cada
+# importação e só recalcula do zero se o banco mudou por fora (ex.: outro worker).
+# Linhas arquivadas em Parquet entram pelas contagens do archived_facets.
+
+FACETAS = {
+    "competitors_list": PriceHistory.competitor,
+    "brands_list": Product.marca_interna,
+    "concorrente_brands_list": PriceHistory.competitor_brand,
+    "measures_list": Product.width,
+}
+
+# Coluna do DataFrame limpo (ingest.limpar_dataframe) que alimenta cada faceta
+COLUNAS_INGESTAO = {
+    "competitors_list": "competitor",
+    "brands_list": "marca_interna",
+    "concorrente_brands_list": "marca_concorrente",
+    "measures_list": "medida",
+}
+
+def consulta_contagens(*condicoes):
+    # Uma consulta só: GROUP BY de cada faceta unidos com UNION ALL (condicoes: filtro
+    # opcional sobre as linhas do price_history, ex.: as que vão para o arquivo)
+    return union_all(*[
+        select(literal(nome).label("faceta"), coluna.label("valor"), func.count(PriceHistory.id).label("n"))
+        .select_from(PriceHistory).join(Product, Product.id == PriceHistory.product_id)
+        .where(*condicoes)
+        .group_by(coluna)
+        for nome, coluna in FACETAS.items()
+    ])
+
+def _etag(conteudo):
+    return '"' + hashlib.md5(json.dumps(conteudo, sort_keys=True).encode()).hexdigest() + '"'
+
+class CacheFacetas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.contagens = None
+        self.ultimo_id = None
+        self._resposta = None
+
+    def _materializar(self, db):
+        # Tabela quente + o que já foi para o arquivo
+        contagens = {nome: Counter() for nome in FACETAS}
+        arquivadas = select(ArchivedFacet.faceta, ArchivedFacet.valor, ArchivedFacet.n)
+        for consulta in (consulta_contagens(), arquivadas):
+            for faceta, valor, n in db.execute(consulta):
+                if valor and faceta in contagens:
+                    contagens[faceta][valor] += n
+        return contagens
+
+    def _montar(self):
+        listas = {nome: sorted(self.contagens[nome]) for nome in FACETAS}
+        contagens = {nome: dict(sorted(self.contagens[nome].items())) for nome in FACETAS}
+        self._resposta = (listas, contagens, _etag(listas), _etag(contagens))
+
+    def obter(self, db):
+        # Devolve (listas, contagens, etag_listas, etag_contagens)
+        ultimo_id = db.execute(select(func.max(PriceHistory.id))).scalar() or 0
+        with self.lock:
+            if self.contagens is None or ultimo_id != self.ultimo_id:
+                self.contagens = self._materializar(db)
+                self.ultimo_id = ultimo_id
+                self._montar()
+            return self._resposta
+
+    def registrar(self, novos, id_inicial, id_final):
+        # Soma os valores de uma importação já commitada (ids id_inicial+1 .. id_final)
+        with self.lock:
+            if self.contagens is None:
+                return
+            if self.ultimo_id != id_inicial:
+                # Entrou dado que não passou por aqui; recalcula na próxima leitura
+                self.contagens = None
+                return
+            for nome, valores in novos.items():
+                for valor, n in valores.items():
+                    if valor:
+                        self.contagens[nome][valor] += n
+            self.ultimo_id = id_final
+            self._montar()
+
+    def invalidar(self):
+        with self.lock:
+            self.contagens = None
+
+cache_facetas = CacheFacetas()
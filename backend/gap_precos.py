@@ -0,0 +1,138 @@
+from sqlalchemy import select, delete, insert, bindparam
+import numpy as np
+import pandas as pd
+from database import engine, Product, PriceHistory, PriceGap
+
+# --- MATRIZ DE GAP PRÉ-CALCULADA (price_gap) ---
+# Uma linha por célula (medida, aro, marca interna) com o que o /price-gap mostra
+# dela: último preço e mediana do sell in interno e, por marca concorrente, último
+# preço, mediana e número de coletas (nomes numa string, números num bloco float64:
+# ~300 mil pares célula/marca viram ~9 mil linhas que se leem sem converter valor
+# a valor). Mediana não se acumula como as somas do
+# price_daily, então a importação recalcula as células que receberam linhas (lendo
+# só o histórico delas) e o arquivamento refaz a tabela. Sem filtro por linha
+# (região, concorrente, marca concorrente, origem, período, busca, latest) o
+# /price-gap lê uma linha por medida daqui em vez de todas as coletas.
+
+CELULA = ["width", "rim", "marca_interna"]
+LOTE_PRODUTOS = 20000  # produtos por leitura do price_history (limite de parâmetros do SQLite)
+SEPARADOR_MARCAS = "\x1f"
+
+_pronto = False
+
+def celulas_dos_produtos(produtos):
+    # produtos: DataFrame id + CELULA -> (código da célula por id de produto, MultiIndex das células)
+    codigos, celulas = pd.MultiIndex.from_frame(produtos[CELULA]).factorize()
+    return pd.Series(codigos, index=produtos["id"]), celulas
+
+def ler_precos(conn, consulta):
+    # Tuplas direto do cursor do sqlite3 (sem montar Row do SQLAlchemy por linha;
+    # as 4 colunas já vêm nos tipos certos)
+    resultado = conn.execute(consulta)
+    precos = pd.DataFrame(resultado.cursor.fetchall(), columns=["produto", "marca", "preco", "sell_in"])
+    resultado.close()
+    return precos
+
+def consulta_precos():
+    # Colunas de ler_precos em ordem cronológica (o "último" de cada grupo é a última linha)
+    return select(PriceHistory.product_id, PriceHistory.competitor_brand, PriceHistory.price, PriceHistory.sell_in)\
+        .order_by(PriceHistory.date_collected, PriceHistory.id)
+
+def agregar_gap(precos, celula_do_produto):
+    # Devolve (por_marca, internos) pelo código da célula: último preço, mediana e
+    # coletas por célula e marca concorrente; último e mediana do sell in por célula
+    precos = precos.assign(celula=celula_do_produto.reindex(precos["produto"]).to_numpy())
+    concorrentes = precos[precos["preco"].notna() & precos["marca"].notna() & (precos["marca"] != "")]
+    por_marca = concorrentes.groupby(["celula", "marca"], sort=False)["preco"]
+    por_marca = pd.DataFrame({"ultimo": por_marca.last(), "mediana": por_marca.median(), "n": por_marca.size()})
+    por_celula = precos[precos["sell_in"] > 0].groupby("celula", sort=False)["sell_in"]
+    internos = pd.DataFrame({"ultimo": por_celula.last(), "mediana": por_celula.median()})
+    return por_marca, internos
+
+def _registros(celulas, por_marca, internos):
+    # Uma linha do price_gap por célula com coleta de concorrente ou sell in
+    por_marca = por_marca.sort_index(level="celula", sort_remaining=False)
+    codigos = por_marca.index.get_level_values("celula").to_numpy()
+    nomes = por_marca.index.get_level_values("marca").to_numpy()
+    valores = por_marca[["ultimo", "mediana", "n"]].to_numpy(dtype=np.float64)
+    marcas = {}
+    if len(codigos):
+        inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+        for inicio, fim in zip(inicios, np.r_[inicios[1:], len(codigos)]):
+            marcas[codigos[inicio]] = (SEPARADOR_MARCAS.join(nomes[inicio:fim]), valores[inicio:fim].tobytes())
+    internos = dict(zip(internos.index, zip(internos["ultimo"], internos["mediana"])))
+    registros = []
+    for celula in marcas.keys() | internos.keys():
+        ultimo, mediana = internos.get(celula, (None, None))
+        nomes_celula, valores_celula = marcas.get(celula, ("", b""))
+        registros.append({
+            **dict(zip(CELULA, celulas[celula])),
+            "interno_ultimo": None if pd.isna(ultimo) else float(ultimo),
+            "interno_mediana": None if pd.isna(mediana) else float(mediana),
+            "marcas": nomes_celula,
+            "valores": valores_celula,
+        })
+    return registros
+
+def desempacotar_gap(linhas):
+    # Linhas do price_gap (CELULA, interno_ultimo, interno_mediana, marcas, valores) ->
+    # (celulas, por_marca, internos) como celulas_dos_produtos/agregar_gap, com o
+    # código da célula = posição da linha
+    celulas = pd.MultiIndex.from_tuples([linha[:3] for linha in linhas], names=CELULA)
+    valores = np.frombuffer(b"".join(linha[6] for linha in linhas), dtype=np.float64).reshape(-1, 3)
+    nomes = SEPARADOR_MARCAS.join(linha[5] for linha in linhas if linha[5]).split(SEPARADOR_MARCAS) if len(valores) else []
+    codigos, marcas = pd.factorize(np.array(nomes, dtype=object))
+    celula = np.repeat(np.arange(len(linhas)), [len(linha[6]) // valores.itemsize // 3 for linha in linhas])
+    por_marca = pd.DataFrame(
+        {"ultimo": valores[:, 0], "mediana": valores[:, 1], "n": valores[:, 2].astype(int)},
+        index=pd.MultiIndex(levels=[np.arange(len(linhas)), marcas], codes=[celula, codigos], names=["celula", "marca"]),
+    )
+    internos = pd.DataFrame([linha[3:5] for linha in linhas], columns=["ultimo", "mediana"]).dropna(how="all")
+    return celulas, por_marca, internos
+
+def _recalcular(conn, produtos=None):
+    # Refaz as linhas das células dos produtos dados (None = todas)
+    catalogo = pd.DataFrame(conn.execute(select(Product.id, *[getattr(Product, c) for c in CELULA])).all(), columns=["id"] + CELULA)
+    celula_do_produto, celulas = celulas_dos_produtos(catalogo)
+    if produtos is None:
+        conn.execute(delete(PriceGap))
+        registros = _registros(celulas, *agregar_gap(ler_precos(conn, consulta_precos()), celula_do_produto))
+    else:
+        tocadas = set(celula_do_produto.reindex(list(produtos)).dropna().astype(int))
+        conn.execute(
+            delete(PriceGap).where(*[getattr(PriceGap, c).is_(bindparam(c)) for c in CELULA]),
+            [dict(zip(CELULA, celulas[celula])) for celula in tocadas],
+        )
+        # Célula inteira no mesmo lote: a mediana precisa de todas as coletas dela
+        catalogo = catalogo.assign(celula=celula_do_produto.to_numpy())
+        catalogo = catalogo[catalogo["celula"].isin(tocadas)].sort_values("celula", kind="stable")
+        lote_da_celula = (catalogo.groupby("celula").size().cumsum() - 1) // LOTE_PRODUTOS
+        registros = []
+        for _, ids in catalogo.groupby(catalogo["celula"].map(lote_da_celula))["id"]:
+            precos = ler_precos(conn, consulta_precos().where(PriceHistory.product_id.in_(ids.tolist())))
+            registros += _registros(celulas, *agregar_gap(precos, celula_do_produto))
+    if registros:
+        conn.execute(insert(PriceGap), registros)
+    return len(registros)
+
+def reconstruir_gap(conn):
+    # Refaz o price_gap inteiro a partir do price_history
+    return _recalcular(conn)
+
+def garantir_gap():
+    # Banco antigo (sem price_gap populado): monta a matriz uma vez no startup
+    global _pronto
+    if _pronto:
+        return
+    with engine.begin() as conn:
+        vazio = conn.execute(select(PriceGap.id).limit(1)).first() is None
+        if vazio and conn.execute(select(PriceHistory.id).limit(1)).first() is not None:
+            reconstruir_gap(conn)
+            print("Matriz de gap de preços reconstruída.")
+    _pronto = True
+
+def atualizar_gap(db, produtos):
+    # Na transação da importação, antes do commit: células dos produtos que
+    # receberam linhas novas ou tiveram o sell in corrigido
+    if produtos:
+        _recalcular(db.connection(), produtos)
@@ -0,0 +1,121 @@
+# Gera planilhas sintéticas no layout da coleta (mesmas colunas e sujeiras que
+# identificar_colunas/limpar_dataframe tratam): preço "R$ 312,40", fórmula no
+# MKP, empresa com "Ltda", aro "R15", datas em formatos variados.
+# Uso: python gerar_planilha.py 100k coleta_manaus.csv [--semente 1]
+#      python gerar_planilha.py 10000 coleta_sp.xlsx
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+CABECALHO = ["ARTIGO", "Medida", "MARCA", "MODELO", "PREÇO SELL IN", "Marca", "Modelo",
+             "ORIGEM", "Aro", "Preco_Sell_Out", "Empresa", "Data", "MKP"]
+
+# Tamanhos nomeados usados pelo bench_suite.py
+TAMANHOS = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+MARCAS_INTERNAS = {
+    "BARUM": ["BRAVURIS 5HM", "BRILLANTIS 2", "VANIS 3"],
+    "CONTINENTAL": ["POWERCONTACT 2", "CONTICROSSCONTACT LX2", "ECOCONTACT 6"],
+    "GENERAL TIRE": ["ALTIMAX ONE", "GRABBER AT3"],
+}
+MARCAS_CONCORRENTES = {
+    "PIRELLI": ["P7", "CINTURATO P1", "SCORPION ATR"],
+    "GOODYEAR": ["EFFICIENTGRIP", "DIRECTION SPORT", "WRANGLER"],
+    "MICHELIN": ["PRIMACY 4", "ENERGY XM2", "LTX FORCE"],
+    "BRIDGESTONE": ["TURANZA", "ECOPIA EP150", "DUELER"],
+    "FIRESTONE": ["F-600", "F-700", "DESTINATION"],
+    "DUNLOP": ["SP TOURING", "GRANDTREK"],
+    "XBRI": ["ECOLOGY", "BRUTUS"],
+    "LINGLONG": ["GREEN-MAX", "CROSSWIND"],
+    "KUMHO": ["ECSTA", "SOLUS"],
+    "HANKOOK": ["KINERGY", "VENTUS"],
+}
+EMPRESAS = ["Caiado Pneus Ltda", "Pmz Distribuidora", "JL PNEUS S/A", "Roda Forte ME", "Pneu Center Ltda.",
+            "DPaschoal", "Rede Pneus Eireli", "Auto Pneus Norte Ltda"]
+ORIGENS = ["NACIONAL", "IMPORTADO", "Nac", "IMP", ""]
+LARGURAS = [145, 155, 165, 175, 185, 195, 205, 215, 225, 235, 245, 255, 265, 275]
+PERFIS = [35, 40, 45, 50, 55, 60, 65, 70, 75, 80]
+AROS = [13, 14, 15, 16, 17, 18, 19, 20]
+
+def _tamanho(valor):
+    return TAMANHOS.get(str(valor).lower()) or int(valor)
+
+def _preco(valor, rng):
+    # Metade em "R$ 1234,56", o resto como número simples (o Excel exporta dos dois jeitos).
+    # Sem separador de milhar: tratar_preco não entende "1.234,56"
+    if rng.random() < 0.5:
+        return f"R$ {valor:.2f}".replace(".", ",")
+    return round(valor, 2)
+
+def _data(dia, rng):
+    sorteio = rng.random()
+    if sorteio < 0.8:
+        return dia.strftime("%d/%m/%Y")
+    if sorteio < 0.95:
+        return dia.strftime("%Y-%m-%d")
+    return dia.strftime("%d-%m-%Y")
+
+def linhas_sinteticas(total, semente=1, inicio=datetime(2023, 1, 1), dias=730):
+    rng = random.Random(semente)
+    # Catálogo fixo por semente: ~300 artigos internos, cada um com seu equivalente concorrente
+    artigos = []
+    for _ in range(300):
+        marca = rng.choice(list(MARCAS_INTERNAS))
+        largura, perfil, aro = rng.choice(LARGURAS), rng.choice(PERFIS), rng.choice(AROS)
+        marca_conc = rng.choice(list(MARCAS_CONCORRENTES))
+        artigos.append({
+            "medida": f"{largura}/{perfil}" + (f" R{aro}" if rng.random() < 0.3 else ""),
+            "marca": marca, "modelo": rng.choice(MARCAS_INTERNAS[marca]),
+            "marca_conc": marca_conc, "modelo_conc": rng.choice(MARCAS_CONCORRENTES[marca_conc]),
+            "aro": rng.choice([str(aro), f"R{aro}", f"ARO {aro}", f"{aro}.0"]),
+            "sell_in": rng.uniform(180, 900),
+        })
+    for i in range(total):
+        artigo = rng.choice(artigos)
+        sell_in = artigo["sell_in"] * rng.uniform(0.95, 1.05)
+        sell_out = sell_in * rng.uniform(1.15, 1.9)
+        mkp = rng.random()
+        yield [
+            100000 + i,
+            artigo["medida"],
+            artigo["marca"] if rng.random() < 0.9 else artigo["marca"].lower(),
+            artigo["modelo"],
+            _preco(sell_in, rng),
+            artigo["marca_conc"],
+            artigo["modelo_conc"],
+            rng.choice(ORIGENS),
+            artigo["aro"],
+            _preco(sell_out, rng) if rng.random() > 0.002 else "",
+            rng.choice(EMPRESAS),
+            _data(inicio + timedelta(days=rng.randrange(dias)), rng),
+            "" if mkp < 0.4 else (f"=J{i + 2}/E{i + 2}" if mkp < 0.5 else f"{sell_out / sell_in - 1:.2f}".replace(".", ",")),
+        ]
+
+def gerar_planilha(caminho, total, semente=1):
+    total = _tamanho(total)
+    if caminho.lower().endswith((".xlsx", ".xlsm")):
+        # write_only grava linha a linha (1M de linhas sem montar a planilha na memória)
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Coleta")
+        ws.append(CABECALHO)
+        for linha in linhas_sinteticas(total, semente):
+            ws.append(linha)
+        wb.save(caminho)
+    else:
+        with open(caminho, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f, delimiter=";")
+            escritor.writerow(CABECALHO)
+            escritor.writerows(linhas_sinteticas(total, semente))
+    return caminho
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera planilha sintética no layout da coleta")
+    parser.add_argument("linhas", help="quantidade (ex.: 10000) ou 10k, 100k, 1m")
+    parser.add_argument("saida", help="arquivo .csv ou .xlsx (a cidade vem do nome, como no upload)")
+    parser.add_argument("--semente", type=int, default=1)
+    args = parser.parse_args()
+    gerar_planilha(args.saida, args.linhas, args.semente)
+    print(f"{_tamanho(args.linhas)} linhas -> {os.path.abspath(args.saida)}")
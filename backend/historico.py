@@ -0,0 +1,204 @@
+from sqlalchemy import select, insert, delete, func, case, literal, tuple_, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import pandas as pd
+from database import engine, Product, PriceHistory, PriceDaily
+from consultas import aplicar_filtros
+
+# --- RESUMO DIÁRIO DE PREÇOS (séries históricas) ---
+# price_daily guarda, por produto/concorrente/marca concorrente/região/origem/dia,
+# quantidade, soma, mínimo, máximo e último preço. A ingestão soma cada lote
+# novo (upsert), então o /timeseries lê milhares de linhas em vez de milhões.
+
+CHAVE_DIARIA = ["product_id", "competitor", "competitor_brand", "region", "origin", "day"]
+TAMANHO_LOTE_DIARIO = 5000
+
+# Tamanho do balde -> expressão sobre a data 'YYYY-MM-DD' (semana começa na segunda)
+BUCKETS = {
+    "day": lambda dia: func.date(dia),
+    "week": lambda dia: func.date(dia, "weekday 0", "-6 days"),
+    "month": lambda dia: func.strftime("%Y-%m-01", dia),
+}
+
+# Agrupamento das séries: coluna de produto ou nome da coluna na tabela de fatos
+AGRUPAMENTOS = {
+    "medida": Product.width,
+    "aro": Product.rim,
+    "marca_interna": Product.marca_interna,
+    "marca_concorrente": "competitor_brand",
+    "concorrente": "competitor",
+    "origin": "origin",
+    "region": "region",
+}
+
+_pronto = False
+
+def _chave_bruta():
+    # Mesma chave do price_daily, calculada sobre price_history
+    return [
+        PriceHistory.product_id,
+        func.coalesce(PriceHistory.competitor, ""),
+        func.coalesce(PriceHistory.competitor_brand, ""),
+        func.coalesce(PriceHistory.region, ""),
+        func.coalesce(PriceHistory.origin, ""),
+        func.date(PriceHistory.date_collected),
+    ]
+
+def reconstruir_resumo_diario(conn):
+    # Refaz o price_daily inteiro a partir do price_history
+    chave = _chave_bruta()
+    base = select(
+        *[coluna.label(nome) for coluna, nome in zip(chave, CHAVE_DIARIA)],
+        PriceHistory.price, PriceHistory.date_collected, PriceHistory.id,
+        func.row_number().over(
+            partition_by=chave, order_by=(PriceHistory.date_collected.desc(), PriceHistory.id.desc())
+        ).label("pos"),
+    ).where(PriceHistory.price.isnot(None), PriceHistory.date_collected.isnot(None)).subquery()
+
+    ultimo = lambda coluna: func.max(case((base.c.pos == 1, coluna)))
+    colunas_chave = [base.c[nome] for nome in CHAVE_DIARIA]
+    agregado = select(
+        *colunas_chave,
+        func.count(),
+        func.sum(base.c.price),
+        func.min(base.c.price),
+        func.max(base.c.price),
+        ultimo(base.c.price),
+        ultimo(base.c.date_collected),
+        ultimo(base.c.id),
+    ).group_by(*colunas_chave)
+
+    conn.execute(delete(PriceDaily))
+    conn.execute(insert(PriceDaily).from_select(
+        CHAVE_DIARIA + ["price_count", "price_sum", "price_min", "price_max", "last_price", "last_collected", "last_id"],
+        agregado
+    ))
+
+def garantir_resumo_diario():
+    # Banco antigo (sem price_daily populado): monta o resumo uma vez no startup
+    global _pronto
+    if _pronto:
+        return
+    with engine.begin() as conn:
+        vazio = conn.execute(select(PriceDaily.id).limit(1)).first() is None
+        if vazio and conn.execute(select(PriceHistory.id).limit(1)).first() is not None:
+            reconstruir_resumo_diario(conn)
+            print("Resumo diário de preços reconstruído.")
+    _pronto = True
+
+def acumular_diario(db, linhas, primeiro_id):
+    # linhas: DataFrame recém-inserido no price_history, na ordem de inserção
+    # (ids primeiro_id, primeiro_id + 1, ...). Soma no price_daily via upsert.
+    quadro = linhas[["product_id", "competitor", "competitor_brand", "region", "origin", "price"]].copy()
+    for coluna in ("competitor", "competitor_brand", "region", "origin"):
+        quadro[coluna] = quadro[coluna].fillna("")
+    quadro["last_collected"] = pd.to_datetime(linhas["date_collected"])
+    quadro["day"] = quadro["last_collected"].dt.date
+    quadro["last_id"] = range(primeiro_id, primeiro_id + len(quadro))
+    quadro = quadro[quadro["price"].notna() & quadro["last_collected"].notna()]
+    if quadro.empty:
+        return 0
+
+    quadro = quadro.sort_values(["last_collected", "last_id"], kind="stable")
+    resumo = quadro.groupby(CHAVE_DIARIA, sort=False).agg(
+        price_count=("price", "size"),
+        price_sum=("price", "sum"),
+        price_min=("price", "min"),
+        price_max=("price", "max"),
+        last_price=("price", "last"),
+        last_collected=("last_collected", "last"),
+        last_id=("last_id", "last"),
+    ).reset_index()
+    registros = resumo.to_dict("records")
+    for registro in registros:
+        registro["last_collected"] = registro["last_collected"].to_pydatetime()
+
+    comando = sqlite_insert(PriceDaily)
+    novo = comando.excluded
+    mais_recente = tuple_(novo.last_collected, novo.last_id) > tuple_(PriceDaily.last_collected, PriceDaily.last_id)
+    comando = comando.on_conflict_do_update(
+        index_elements=CHAVE_DIARIA,
+        set_={
+            "price_count": PriceDaily.price_count + novo.price_count,
+            "price_sum": PriceDaily.price_sum + novo.price_sum,
+            "price_min": func.min(PriceDaily.price_min, novo.price_min),
+            "price_max": func.max(PriceDaily.price_max, novo.price_max),
+            "last_price": case((mais_recente, novo.last_price), else_=PriceDaily.last_price),
+            "last_collected": case((mais_recente, novo.last_collected), else_=PriceDaily.last_collected),
+            "last_id": case((mais_recente, novo.last_id), else_=PriceDaily.last_id),
+        },
+    )
+    for inicio in range(0, len(registros), TAMANHO_LOTE_DIARIO):
+        db.execute(comando, registros[inicio:inicio + TAMANHO_LOTE_DIARIO])
+    return len(registros)
+
+def _fonte_diaria(db, filtros, grupo, periodo=None):
+    # Linhas do price_daily já filtradas (filtros sem o "search")
+    query = db.query(PriceDaily).join(Product, Product.id == PriceDaily.product_id)
+    query = aplicar_filtros(query, *filtros[:-1], None, tabela=PriceDaily, periodo=periodo)
+    return query.with_entities(
+        PriceDaily.day.label("dia"),
+        grupo(PriceDaily).label("grupo"),
+        PriceDaily.price_count.label("n"),
+        PriceDaily.price_sum.label("soma"),
+        PriceDaily.price_min.label("minimo"),
+        PriceDaily.price_max.label("maximo"),
+        PriceDaily.last_price.label("ultimo"),
+        PriceDaily.last_collected.label("ultimo_em"),
+        PriceDaily.last_id.label("ultimo_id"),
+    ).subquery()
+
+def _fonte_bruta(db, filtros, grupo, periodo=None):
+    # Com "search" o filtro é por linha (índice de busca), então lê o price_history
+    query = aplicar_filtros(db.query(PriceHistory).join(Product), *filtros, periodo=periodo)
+    query = query.filter(PriceHistory.price.isnot(None), PriceHistory.date_collected.isnot(None))
+    return query.with_entities(
+        func.date(PriceHistory.date_collected).label("dia"),
+        grupo(PriceHistory).label("grupo"),
+        literal(1).label("n"),
+        PriceHistory.price.label("soma"),
+        PriceHistory.price.label("minimo"),
+        PriceHistory.price.label("maximo"),
+        PriceHistory.price.label("ultimo"),
+        PriceHistory.date_collected.label("ultimo_em"),
+        PriceHistory.id.label("ultimo_id"),
+    ).subquery()
+
+def calcular_serie(db, filtros, bucket, agrupar=None, periodo=None):
+    # filtros: (region, brand, rim, competitor, competitor_brand, origin, search)
+    # periodo: (inicio, fim) de interpretar_periodo, ou None
+    coluna = AGRUPAMENTOS.get(agrupar)
+    if coluna is None:
+        grupo = lambda tabela: literal(None, String)
+    elif isinstance(coluna, str):
+        grupo = lambda tabela: func.coalesce(getattr(tabela, coluna), "")
+    else:
+        grupo = lambda tabela: coluna
+
+    fonte = _fonte_bruta(db, filtros, grupo, periodo) if filtros[-1] else _fonte_diaria(db, filtros, grupo, periodo)
+    periodo = BUCKETS[bucket](fonte.c.dia)
+    # Uma janela só (para achar o último preço) + GROUP BY para os agregados
+    ranking = select(
+        periodo.label("periodo"), fonte.c.grupo, fonte.c.n, fonte.c.soma,
+        fonte.c.minimo, fonte.c.maximo, fonte.c.ultimo,
+        func.row_number().over(
+            partition_by=(periodo, fonte.c.grupo), order_by=(fonte.c.ultimo_em.desc(), fonte.c.ultimo_id.desc())
+        ).label("pos"),
+    ).subquery()
+    consulta = select(
+        ranking.c.periodo, ranking.c.grupo,
+        func.sum(ranking.c.n), func.sum(ranking.c.soma),
+        func.min(ranking.c.minimo), func.max(ranking.c.maximo),
+        func.max(case((ranking.c.pos == 1, ranking.c.ultimo))),
+    ).group_by(ranking.c.periodo, ranking.c.grupo).order_by(ranking.c.grupo, ranking.c.periodo)
+
+    series = {}
+    for periodo, grupo_valor, n, soma, minimo, maximo, ultimo in db.execute(consulta):
+        series.setdefault(grupo_valor, []).append({
+            "periodo": periodo,
+            "total": n,
+            "media": round(soma / n, 2) if n else 0,
+            "minimo": round(minimo, 2),
+            "maximo": round(maximo, 2),
+            "ultimo": round(ultimo, 2),
+        })
+    return [{"grupo": grupo_valor, "pontos": pontos} for grupo_valor, pontos in series.items()]
@@ -0,0 +1,670 @@
+from sqlalchemy import insert, select, update, func, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import pandas as pd
+import numpy as np
+import csv
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+from datetime import datetime
+from database import Product, PriceHistory, ImportedFile, impressao_digital, nova_versao_dados, FORMATO_DATA_IMPRESSAO
+from busca import indexar_novos, garantir_indice_busca
+from historico import acumular_diario, garantir_resumo_diario
+from ultimos_precos import atualizar_ultimos, garantir_ultimos_precos
+from gap_precos import atualizar_gap, garantir_gap
+from facetas import cache_facetas, COLUNAS_INGESTAO
+from metricas import etapa, contar_erro
+from arquivamento import impressoes_arquivadas, tem_arquivo
+from collections import Counter
+
+# --- MAPA ESPECÍFICO PARA SUA PLANILHA ---
+def identificar_colunas(df):
+    cols = list(df.columns)
+    mapa = {}
+
+    # Mapeamento direto baseado nos nomes exatos da sua planilha
+    mapeamento_exato = {
+        'ARTIGO': 'artigo',
+        'Medida': 'width',
+        'MARCA': 'marca_interna',
+        'MODELO': 'model_interno',
+        'PREÇO SELL IN': 'sell_in',
+        'Marca': 'marca_concorrente',
+        'Modelo': 'modelo_concorrente',
+        'ORIGEM': 'origin',
+        'Aro': 'rim',
+        'Preco_Sell_Out': 'price',
+        'Empresa': 'competitor',
+        'Data': 'date',
+        'MKP': 'mkp'
+    }
+
+    # Procura por correspondências exatas
+    for col in cols:
+        col_clean = str(col).strip()
+        if col_clean in mapeamento_exato:
+            mapa[mapeamento_exato[col_clean]] = col
+
+    # Fallback para nomes similares
+    fallback_map = {
+        'brand': ['marca', 'brand', 'fabricante'],
+        'model': ['modelo', 'model', 'pattern'],
+        'width': ['medida', 'dimension', 'largura'],
+        'rim': ['aro', 'rim', 'diametro'],
+        'price': ['preco_sell_out', 'preco sell out', 'sell out', 'venda'],
+        'cost': ['preco sell in', 'sell in', 'custo'],
+        'origin': ['origem', 'origin'],
+        'competitor': ['empresa', 'competitor', 'concorrente', 'loja'],
+        'mkp': ['mkp', 'markup', 'margem']
+    }
+
+    # Completa o mapa com fallback
+    for key, possiveis in fallback_map.items():
+        if key not in mapa:
+            for col in cols:
+                if any(p in str(col).lower() for p in possiveis):
+                    mapa[key] = col
+                    break
+
+    return mapa if mapa else None
+
+def limpar_aro(valor):
+    if pd.isna(valor) or str(valor).strip() == '': return "0"
+    s = str(valor).upper().replace('R', '').replace('ARO', '').strip().replace(',', '.')
+    try:
+        val_float = float(s)
+        if val_float.is_integer(): return str(int(val_float))
+        return str(val_float)
+    except:
+        nums = re.findall(r"[-+]?\d*\.\d+|\d+", s)
+        return str(int(float(nums[0]))) if nums and float(nums[0]).is_integer() else (str(nums[0]) if nums else "0")
+
+SUFIXO_EMPRESA = r'\s+(Ltda|S\.A\.?|S/A|Me|Eireli)\.?$'
+
+def limpar_empresa(nome):
+    if pd.isna(nome): return "Desconhecido"
+    nome = str(nome).strip().title()
+    return re.sub(SUFIXO_EMPRESA, '', nome, flags=re.IGNORECASE).strip()
+
+def ler_data(valor_data):
+    # None quando a célula está vazia ou não é data
+    if pd.isna(valor_data) or str(valor_data).strip() == '': return None
+    texto = str(valor_data).strip()
+    for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S']:
+        try: return datetime.strptime(texto, fmt)
+        except: continue
+    try: return pd.to_datetime(valor_data).to_pydatetime()
+    except: return None
+
+def parse_data(valor_data):
+    return ler_data(valor_data) or datetime.now()
+
+def tratar_preco(valor):
+    try:
+        valor_str = str(valor).replace('R$', '').replace(' ', '').replace(',', '.')
+        # Remove fórmulas do Excel
+        if valor_str.startswith('='):
+            return 0.0
+        return float(valor_str)
+    except:
+        return 0.0
+
+def detectar_cidade(filename):
+    # Detecção de Cidade pelo nome do arquivo
+    filename = filename.lower()
+    if "cuiaba" in filename or "cuiabá" in filename:
+        return "Cuiabá - MT", "CO"
+    elif "sp" in filename:
+        return "São Paulo - SP", "SE"
+    return "Manaus", "NO"
+
+# --- LEITURA EM STREAMING ---
+# O upload vai para disco e a planilha é lida em pedaços de tamanho fixo,
+# então a memória fica estável mesmo com exportações de centenas de MB.
+
+TAMANHO_CHUNK = 50000
+TAMANHO_AMOSTRA = 64 * 1024
+
+def salvar_upload(arquivo, nome):
+    # Copia o upload para um arquivo temporário sem carregar tudo na memória;
+    # devolve (caminho, sha256 do conteúdo)
+    sufixo = os.path.splitext(nome)[1].lower()
+    resumo = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=sufixo) as destino:
+        while bloco := arquivo.read(1024 * 1024):
+            resumo.update(bloco)
+            destino.write(bloco)
+    return destino.name, resumo.hexdigest()
+
+EXTENSOES_PLANILHA = ('.csv', '.xlsx', '.xlsm', '.xls')
+
+def extrair_zip(caminho):
+    # Cada planilha do ZIP vira um upload próprio: [(caminho, sha256, nome)].
+    # O nome fica sem as pastas (a cidade vem dele); o resto do ZIP é ignorado
+    extraidos = []
+    try:
+        with zipfile.ZipFile(caminho) as z:
+            for info in z.infolist():
+                nome = os.path.basename(info.filename)
+                if info.is_dir() or nome.startswith('.') or '__MACOSX' in info.filename:
+                    continue
+                if not nome.lower().endswith(EXTENSOES_PLANILHA):
+                    continue
+                with z.open(info) as membro:
+                    extraidos.append((*salvar_upload(membro, nome), nome))
+    except (zipfile.BadZipFile, OSError) as e:
+        for extraido, _, _ in extraidos:
+            os.remove(extraido)
+        raise ErroImportacao(f"ZIP ilegível: {str(e)}")
+    return extraidos
+
+def detectar_separador(caminho):
+    # Fareja o separador só no começo do arquivo (não no buffer inteiro)
+    with open(caminho, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        amostra = f.read(TAMANHO_AMOSTRA)
+    if len(amostra) == TAMANHO_AMOSTRA and '\n' in amostra:
+        amostra = amostra[:amostra.rindex('\n')]
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=',;\t|').delimiter
+    except csv.Error:
+        return ','
+
+def _ler_csv(caminho, tamanho_chunk):
+    sep = detectar_separador(caminho)
+    vazio = True
+    with pd.read_csv(caminho, sep=sep, chunksize=tamanho_chunk) as leitor:
+        for chunk in leitor:
+            vazio = False
+            yield chunk
+    if vazio:
+        yield pd.read_csv(caminho, sep=sep, nrows=0)
+
+def _valor_celula(celula):
+    # Mesma conversão que o pd.read_excel faz com o openpyxl
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if celula.value is None or celula.value == "":
+        return np.nan
+    if celula.data_type == TYPE_ERROR:
+        return np.nan
+    if celula.data_type == TYPE_NUMERIC:
+        inteiro = int(celula.value)
+        return inteiro if inteiro == celula.value else float(celula.value)
+    return celula.value
+
+def _cabecalho(valores):
+    colunas, vistos = [], {}
+    for i, valor in enumerate(valores):
+        nome = f"Unnamed: {i}" if pd.isna(valor) else valor
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        colunas.append(nome)
+    return colunas
+
+def _ler_xlsx(caminho, tamanho_chunk):
+    from openpyxl import load_workbook
+    wb = load_workbook(caminho, read_only=True, data_only=True, keep_links=False)
+    try:
+        linhas = wb.worksheets[0].rows
+        colunas = _cabecalho([_valor_celula(c) for c in next(linhas, [])])
+        largura = len(colunas)
+        lote, emitidos = [], 0
+        for linha in linhas:
+            valores = [_valor_celula(c) for c in linha][:largura]
+            if all(pd.isna(v) for v in valores):
+                # Linha em branco é descartada aqui. O read_excel manteria as do meio
+                # como linhas de NaN, que virariam preços vazios ("Desconhecido")
+                continue
+            valores += [np.nan] * (largura - len(valores))
+            lote.append(valores)
+            if len(lote) >= tamanho_chunk:
+                yield pd.DataFrame(lote, columns=colunas)
+                lote, emitidos = [], emitidos + 1
+        if lote or not emitidos:
+            yield pd.DataFrame(lote, columns=colunas)
+    finally:
+        wb.close()
+
+def ler_planilha(caminho, nome, tamanho_chunk=TAMANHO_CHUNK):
+    # Gera DataFrames de até tamanho_chunk linhas
+    nome = nome.lower()
+    if nome.endswith('.csv'):
+        yield from _ler_csv(caminho, tamanho_chunk)
+    elif nome.endswith(('.xlsx', '.xlsm')):
+        yield from _ler_xlsx(caminho, tamanho_chunk)
+    else:
+        # .xls e afins não têm leitura por linha; lê de uma vez
+        yield pd.read_excel(caminho)
+
+def estimar_linhas(caminho, nome):
+    # Estimativa barata do total de linhas, só para progresso/ETA
+    nome = nome.lower()
+    try:
+        if nome.endswith('.csv'):
+            with open(caminho, 'rb') as f:
+                amostra = f.read(TAMANHO_AMOSTRA)
+            linhas = amostra.count(b'\n')
+            if not linhas:
+                return None
+            return max(int(os.path.getsize(caminho) / (len(amostra) / linhas)) - 1, 0)
+        if nome.endswith(('.xlsx', '.xlsm')):
+            # <dimension ref="A1:M200001"/> fica no começo do XML da planilha
+            with zipfile.ZipFile(caminho) as z:
+                planilhas = sorted(n for n in z.namelist() if n.startswith('xl/worksheets/sheet'))
+                with z.open(planilhas[0]) as f:
+                    inicio = f.read(4096).decode('utf-8', errors='replace')
+            achou = re.search(r'<dimension ref="[A-Z]+\d+:[A-Z]+(\d+)"', inicio)
+            return int(achou.group(1)) - 1 if achou else None
+    except Exception:
+        return None
+    return None
+
+# --- LIMPEZA VETORIZADA (coluna inteira de uma vez) ---
+# Cada função abaixo reproduz exatamente a versão escalar correspondente;
+# o que o pandas não consegue converter volta para a função escalar.
+
+def _por_valor(serie, funcao):
+    # Aplica a função uma vez por valor distinto (aro, data e texto repetem muito)
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    convertidos = np.empty(len(unicos), dtype=object)
+    convertidos[:] = [funcao(v) for v in unicos]
+    return pd.Series(convertidos[codigos], index=serie.index, dtype=object)
+
+def _texto(serie):
+    # Equivalente a str(valor) linha a linha
+    return _por_valor(serie, str)
+
+def _numerica(serie):
+    return pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie)
+
+def limpar_precos(serie):
+    if _numerica(serie):
+        return serie.astype(float)
+    texto = _texto(serie).str.replace('R$', '', regex=False).str.replace(' ', '', regex=False).str.replace(',', '.', regex=False)
+    formula = texto.str.startswith('=').astype(bool)
+    valores = pd.to_numeric(texto, errors='coerce').astype(float)
+    valores[formula] = 0.0
+    resto = valores.isna() & ~formula
+    if resto.any():
+        valores[resto] = serie[resto].map(tratar_preco).astype(float)
+    return valores
+
+def _mkp_literal(valor):
+    try:
+        return float(str(valor).replace(',', '.'))
+    except:
+        return 0.0
+
+def calcular_mkp(serie, p_venda, p_custo):
+    # MKP - calcula se não existir (ou se for fórmula do Excel)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calculado = pd.Series(np.where(p_custo > 0, p_venda / p_custo - 1, 0.0), index=p_venda.index)
+    if serie is None:
+        return calculado
+    presente = serie.notna()
+    if _numerica(serie):
+        return calculado.where(~presente, serie.astype(float))
+
+    texto = _texto(serie)
+    formula = texto.str.startswith('=').astype(bool)
+    literal = pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce').astype(float)
+    resto = presente & ~formula & literal.isna()
+    if resto.any():
+        literal[resto] = serie[resto].map(_mkp_literal).astype(float)
+    return calculado.where(~presente | formula, literal)
+
+def limpar_origem(serie):
+    texto = _texto(serie).str.strip().str.upper()
+    return pd.Series(
+        np.select([texto.str.contains('NAC', regex=False), texto.str.contains('IMP', regex=False)], ['NACIONAL', 'IMPORTADO'], '-'),
+        index=serie.index, dtype=object
+    )
+
+def limpar_empresas(serie):
+    nulos = serie.isna()
+    nomes = _texto(serie).str.strip().str.title()
+    nomes = nomes.str.replace(SUFIXO_EMPRESA, '', flags=re.IGNORECASE, regex=True).str.strip()
+    nomes[nulos] = "Desconhecido"
+    return nomes
+
+def limpar_dataframe(df, mapa):
+    # Mesmas regras do antigo laço df.iterrows(), aplicadas por coluna
+    c = lambda k: mapa.get(k)
+    n = len(df)
+    constante = lambda v: pd.Series([v] * n, index=df.index, dtype=object)
+
+    limpo = pd.DataFrame(index=df.index)
+    # Extrai dados da MARCA INTERNA (Barum/Continental)
+    limpo['marca_interna'] = _texto(df[c('marca_interna')]).str.strip().str.upper() if c('marca_interna') else constante("DESCONHECIDA")
+    limpo['modelo_interno'] = _texto(df[c('model_interno')]).str.strip() if c('model_interno') else constante("PADRÃO")
+    # Extrai dados do CONCORRENTE
+    limpo['marca_concorrente'] = _texto(df[c('marca_concorrente')]).str.strip().str.upper() if c('marca_concorrente') else constante("DESCONHECIDA")
+    limpo['modelo_concorrente'] = _texto(df[c('modelo_concorrente')]).str.strip() if c('modelo_concorrente') else constante("PADRÃO")
+
+    limpo['medida'] = _texto(df[c('width')]).str.strip() if c('width') else constante("N/A")
+    limpo['aro'] = _por_valor(df[c('rim')], limpar_aro) if c('rim') else constante(limpar_aro("0"))
+    limpo['competitor'] = limpar_empresas(df[c('competitor')]) if c('competitor') else constante(limpar_empresa("Concorrente"))
+    # Sem data legível a linha fica com a hora da importação, mas a impressão digital
+    # usa a célula original (data_impressao): o reenvio reconhece a mesma linha
+    agora = datetime.now()
+    if c('date'):
+        datas = _por_valor(df[c('date')], ler_data)
+        sem_data = datas.isna()
+        limpo['data'] = datas.where(~sem_data, agora)
+        limpo['data_impressao'] = _texto(df[c('date')]).str.strip().radd(SEM_DATA).where(sem_data, None)
+    else:
+        limpo['data'] = constante(agora)
+        limpo['data_impressao'] = constante(SEM_DATA)
+    limpo['origem'] = limpar_origem(df[c('origin')]) if c('origin') else constante("-")
+
+    # Preços
+    limpo['preco'] = limpar_precos(df[c('price')])
+    limpo['sell_in'] = limpar_precos(df[c('sell_in')]) if c('sell_in') else 0.0
+    limpo['mkp'] = calcular_mkp(df[c('mkp')] if c('mkp') else None, limpo['preco'], limpo['sell_in'])
+
+    # Código único baseado na marca interna + modelo interno + medida
+    codigo = limpo['marca_interna'] + '-' + limpo['modelo_interno'] + '-' + limpo['medida']
+    limpo['unique_code'] = codigo.str.replace(" ", "", regex=False).str.replace("/", "", regex=False).str.replace("\\", "", regex=False)
+    return limpo
+
+# --- GRAVAÇÃO EM LOTE ---
+MODOS_IMPORTACAO = ("skip", "upsert")
+# Colunas que o modo "upsert" corrige numa linha já existente (as demais são
+# a própria impressão digital ou chave do resumo diário/índice de busca)
+COLUNAS_ATUALIZAVEIS = ["sell_in", "mkp"]
+LOTE_CONSULTA_IMPRESSOES = 900  # limite de parâmetros por IN no SQLite
+SEM_DATA = "sem data:"  # no lugar da data, na impressão de linha sem data legível
+
+def impressoes(linhas, datas_brutas=None):
+    # Versão por coluna de database.texto_impressao + impressao_digital.
+    # datas_brutas: texto que substitui a data onde ela não foi lida (ver limpar_dataframe)
+    datas = pd.to_datetime(linhas['date_collected']).dt.strftime(FORMATO_DATA_IMPRESSAO)
+    if datas_brutas is not None:
+        datas = datas_brutas.fillna(datas)
+    texto = (
+        linhas['product_id'].astype(str) + "|"
+        + linhas['competitor'].fillna("").astype(str) + "|"
+        + linhas['competitor_model'].fillna("").astype(str) + "|"
+        + linhas['city'].fillna("").astype(str) + "|"
+        + datas + "|"
+        + linhas['price'].map("{:.2f}".format)
+    )
+    return texto.map(impressao_digital)
+
+class IngestaoPrecos:
+    # Carrega o mapa unique_code -> id uma vez e grava produtos/preços em lote,
+    # tudo na mesma transação (commit só em concluir()). Linhas cuja impressão
+    # digital já existe são ignoradas ("skip") ou têm sell_in/mkp corrigidos ("upsert").
+
+    def __init__(self, db, cidade, regiao, tamanho_lote=5000, modo="skip"):
+        # Estruturas auxiliares prontas antes de abrir a transação de escrita
+        # (criá-las depois, por outra conexão, esperaria a trava desta)
+        garantir_indice_busca()
+        garantir_resumo_diario()
+        garantir_ultimos_precos()
+        garantir_gap()
+        self.db = db
+        self.cidade = cidade
+        self.regiao = regiao
+        self.tamanho_lote = tamanho_lote
+        self.modo = modo
+        self.produtos = dict(db.query(Product.unique_code, Product.id).all())
+        self.ha_arquivo = tem_arquivo(db)
+        self.inseridas = 0
+        self.atualizadas = 0
+        self.ignoradas = 0
+        self.rejeitadas = 0
+        self.id_inicial = None
+        self.id_final = None
+        self.produtos_tocados = set()  # células a recalcular no price_gap (ver concluir)
+        self.facetas = {nome: Counter() for nome in COLUNAS_INGESTAO}
+
+    def processar(self, df, mapa):
+        if not mapa.get('price'):
+            # Sem coluna de preço nenhuma linha é aproveitável
+            self.rejeitadas += len(df)
+            contar_erro("sem_coluna_preco", len(df))
+            return 0
+        with etapa("limpeza"):
+            limpo = limpar_dataframe(df, mapa)
+        contar_erro("preco_invalido", int((limpo['preco'].isna() | (limpo['preco'] <= 0)).sum()))
+        return self.gravar(limpo)
+
+    def _criar_produtos(self, limpo):
+        novos = limpo[~limpo['unique_code'].isin(self.produtos.keys())].drop_duplicates('unique_code')
+        if novos.empty:
+            return
+        registros = [
+            {
+                "name": f"{r.marca_interna} {r.modelo_interno} {r.medida}",
+                "marca_interna": r.marca_interna,
+                "model_interno": r.modelo_interno,
+                "marca_concorrente": r.marca_concorrente,
+                "width": r.medida,
+                "profile": "",
+                "rim": r.aro,
+                "unique_code": r.unique_code,
+            }
+            for r in novos.itertuples(index=False)
+        ]
+        for inicio in range(0, len(registros), self.tamanho_lote):
+            lote = registros[inicio:inicio + self.tamanho_lote]
+            resultado = self.db.execute(
+                insert(Product).returning(Product.unique_code, Product.id, sort_by_parameter_order=True),
+                lote
+            )
+            self.produtos.update({codigo: id_ for codigo, id_ in resultado})
+
+    def _existentes(self, chaves):
+        # impressão -> (id, sell_in, mkp) das linhas que já estão no banco (inclusive
+        # as gravadas por chunks anteriores desta mesma importação)
+        encontradas = {}
+        for inicio in range(0, len(chaves), LOTE_CONSULTA_IMPRESSOES):
+            lote = chaves[inicio:inicio + LOTE_CONSULTA_IMPRESSOES]
+            consulta = select(PriceHistory.fingerprint, PriceHistory.id, *[getattr(PriceHistory, c) for c in COLUNAS_ATUALIZAVEIS])\
+                .where(PriceHistory.fingerprint.in_(lote))
+            encontradas.update({impressao: tuple(resto) for impressao, *resto in self.db.execute(consulta)})
+        return encontradas
+
+    def _atualizar(self, repetidas, existentes):
+        atual = pd.DataFrame.from_dict(existentes, orient='index', columns=["id"] + COLUNAS_ATUALIZAVEIS)
+        atual = atual.loc[repetidas['fingerprint']].set_index(repetidas.index)
+        mudou = pd.Series(False, index=repetidas.index)
+        for coluna in COLUNAS_ATUALIZAVEIS:
+            mudou |= ~np.isclose(repetidas[coluna].astype(float), atual[coluna].astype(float), equal_nan=True)
+        if not mudou.any():
+            return 0
+        registros = [
+            {"id_linha": int(id_), **{c: float(v) for c, v in zip(COLUNAS_ATUALIZAVEIS, valores)}}
+            for id_, *valores in zip(atual.loc[mudou, "id"], *[repetidas.loc[mudou, c] for c in COLUNAS_ATUALIZAVEIS])
+        ]
+        comando = update(PriceHistory).where(PriceHistory.id == bindparam("id_linha"))\
+            .values({c: bindparam(c) for c in COLUNAS_ATUALIZAVEIS})
+        for inicio in range(0, len(registros), self.tamanho_lote):
+            self.db.connection().execute(comando, registros[inicio:inicio + self.tamanho_lote])
+        self.produtos_tocados.update(repetidas.loc[mudou, 'product_id'].tolist())
+        return len(registros)
+
+    def gravar(self, limpo):
+        if limpo.empty:
+            return 0
+        with etapa("produtos"):
+            self._criar_produtos(limpo)
+        with etapa("insercao"):
+            return self._inserir(limpo)
+
+    def _inserir(self, limpo):
+        linhas = pd.DataFrame({
+            "product_id": limpo['unique_code'].map(self.produtos),
+            "competitor": limpo['competitor'],
+            "competitor_brand": limpo['marca_concorrente'],
+            "competitor_model": limpo['modelo_concorrente'],
+            "price": limpo['preco'],
+            "sell_in": limpo['sell_in'],
+            "origin": limpo['origem'],
+            "mkp": limpo['mkp'],
+            "region": self.regiao,
+            "city": self.cidade,
+            "date_collected": limpo['data'],
+            "source": "UPLOAD",
+        })
+        linhas['fingerprint'] = impressoes(linhas, limpo.get('data_impressao'))
+
+        # Linha repetida dentro do próprio arquivo: vale a última ocorrência
+        unicas = linhas.drop_duplicates('fingerprint', keep='last')
+        self.ignoradas += len(linhas) - len(unicas)
+        if self.ha_arquivo:
+            # Já movida para o arquivo Parquet: não volta para a tabela quente (nem no "upsert")
+            arquivadas = unicas['fingerprint'].isin(impressoes_arquivadas(self.db, unicas['fingerprint'].tolist()))
+            self.ignoradas += int(arquivadas.sum())
+            unicas = unicas[~arquivadas]
+        existentes = self._existentes(unicas['fingerprint'].tolist())
+        ja_gravada = unicas['fingerprint'].isin(existentes.keys())
+        novas = unicas[~ja_gravada]
+        repetidas = unicas[ja_gravada]
+
+        if len(repetidas):
+            atualizadas = self._atualizar(repetidas, existentes) if self.modo == "upsert" else 0
+            self.atualizadas += atualizadas
+            self.ignoradas += len(repetidas) - atualizadas
+
+        if novas.empty:
+            return 0
+        registros = novas.to_dict('records')
+        if self.id_inicial is None:
+            # Ids acima deste são desta importação (usado para o índice de busca)
+            self.id_inicial = self.db.execute(select(func.max(PriceHistory.id))).scalar() or 0
+        for inicio in range(0, len(registros), self.tamanho_lote):
+            self.db.execute(insert(PriceHistory), registros[inicio:inicio + self.tamanho_lote])
+        # A transação segura o lock de escrita, então os ids saem em sequência
+        acumular_diario(self.db, novas, self.id_inicial + self.inseridas + 1)
+        atualizar_ultimos(self.db, novas, self.id_inicial + self.inseridas + 1)
+        self.produtos_tocados.update(novas['product_id'].tolist())
+        self.inseridas += len(registros)
+        novas_limpas = limpo.loc[novas.index]
+        for nome, coluna in COLUNAS_INGESTAO.items():
+            self.facetas[nome].update(novas_limpas[coluna].value_counts().to_dict())
+        return len(registros)
+
+    def concluir(self):
+        self.fechar()
+        # Mediana não se acumula linha a linha: as células tocadas são relidas uma
+        # vez no fim (a importação em lote faz o mesmo em jobs._confirmar)
+        atualizar_gap(self.db, self.produtos_tocados)
+        self.db.commit()
+        self.publicar()
+
+    def fechar(self):
+        # Índice de busca das linhas novas e versão dos dados (cache de respostas de
+        # todos os workers), na mesma transação (antes do commit)
+        if self.id_inicial is not None:
+            indexar_novos(self.db, self.id_inicial)
+            self.id_final = self.db.execute(select(func.max(PriceHistory.id))).scalar()
+        if self.id_inicial is not None or self.atualizadas:
+            nova_versao_dados(self.db)
+
+    def publicar(self):
+        # Depois do commit. A importação em lote (jobs.py) fecha vários arquivos
+        # numa transação só e publica cada um, na ordem, depois do commit
+        if self.id_inicial is None:
+            return
+        # Valores novos dos filtros entram no cache sem refazer os SELECT DISTINCT
+        cache_facetas.registrar(self.facetas, self.id_inicial, self.id_final)
+
+class ErroImportacao(Exception):
+    pass
+
+def arquivo_importado(db, sha256, nome):
+    # Mesmo conteúdo já importado para a mesma cidade (a cidade vem do nome)
+    cidade, _ = detectar_cidade(nome)
+    return db.query(ImportedFile).filter(ImportedFile.sha256 == sha256, ImportedFile.city == cidade).first()
+
+def importar_planilha(db, caminho, nome, progresso=None, modo="skip", sha256=None):
+    # Lê, limpa e grava a planilha inteira; progresso(linhas_lidas, ingestao) a cada chunk
+    cidade_arq, regiao_arq = detectar_cidade(nome)
+    chunks = ler_planilha(caminho, nome)
+    try:
+        with etapa("parse"):
+            df = next(chunks)
+    except Exception as e:
+        raise ErroImportacao(f"Arquivo ilegível: {str(e)}")
+
+    with etapa("mapeamento"):
+        mapa = identificar_colunas(df)
+    if not mapa:
+        raise ErroImportacao("Colunas não identificadas.")
+
+    # Limpeza por coluna + gravação em lote numa única transação
+    ingestao = IngestaoPrecos(db, cidade_arq, regiao_arq, modo=modo)
+    try:
+        while df is not None:
+            ingestao.processar(df, mapa)
+            if progresso:
+                progresso(len(df), ingestao)
+            with etapa("parse"):
+                df = next(chunks, None)
+    except Exception as e:
+        db.rollback()
+        raise ErroImportacao(f"Arquivo ilegível: {str(e)}")
+    registrar_arquivo(db, ingestao, sha256, nome)
+    with etapa("commit"):
+        ingestao.concluir()
+    return ingestao
+
+def registrar_arquivo(db, ingestao, sha256, nome):
+    # Registrado no mesmo commit das linhas; o próximo envio idêntico nem é lido
+    if sha256:
+        db.execute(sqlite_insert(ImportedFile).values(
+            sha256=sha256, city=ingestao.cidade, filename=nome, imported_at=datetime.utcnow(),
+            rows_new=ingestao.inseridas, rows_updated=ingestao.atualizadas, rows_skipped=ingestao.ignoradas,
+        ).on_conflict_do_nothing())
+
+# --- LIMPEZA SEM BANCO (pool de processos da importação em lote) ---
+# Leitura, mapeamento, limpeza e a deduplicação dentro do arquivo não dependem
+# do banco, então rodam em paralelo; só a gravação passa pelo escritor único.
+
+# Mesmos campos da impressão digital, com unique_code no lugar do product_id
+CHAVE_REPETIDA = ['unique_code', 'competitor', 'modelo_concorrente', 'data', 'preco']
+
+class PlanilhaLimpa:
+    def __init__(self, limpo, linhas_lidas, rejeitadas, preco_invalido, repetidas):
+        self.limpo = limpo
+        self.linhas_lidas = linhas_lidas
+        self.rejeitadas = rejeitadas
+        self.preco_invalido = preco_invalido
+        self.repetidas = repetidas
+
+def limpar_planilha(caminho, nome):
+    chunks = ler_planilha(caminho, nome)
+    try:
+        df = next(chunks)
+    except Exception as e:
+        raise ErroImportacao(f"Arquivo ilegível: {str(e)}")
+    mapa = identificar_colunas(df)
+    if not mapa:
+        raise ErroImportacao("Colunas não identificadas.")
+
+    partes, lidas = [], 0
+    try:
+        while df is not None:
+            lidas += len(df)
+            if mapa.get('price'):
+                partes.append(limpar_dataframe(df, mapa))
+            df = next(chunks, None)
+    except Exception as e:
+        raise ErroImportacao(f"Arquivo ilegível: {str(e)}")
+    if not partes:
+        # Sem coluna de preço nenhuma linha é aproveitável
+        return PlanilhaLimpa(pd.DataFrame(), lidas, lidas, 0, 0)
+    limpo = pd.concat(partes) if len(partes) > 1 else partes[0]
+    limpo.index = pd.RangeIndex(len(limpo))
+    preco_invalido = int((limpo['preco'].isna() | (limpo['preco'] <= 0)).sum())
+    # Linha repetida dentro do próprio arquivo: vale a última ocorrência (como em _inserir)
+    # (sem data legível compara a célula original, como a impressão digital)
+    chave = limpo[CHAVE_REPETIDA].assign(data=limpo['data_impressao'].fillna(limpo['data']))
+    unicas = limpo[~chave.duplicated(keep='last')]
+    return PlanilhaLimpa(unicas, lidas, 0, preco_invalido, len(limpo) - len(unicas))
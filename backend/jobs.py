@@ -0,0 +1,376 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from database import SessionLocal, trava_escrita
+from ingest import importar_planilha, detectar_cidade, limpar_planilha, registrar_arquivo, IngestaoPrecos, ErroImportacao, TAMANHO_CHUNK
+from busca import garantir_indice_busca
+from historico import garantir_resumo_diario
+from ultimos_precos import garantir_ultimos_precos
+from gap_precos import atualizar_gap, garantir_gap
+from metricas import metricas, medicao, etapa, contar_erro
+
+# --- FILA DE IMPORTAÇÃO EM SEGUNDO PLANO ---
+# O /upload só grava o arquivo em disco e devolve um job_id; a leitura e os
+# inserts rodam num pool de threads, fora do event loop do FastAPI.
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_MAX_FILA = int(os.getenv("IMPORT_MAX_FILA", "8"))
+JOBS_GUARDADOS = 200
+# Importação em lote: processos que leem/limpam as planilhas em paralelo e
+# quantas linhas o escritor único acumula antes de cada commit
+IMPORT_PROCESSOS = int(os.getenv("IMPORT_PROCESSOS", "0")) or os.cpu_count() or 1
+LOTE_COMMIT_LINHAS = int(os.getenv("LOTE_COMMIT_LINHAS", "200000"))
+
+class ImportJob:
+    def __init__(self, arquivo):
+        self.id = uuid.uuid4().hex
+        self.arquivo = arquivo
+        self.local = detectar_cidade(arquivo)[0]
+        self.status = "na_fila"
+        self.mensagem = ""
+        self.linhas_lidas = 0
+        self.inseridas = 0
+        self.atualizadas = 0
+        self.ignoradas = 0
+        self.rejeitadas = 0
+        self.modo = "skip"
+        self.sha256 = None
+        self.total_estimado = None
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.finalizado_em = None
+        self.medicao = None  # etapas e consultas SQL (metricas.Medicao)
+
+    def atualizar(self, linhas, ingestao):
+        self.linhas_lidas += linhas
+        self.inseridas = ingestao.inseridas
+        self.atualizadas = ingestao.atualizadas
+        self.ignoradas = ingestao.ignoradas
+        self.rejeitadas = ingestao.rejeitadas
+
+    def resumo(self):
+        fim = self.finalizado_em or time.time()
+        decorrido = (fim - self.iniciado_em) if self.iniciado_em else 0.0
+        velocidade = self.linhas_lidas / decorrido if decorrido > 0 else 0.0
+
+        eta = None
+        if self.status == "processando" and velocidade > 0 and self.total_estimado:
+            eta = round(max(self.total_estimado - self.linhas_lidas, 0) / velocidade, 1)
+        elif self.status in ("concluido", "erro"):
+            eta = 0
+
+        return {
+            "job_id": self.id,
+            "arquivo": self.arquivo,
+            "local": self.local,
+            "status": self.status,
+            "mensagem": self.mensagem,
+            "linhas_lidas": self.linhas_lidas,
+            "modo": self.modo,
+            "inseridas": self.inseridas,
+            "atualizadas": self.atualizadas,
+            "ignoradas": self.ignoradas,
+            "rejeitadas": self.rejeitadas,
+            "total_estimado": self.total_estimado,
+            "linhas_por_segundo": round(velocidade, 1),
+            "eta_segundos": eta,
+            "tempo_decorrido": round(decorrido, 2),
+            **(self.medicao.resumo() if self.medicao else {}),
+        }
+
+class LoteImportacao:
+    # Vários arquivos (ou um ZIP) num job só; cada arquivo tem o seu ImportJob
+    def __init__(self, jobs, modo="skip"):
+        self.id = uuid.uuid4().hex
+        self.arquivos = jobs
+        self.modo = modo
+        self.status = "na_fila"
+        self.mensagem = ""
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.finalizado_em = None
+        self.medicao = None
+
+    def resumo(self):
+        fim = self.finalizado_em or time.time()
+        decorrido = (fim - self.iniciado_em) if self.iniciado_em else 0.0
+        arquivos = [job.resumo() for job in self.arquivos]
+        total = lambda campo: sum(arquivo[campo] for arquivo in arquivos)
+        return {
+            "job_id": self.id,
+            "lote": True,
+            "status": self.status,
+            "mensagem": self.mensagem,
+            "modo": self.modo,
+            "total_arquivos": len(arquivos),
+            "concluidos": sum(arquivo["status"] == "concluido" for arquivo in arquivos),
+            "com_erro": sum(arquivo["status"] == "erro" for arquivo in arquivos),
+            "linhas_lidas": total("linhas_lidas"),
+            "inseridas": total("inseridas"),
+            "atualizadas": total("atualizadas"),
+            "ignoradas": total("ignoradas"),
+            "rejeitadas": total("rejeitadas"),
+            "linhas_por_segundo": round(total("linhas_lidas") / decorrido, 1) if decorrido > 0 else 0.0,
+            "tempo_decorrido": round(decorrido, 2),
+            "arquivos": arquivos,
+            **(self.medicao.resumo() if self.medicao else {}),
+        }
+
+_processos = None
+_processos_lock = threading.Lock()
+
+def pool_processos():
+    # Criado na primeira importação em lote. "spawn" em todo sistema: fork
+    # copiaria as threads e conexões SQLite do servidor para os filhos
+    global _processos
+    with _processos_lock:
+        if _processos is None:
+            _processos = ProcessPoolExecutor(max_workers=IMPORT_PROCESSOS, mp_context=multiprocessing.get_context("spawn"))
+        return _processos
+
+def descartar_pool(pool):
+    # Um processo que morre (OOM, segfault no openpyxl/pyarrow) quebra o pool inteiro
+    # (BrokenProcessPool); o próximo pool_processos() cria outro. Compara com o pool
+    # que falhou para dois lotes não descartarem um pool novo
+    global _processos
+    with _processos_lock:
+        if _processos is pool:
+            _processos = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def ler_em_processo(caminho, arquivo):
+    # Devolve (pool, futuro): quem recebe o BrokenProcessPool descarta o pool que falhou
+    pool = pool_processos()
+    try:
+        return pool, pool.submit(limpar_planilha, caminho, arquivo)
+    except BrokenProcessPool:
+        descartar_pool(pool)
+        pool = pool_processos()
+        return pool, pool.submit(limpar_planilha, caminho, arquivo)
+
+class FilaImportacao:
+    def __init__(self, workers=IMPORT_WORKERS, max_fila=IMPORT_MAX_FILA):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="importacao")
+        self.max_fila = max_fila
+        self.jobs = OrderedDict()
+        self.pendentes = 0
+        self.lock = threading.Lock()
+
+    def enviar(self, caminho, arquivo, total_estimado=None, modo="skip", sha256=None):
+        # Devolve None quando a fila está cheia (quem chama responde 429)
+        with self.lock:
+            if self.pendentes >= self.max_fila:
+                return None
+            self.pendentes += 1
+            job = self._novo_job(arquivo, total_estimado, modo, sha256)
+        self.executor.submit(self._executar, job, caminho)
+        return job
+
+    def enviar_lote(self, arquivos, modo="skip"):
+        # arquivos: [(caminho, nome, total_estimado, sha256)]; o lote ocupa uma vaga da fila
+        with self.lock:
+            if self.pendentes >= self.max_fila:
+                return None
+            self.pendentes += 1
+            jobs = [self._novo_job(nome, total, modo, sha256) for _, nome, total, sha256 in arquivos]
+            lote = LoteImportacao(jobs, modo)
+            self._guardar(lote)
+        self.executor.submit(self._executar_lote, lote, [caminho for caminho, _, _, _ in arquivos])
+        return lote
+
+    def _novo_job(self, arquivo, total_estimado, modo, sha256):
+        job = ImportJob(arquivo)
+        job.total_estimado = total_estimado
+        job.modo = modo
+        job.sha256 = sha256
+        self._guardar(job)
+        return job
+
+    def _guardar(self, job):
+        self.jobs[job.id] = job
+        while len(self.jobs) > JOBS_GUARDADOS:
+            self.jobs.popitem(last=False)
+
+    def obter(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _executar(self, job, caminho):
+        with medicao() as atual:
+            job.medicao = atual
+            self._importar(job, caminho)
+        self._contabilizar(job)
+
+    def _contabilizar(self, job):
+        metricas.somar("tireforce_importacoes_total", 1, "Importações finalizadas", status=job.status)
+        for resultado, quantidade in (("inserida", job.inseridas), ("atualizada", job.atualizadas),
+                                      ("ignorada", job.ignoradas), ("rejeitada", job.rejeitadas)):
+            metricas.somar("tireforce_importacao_linhas_total", quantidade, "Linhas importadas, por resultado", resultado=resultado)
+        if job.iniciado_em:
+            metricas.observar("tireforce_importacao_segundos", job.finalizado_em - job.iniciado_em, "Duração das importações (sem a espera na fila)")
+
+    def _importar(self, job, caminho):
+        # Escritor único: o job fica "na_fila" até a importação anterior fazer commit
+        with etapa("espera_escrita"):
+            trava_escrita.acquire()
+        db = SessionLocal()
+        job.status = "processando"
+        job.iniciado_em = time.time()
+        try:
+            ingestao = importar_planilha(db, caminho, job.arquivo, progresso=job.atualizar, modo=job.modo, sha256=job.sha256)
+            job.atualizar(0, ingestao)
+            job.status = "concluido"
+            job.mensagem = (
+                f"{ingestao.inseridas} registros importados ({ingestao.atualizadas} atualizados, "
+                f"{ingestao.ignoradas} já existentes). Local: {job.local}"
+            )
+        except ErroImportacao as e:
+            job.status = "erro"
+            job.mensagem = str(e)
+        except Exception as e:
+            job.status = "erro"
+            job.mensagem = f"Erro inesperado na importação: {str(e)}"
+        finally:
+            job.finalizado_em = time.time()
+            db.close()
+            trava_escrita.release()
+            os.remove(caminho)
+            with self.lock:
+                self.pendentes -= 1
+
+
+    def _executar_lote(self, lote, caminhos):
+        with medicao() as atual:
+            lote.medicao = atual
+            self._importar_lote(lote, caminhos)
+        for job in lote.arquivos:
+            self._contabilizar(job)
+
+    def _importar_lote(self, lote, caminhos):
+        # Os processos leem e limpam os arquivos em paralelo; esta thread é o
+        # escritor único: grava cada arquivo assim que fica pronto (num SAVEPOINT,
+        # para um arquivo ruim não derrubar os outros) e faz commit a cada
+        # LOTE_COMMIT_LINHAS linhas gravadas. No máximo IMPORT_PROCESSOS arquivos
+        # em voo: cada DataFrame limpo é gravado e solto antes de entrar o próximo,
+        # então a memória não cresce com o número de arquivos do lote. Se o pool
+        # quebrar, os arquivos em voo são relidos uma vez num pool novo
+        lote.status = "processando"
+        lote.iniciado_em = time.time()
+        for job in lote.arquivos:
+            job.status = "processando"
+            job.iniciado_em = lote.iniciado_em
+        db = None
+        pendentes, linhas_pendentes = [], 0  # gravados e ainda sem commit
+        try:
+            restantes = list(zip(lote.arquivos, caminhos))
+            futuros, tentativas = {}, {}
+            while restantes or futuros:
+                planilha = futuro = None  # solta o arquivo anterior antes de ler outro
+                while restantes and len(futuros) < IMPORT_PROCESSOS:
+                    job, caminho = restantes.pop(0)
+                    tentativas[job.id] = tentativas.get(job.id, 0) + 1
+                    pool, futuro = ler_em_processo(caminho, job.arquivo)
+                    futuros[futuro] = (job, caminho, pool)
+                futuro = next(iter(wait(futuros, return_when=FIRST_COMPLETED).done))
+                job, caminho, pool = futuros.pop(futuro)
+                try:
+                    planilha = futuro.result()
+                except BrokenProcessPool as e:
+                    descartar_pool(pool)
+                    if tentativas[job.id] < 2:
+                        restantes.append((job, caminho))
+                    else:
+                        self._falhar(job, f"O processo de leitura foi interrompido ({e}).")
+                    continue
+                except Exception as e:
+                    self._falhar(job, e)
+                    continue
+                if db is None:
+                    # Estruturas auxiliares antes de abrir a transação de escrita
+                    garantir_indice_busca()
+                    garantir_resumo_diario()
+                    garantir_ultimos_precos()
+                    garantir_gap()
+                    with etapa("espera_escrita"):
+                        trava_escrita.acquire()
+                    db = SessionLocal()
+                try:
+                    with db.begin_nested():
+                        ingestao = self._gravar_arquivo(db, job, planilha, lote.modo)
+                except Exception as e:
+                    self._falhar(job, e)
+                    continue
+                pendentes.append((job, ingestao))
+                linhas_pendentes += len(planilha.limpo)
+                if linhas_pendentes >= LOTE_COMMIT_LINHAS:
+                    self._confirmar(db, pendentes)
+                    pendentes, linhas_pendentes = [], 0
+            if pendentes:
+                self._confirmar(db, pendentes)
+            falhas = sum(job.status == "erro" for job in lote.arquivos)
+            lote.status = "erro" if falhas == len(lote.arquivos) else "concluido"
+            lote.mensagem = f"{len(lote.arquivos) - falhas} de {len(lote.arquivos)} arquivos importados."
+        except Exception as e:
+            if db is not None:
+                db.rollback()
+            for job, _ in pendentes:
+                self._falhar(job, e)
+            lote.status = "erro"
+            lote.mensagem = f"Erro inesperado na importação: {str(e)}"
+        finally:
+            lote.finalizado_em = time.time()
+            for job in lote.arquivos:
+                if job.status == "processando":
+                    self._falhar(job, "importação interrompida")
+            if db is not None:
+                db.close()
+                trava_escrita.release()
+            for caminho in caminhos:
+                os.remove(caminho)
+            with self.lock:
+                self.pendentes -= 1
+
+    def _gravar_arquivo(self, db, job, planilha, modo):
+        cidade, regiao = detectar_cidade(job.arquivo)
+        ingestao = IngestaoPrecos(db, cidade, regiao, modo=modo)
+        ingestao.rejeitadas = planilha.rejeitadas
+        ingestao.ignoradas = planilha.repetidas
+        contar_erro("sem_coluna_preco", planilha.rejeitadas)
+        contar_erro("preco_invalido", planilha.preco_invalido)
+        job.atualizar(planilha.linhas_lidas - len(planilha.limpo), ingestao)
+        for inicio in range(0, len(planilha.limpo), TAMANHO_CHUNK):
+            parte = planilha.limpo.iloc[inicio:inicio + TAMANHO_CHUNK]
+            ingestao.gravar(parte)
+            job.atualizar(len(parte), ingestao)
+        registrar_arquivo(db, ingestao, job.sha256, job.arquivo)
+        ingestao.fechar()
+        return ingestao
+
+    def _confirmar(self, db, pendentes):
+        # Células do price_gap tocadas por qualquer arquivo do commit, recalculadas uma vez só
+        with etapa("gap_precos"):
+            atualizar_gap(db, set().union(*(ingestao.produtos_tocados for _, ingestao in pendentes)))
+        with etapa("commit"):
+            db.commit()
+        for job, ingestao in pendentes:
+            ingestao.publicar()
+            job.status = "concluido"
+            job.finalizado_em = time.time()
+            job.mensagem = (
+                f"{ingestao.inseridas} registros importados ({ingestao.atualizadas} atualizados, "
+                f"{ingestao.ignoradas} já existentes). Local: {job.local}"
+            )
+
+    def _falhar(self, job, erro):
+        job.status = "erro"
+        job.finalizado_em = time.time()
+        if isinstance(erro, (ErroImportacao, str)):
+            job.mensagem = str(erro)
+        else:
+            job.mensagem = f"Erro inesperado na importação: {str(erro)}"
+
+fila_importacao = FilaImportacao()
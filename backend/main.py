@@ -1,15 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, Depends
+from fastapi import FastAPI, UploadFile, File, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, or_
+from sqlalchemy import desc
+from contextlib import nullcontext
 from pydantic import BaseModel
-import pandas as pd
-import io
-import re
-from datetime import datetime
-from database import SessionLocal, User, Product, PriceHistory, Base, engine
+from typing import List
+import os
+from database import SessionLeitura, User, Product, PriceHistory, Base, engine, versao_dados
+from ingest import salvar_upload, extrair_zip, estimar_linhas, arquivo_importado, ErroImportacao, MODOS_IMPORTACAO
+from jobs import fila_importacao
+from busca import garantir_indice_busca
+from historico import garantir_resumo_diario, calcular_serie, BUCKETS, AGRUPAMENTOS
+from ultimos_precos import garantir_ultimos_precos
+from gap_precos import garantir_gap
+from arquivamento import historico_completo, janela_padrao, versao_arquivo
+from facetas import cache_facetas
+from cache import cache_respostas
+from export import EXPORTADORES, FORMATOS
+from metricas import metricas, etapa, MedirRequisicoes
+from serializacao import para_json, colunar, escolher_codificacao, comprimir
+from consultas import aplicar_filtros, normalizar_filtros, escolher_campos, interpretar_ordem, paginar, paginar_tuplas, contar, calcular_resumo, calcular_indicadores, calcular_indicadores_diarios, calcular_gap_precos, calcular_gap_resumido, verificar_planos, interpretar_periodo, ParametroInvalido, LIMITE_PADRAO, LIMITE_MAXIMO
 
 Base.metadata.create_all(bind=engine)
+garantir_indice_busca()
+garantir_resumo_diario()
+garantir_ultimos_precos()
+garantir_gap()
+
+# Opcional: confere no startup se os filtros padrão estão usando índice
+if os.getenv("TIREFORCE_CHECK_PLANS"):
+    with SessionLeitura() as _db:
+        for _filtros, _plano, _varreduras, _ordenacoes in verificar_planos(_db):
+            if _varreduras:
+                print(f"AVISO: varredura completa em {_filtros}: {_varreduras}")
+            if _ordenacoes:
+                print(f"AVISO: ordenação temporária na página de {_filtros}: {_ordenacoes}")
 
 app = FastAPI()
 
@@ -19,66 +46,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Consultas-SQL", "X-Profile"],
 )
+# Tempo, etapas (Server-Timing) e consultas SQL por requisição; ver metricas.py
+app.add_middleware(MedirRequisicoes)
+
+_versao_arquivo = versao_arquivo()
+
+def acompanhar_dados(request, db):
+    # Versão dos dados desta requisição, lida na própria sessão (mesmo snapshot das
+    # consultas): data_version do banco + marcador do arquivo Parquet. Vale entre
+    # workers do uvicorn e para o arquivamento, que roda fora do servidor (cron)
+    global _versao_arquivo
+    arquivo = versao_arquivo()
+    if arquivo != _versao_arquivo:
+        # max(id) não muda ao arquivar: as facetas precisam ser avisadas
+        _versao_arquivo = arquivo
+        cache_facetas.invalidar()
+    request.state.versao_dados = (versao_dados(db), arquivo or 0)
+    cache_respostas.sincronizar(request.state.versao_dados)
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    # Rotas só leem; a gravação é feita pela fila de importação (jobs.py)
+    db = SessionLeitura()
     try:
+        acompanhar_dados(request, db)
         yield db
     finally:
         db.close()
 
-# --- MAPA ESPECÍFICO PARA SUA PLANILHA ---
-def identificar_colunas(df):
-    cols = list(df.columns)
-    mapa = {}
-    
-    # Mapeamento direto baseado nos nomes exatos da sua planilha
-    mapeamento_exato = {
-        'ARTIGO': 'artigo',
-        'Medida': 'width',
-        'MARCA': 'marca_interna',
-        'MODELO': 'model_interno',
-        'PREÇO SELL IN': 'sell_in',
-        'Marca': 'marca_concorrente',
-        'Modelo': 'modelo_concorrente',
-        'ORIGEM': 'origin',
-        'Aro': 'rim',
-        'Preco_Sell_Out': 'price',
-        'Empresa': 'competitor',
-        'Data': 'date',
-        'MKP': 'mkp'
-    }
-    
-    # Procura por correspondências exatas
-    for col in cols:
-        col_clean = str(col).strip()
-        if col_clean in mapeamento_exato:
-            mapa[mapeamento_exato[col_clean]] = col
-    
-    # Fallback para nomes similares
-    fallback_map = {
-        'brand': ['marca', 'brand', 'fabricante'],
-        'model': ['modelo', 'model', 'pattern'],
-        'width': ['medida', 'dimension', 'largura'],
-        'rim': ['aro', 'rim', 'diametro'],
-        'price': ['preco_sell_out', 'preco sell out', 'sell out', 'venda'],
-        'cost': ['preco sell in', 'sell in', 'custo'],
-        'origin': ['origem', 'origin'],
-        'competitor': ['empresa', 'competitor', 'concorrente', 'loja'],
-        'mkp': ['mkp', 'markup', 'margem']
-    }
-    
-    # Completa o mapa com fallback
-    for key, possiveis in fallback_map.items():
-        if key not in mapa:
-            for col in cols:
-                if any(p in str(col).lower() for p in possiveis):
-                    mapa[key] = col
-                    break
-    
-    return mapa if mapa else None
-
 ESTADO_PARA_REGIAO = {
     'MT': 'CO', 'MS': 'CO', 'GO': 'CO', 'DF': 'CO',
     'AM': 'NO', 'PA': 'NO', 'RO': 'NO', 'RR': 'NO', 'AC': 'NO', 'TO': 'NO', 'AP': 'NO',
@@ -87,41 +83,6 @@ ESTADO_PARA_REGIAO = {
     'BA': 'NE', 'PE': 'NE', 'CE': 'NE' 
 }
 
-def limpar_aro(valor):
-    if pd.isna(valor) or str(valor).strip() == '': return "0"
-    s = str(valor).upper().replace('R', '').replace('ARO', '').strip().replace(',', '.')
-    try:
-        val_float = float(s)
-        if val_float.is_integer(): return str(int(val_float))
-        return str(val_float)
-    except:
-        nums = re.findall(r"[-+]?\d*\.\d+|\d+", s)
-        return str(int(float(nums[0]))) if nums and float(nums[0]).is_integer() else (str(nums[0]) if nums else "0")
-
-def limpar_empresa(nome):
-    if pd.isna(nome): return "Desconhecido"
-    nome = str(nome).strip().title()
-    return re.sub(r'\s+(Ltda|S\.A\.?|S/A|Me|Eireli)\.?$', '', nome, flags=re.IGNORECASE).strip()
-
-def parse_data(valor_data):
-    if pd.isna(valor_data) or str(valor_data).strip() == '': return datetime.now()
-    texto = str(valor_data).strip()
-    for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S']:
-        try: return datetime.strptime(texto, fmt)
-        except: continue
-    try: return pd.to_datetime(valor_data).to_pydatetime()
-    except: return datetime.now()
-
-def tratar_preco(valor):
-    try: 
-        valor_str = str(valor).replace('R$', '').replace(' ', '').replace(',', '.')
-        # Remove fórmulas do Excel
-        if valor_str.startswith('='):
-            return 0.0
-        return float(valor_str)
-    except: 
-        return 0.0
-
 class LoginRequest(BaseModel):
     email: str
     password: str
@@ -134,173 +95,126 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
     return {"status": "sucesso", "user": user.email, "company": user.company}
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    contents = await file.read()
-    filename = file.filename.lower()
-    
-    # Detecção de Cidade
-    cidade_arq, regiao_arq = "Manaus", "NO"
-    if "cuiaba" in filename or "cuiabá" in filename: 
-        cidade_arq, regiao_arq = "Cuiabá - MT", "CO"
-    elif "sp" in filename: 
-        cidade_arq, regiao_arq = "São Paulo - SP", "SE"
+def upload_file(file: UploadFile = File(...), mode: str = "skip", db: Session = Depends(get_db)):
+    # Upload vai para disco; leitura e gravação rodam na fila em segundo plano.
+    # mode: "skip" ignora linhas já importadas, "upsert" corrige sell_in/mkp delas
+    if mode not in MODOS_IMPORTACAO:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": f"Modo inválido: {mode}. Use {', '.join(MODOS_IMPORTACAO)}."})
+    with etapa("leitura"):
+        caminho, sha256 = salvar_upload(file.file, file.filename)
+    anterior = arquivo_importado(db, sha256, file.filename)
+    if anterior:
+        # Reenvio idêntico: nada a ler nem gravar
+        os.remove(caminho)
+        total = anterior.rows_new + anterior.rows_updated + anterior.rows_skipped
+        return {
+            "status": "sucesso", "duplicado": True, "inseridas": 0, "atualizadas": 0, "ignoradas": total,
+            "mensagem": f"Arquivo idêntico já importado em {anterior.imported_at:%d/%m/%Y %H:%M} ({anterior.filename}). Nada a fazer.",
+        }
+    job = fila_importacao.enviar(caminho, file.filename, estimar_linhas(caminho, file.filename), mode, sha256)
+    if not job:
+        os.remove(caminho)
+        return JSONResponse(status_code=429, content={"status": "erro", "message": "Fila de importação cheia. Tente novamente em instantes."})
+    return {"status": "sucesso", "job_id": job.id, "mensagem": f"Importação de {file.filename} iniciada. Local: {job.local}"}
 
+@app.post("/upload/batch")
+def upload_batch(files: List[UploadFile] = File(...), mode: str = "skip", db: Session = Depends(get_db)):
+    # Várias planilhas (e/ou ZIPs com planilhas) numa importação só: leitura e limpeza
+    # em paralelo num pool de processos, gravação pelo escritor único (jobs.py).
+    # A cidade continua vindo do nome de cada arquivo; o resultado sai por arquivo.
+    if mode not in MODOS_IMPORTACAO:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": f"Modo inválido: {mode}. Use {', '.join(MODOS_IMPORTACAO)}."})
+    arquivos = []  # (caminho, sha256, nome)
     try:
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents), sep=None, engine='python')
+        with etapa("leitura"):
+            for file in files:
+                caminho, sha256 = salvar_upload(file.file, file.filename)
+                if not file.filename.lower().endswith(".zip"):
+                    arquivos.append((caminho, sha256, file.filename))
+                    continue
+                try:
+                    arquivos.extend(extrair_zip(caminho))
+                finally:
+                    os.remove(caminho)
+    except ErroImportacao as e:
+        for caminho, _, _ in arquivos:
+            os.remove(caminho)
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    if not arquivos:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": "Nenhuma planilha encontrada no envio."})
+
+    resultados, novos = [], []
+    for caminho, sha256, nome in arquivos:
+        anterior = arquivo_importado(db, sha256, nome)
+        if anterior:
+            # Reenvio idêntico: fica fora do lote
+            os.remove(caminho)
+            resultados.append({
+                "arquivo": nome, "status": "duplicado",
+                "mensagem": f"Arquivo idêntico já importado em {anterior.imported_at:%d/%m/%Y %H:%M} ({anterior.filename}). Nada a fazer.",
+            })
         else:
-            df = pd.read_excel(io.BytesIO(contents))
-    except Exception as e:
-        return {"status": "erro", "message": f"Arquivo ilegível: {str(e)}"}
+            novos.append((caminho, nome, estimar_linhas(caminho, nome), sha256))
+    if not novos:
+        return {"status": "sucesso", "duplicado": True, "arquivos": resultados, "mensagem": "Todos os arquivos já tinham sido importados."}
 
-    mapa = identificar_colunas(df)
-    if not mapa:
-        return {"status": "erro", "message": "Colunas não identificadas."}
-    
-    print(f"Mapa identificado: {mapa}")
+    lote = fila_importacao.enviar_lote(novos, mode)
+    if not lote:
+        for caminho, _, _, _ in novos:
+            os.remove(caminho)
+        return JSONResponse(status_code=429, content={"status": "erro", "message": "Fila de importação cheia. Tente novamente em instantes."})
+    resultados += [{"arquivo": job.arquivo, "status": job.status, "job_id": job.id, "local": job.local} for job in lote.arquivos]
+    return {
+        "status": "sucesso", "job_id": lote.id, "arquivos": resultados,
+        "mensagem": f"Importação de {len(novos)} arquivos iniciada.",
+    }
 
-    c = lambda k: mapa.get(k)
-    count = 0
-    
-    for _, row in df.iterrows():
-        try:
-            # Extrai dados da MARCA INTERNA (Barum/Continental)
-            marca_interna = str(row[c('marca_interna')]).strip().upper() if c('marca_interna') else "DESCONHECIDA"
-            modelo_interno = str(row[c('model_interno')]).strip() if c('model_interno') else "PADRÃO"
-            
-            # Extrai dados do CONCORRENTE
-            marca_concorrente = str(row[c('marca_concorrente')]).strip().upper() if c('marca_concorrente') else "DESCONHECIDA"
-            modelo_concorrente = str(row[c('modelo_concorrente')]).strip() if c('modelo_concorrente') else "PADRÃO"
-            
-            medida = str(row[c('width')]).strip() if c('width') else "N/A"
-            aro = limpar_aro(row[c('rim')] if c('rim') else "0")
-            competitor = limpar_empresa(row[c('competitor')] if c('competitor') else "Concorrente")
-            data_col = parse_data(row[c('date')]) if c('date') else datetime.now()
-            
-            # Origem
-            origem = "-"
-            if c('origin'):
-                raw_o = str(row[c('origin')]).strip().upper()
-                if "NAC" in raw_o: 
-                    origem = "NACIONAL"
-                elif "IMP" in raw_o: 
-                    origem = "IMPORTADO"
-            
-            # Preços
-            p_venda = tratar_preco(row[c('price')])
-            p_custo = tratar_preco(row[c('sell_in')]) if c('sell_in') else 0.0
-            
-            # MKP - calcula se não existir
-            v_mkp = 0.0
-            if c('mkp') and pd.notna(row[c('mkp')]):
-                mkp_val = str(row[c('mkp')])
-                if mkp_val.startswith('='):
-                    # Calcula MKP baseado nos preços
-                    if p_custo > 0:
-                        v_mkp = (p_venda / p_custo) - 1
-                else:
-                    try:
-                        v_mkp = float(mkp_val.replace(',', '.'))
-                    except:
-                        v_mkp = 0.0
-            elif p_custo > 0:
-                v_mkp = (p_venda / p_custo) - 1
-            
-            # Localidade
-            city, region = cidade_arq, regiao_arq
-            
-            # Código único baseado na marca interna + modelo interno + medida
-            unique_code = f"{marca_interna}-{modelo_interno}-{medida}".replace(" ", "").replace("/", "").replace("\\", "")
-            
-            # Verifica/Cria produto
-            produto = db.query(Product).filter(Product.unique_code == unique_code).first()
-            if not produto:
-                produto = Product(
-                    name=f"{marca_interna} {modelo_interno} {medida}",
-                    marca_interna=marca_interna,
-                    model_interno=modelo_interno,
-                    marca_concorrente=marca_concorrente,
-                    width=medida,
-                    profile="",
-                    rim=aro,
-                    unique_code=unique_code
-                )
-                db.add(produto)
-                db.commit()
-                db.refresh(produto)
-            
-            # Cria registro de preço histórico
-            novo = PriceHistory(
-                product_id=produto.id,
-                competitor=competitor,
-                competitor_brand=marca_concorrente,
-                competitor_model=modelo_concorrente,
-                price=p_venda,
-                sell_in=p_custo,
-                origin=origem,
-                mkp=v_mkp,
-                region=region,
-                city=city,
-                date_collected=data_col,
-                source="UPLOAD"
-            )
-            db.add(novo)
-            count += 1
-            
-        except Exception as e:
-            print(f"Erro processando linha: {e}")
-            continue
-    
-    db.commit()
-    return {"status": "sucesso", "mensagem": f"{count} registros importados. Local: {city}"}
-
-# No main.py, na função aplicar_filtros, adicione:
-
-def aplicar_filtros(query, region, brand, rim, competitor, competitor_brand, origin, search):  # ADICIONE competitor_brand
-    if region and "Toda" not in region: 
-        query = query.filter(PriceHistory.region == region)
-    if origin and "Toda" not in origin: 
-        query = query.filter(PriceHistory.origin == origin)
-
-    if brand and "Toda" not in brand:
-        lista = [x for x in brand.split(',') if x and "Toda" not in x]
-        if lista: 
-            query = query.filter(Product.marca_interna.in_(lista))
-
-    if rim and "Todo" not in rim:
-        lista = [x for x in rim.split(',') if x and "Todo" not in x]
-        if lista: 
-            query = query.filter(Product.rim.in_(lista))
-
-    if competitor and "Todo" not in competitor:
-        lista = [x for x in competitor.split(',') if x and "Todo" not in x]
-        if lista: 
-            query = query.filter(PriceHistory.competitor.in_(lista))
-    
-    # NOVO: Filtro por marca concorrente
-    if competitor_brand and "Toda" not in competitor_brand:
-        lista = [x for x in competitor_brand.split(',') if x and "Toda" not in x]
-        if lista: 
-            query = query.filter(PriceHistory.competitor_brand.in_(lista))
-    
-    if search:
-        termo = f"%{search}%"
-        query = query.filter(or_(
-            Product.name.ilike(termo), 
-            Product.marca_interna.ilike(termo),
-            Product.marca_concorrente.ilike(termo),
-            Product.width.ilike(termo),  # ADICIONADO: busca por medida
-            Product.rim.ilike(termo),
-            PriceHistory.competitor.ilike(termo), 
-            PriceHistory.city.ilike(termo),
-            PriceHistory.competitor_brand.ilike(termo)
-        ))
-    return query
+@app.get("/upload/{job_id}")
+def upload_status(job_id: str):
+    job = fila_importacao.obter(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"status": "erro", "message": "Importação não encontrada."})
+    return job.resumo()
+
+def com_cache(request, chave, calcular, serializar=None):
+    # Serve do cache de respostas; na falta calcula, serializa (e comprime) uma vez e guarda
+    aceita = escolher_codificacao(request.headers.get("accept-encoding"))
+    chave = (request.state.versao_dados,) + chave + (aceita,)
+    guardado = cache_respostas.obter(chave)
+    if guardado is None:
+        resultado = calcular()
+        if isinstance(resultado, Response):
+            return resultado  # erros não entram no cache
+        with etapa("serializacao"):
+            corpo = serializar(resultado) if serializar else JSONResponse(content=jsonable_encoder(resultado)).body
+            guardado = comprimir(corpo, aceita)
+        cache_respostas.guardar(chave, *guardado)
+    corpo, codificacao = guardado
+    headers = {"Vary": "Accept-Encoding"}
+    if codificacao:
+        headers["Content-Encoding"] = codificacao
+    return Response(content=corpo, media_type="application/json", headers=headers)
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return cache_respostas.estatisticas()
+
+@app.get("/metrics")
+def get_metrics():
+    # Formato texto do Prometheus; os gauges são lidos na hora da coleta
+    estatisticas = cache_respostas.estatisticas()
+    metricas.definir("tireforce_cache_respostas_bytes", estatisticas["bytes"], "Bytes no cache de respostas")
+    metricas.definir("tireforce_cache_respostas_entradas", estatisticas["entradas"], "Entradas no cache de respostas")
+    for resultado in ("hits", "misses", "descartes"):
+        metricas.definir("tireforce_cache_respostas_eventos", estatisticas[resultado], "Acessos ao cache de respostas desde o início", resultado=resultado)
+    metricas.definir("tireforce_importacoes_pendentes", fila_importacao.pendentes, "Importações na fila ou processando")
+    return PlainTextResponse(metricas.texto(), media_type="text/plain; version=0.0.4")
 
 # Atualize as rotas /dashboard-data e /analytics para incluir o novo parâmetro:
 
 @app.get("/dashboard-data")
 def get_dashboard_data(
+    request: Request,
     region: str = None, 
     brand: str = None, 
     rim: str = None, 
@@ -308,35 +222,134 @@ def get_dashboard_data(
     competitor_brand: str = None,  # NOVO PARÂMETRO
     origin: str = None, 
     search: str = None, 
+    date_from: str = None,  # AAAA-MM-DD; anterior ao limite do arquivo Parquet, lê também de lá (sem ele, só a janela quente)
+    date_to: str = None,
+    latest: bool = False,  # só o preço mais recente por produto/concorrente/modelo/cidade
+    limit: int = None,  # paginação por cursor (keyset em data + id)
+    cursor: str = None,
+    sort: str = None,  # ex.: "preco,-data"
+    fields: str = None,  # ex.: "produto,preco,data"
+    format: str = None,  # "columnar": nomes das colunas uma vez + um array por coluna
     db: Session = Depends(get_db)
 ):
-    query = db.query(PriceHistory, Product).join(Product)
-    query = aplicar_filtros(query, region, brand, rim, competitor, competitor_brand, origin, search)  # ATUALIZADO
-    results = query.order_by(desc(PriceHistory.date_collected)).all()
+    filtros = normalizar_filtros(region, brand, rim, competitor, competitor_brand, origin, search)
+    try:
+        periodo = interpretar_periodo(date_from, date_to)
+    except ParametroInvalido as e:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    chave = ("dashboard-data", filtros, periodo, latest, limit, cursor, sort, fields, format)
+    brutos = (region, brand, rim, competitor, competitor_brand, origin, search)
+
+    def calcular_colunar(limit=limit):
+        # Caminho rápido: tuplas via with_entities, sem um dict por linha
+        with historico_completo(db, brutos, periodo, latest):
+            with etapa("montagem"):
+                query = db.query(PriceHistory, Product).join(Product)
+                query = aplicar_filtros(query, *brutos, periodo=periodo, ultimos=latest)
+            try:
+                with etapa("execucao"):
+                    campos = escolher_campos(fields)
+                    ordem = interpretar_ordem(sort)
+                    if limit is not None or cursor:
+                        limit = min(max(limit or LIMITE_PADRAO, 1), LIMITE_MAXIMO)
+                    linhas, proximo = paginar_tuplas(query, campos, ordem, limit, cursor, None if latest else brutos)
+            except ParametroInvalido as e:
+                return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+            with etapa("serializacao"):
+                resposta = colunar(campos, linhas)
+            if limit is not None:
+                with etapa("execucao"):
+                    resposta.update({"total": contar(query), "next_cursor": proximo})
+            return resposta
+
+    if format == "columnar":
+        return com_cache(request, chave, calcular_colunar, serializar=para_json)
+    if format:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": f"Formato inválido: {format}. Use columnar."})
+
+    def calcular(limit=limit):
+        with historico_completo(db, brutos, periodo, latest):
+            with etapa("montagem"):
+                query = db.query(PriceHistory, Product).join(Product)
+                query = aplicar_filtros(query, *brutos, periodo=periodo, ultimos=latest)  # ATUALIZADO
+
+            if limit is not None or cursor or sort or fields:
+                try:
+                    with etapa("execucao"):
+                        campos = escolher_campos(fields)
+                        ordem = interpretar_ordem(sort)
+                        if limit is not None or cursor:
+                            limit = min(max(limit or LIMITE_PADRAO, 1), LIMITE_MAXIMO)
+                        linhas, proximo = paginar(query, campos, ordem, limit, cursor, None if latest else brutos)
+                except ParametroInvalido as e:
+                    return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+                if limit is None:
+                    return linhas
+                with etapa("execucao"):
+                    return {"items": linhas, "total": contar(query), "next_cursor": proximo}
+
+            with etapa("execucao"):
+                results = query.order_by(desc(PriceHistory.date_collected)).all()
     
-    return [
-        {
-            "id": p.id,
-            "produto": pr.name,
-            "medida": pr.width,
-            "marca_interna": pr.marca_interna,
-            "modelo_interno": pr.model_interno,
-            "marca_concorrente": p.competitor_brand,
-            "modelo_concorrente": p.competitor_model,
-            "aro": pr.rim,
-            "origin": p.origin,
-            "concorrente": p.competitor,
-            "city": p.city,
-            "preco": p.price,
-            "sell_in": p.sell_in,
-            "mkp": p.mkp,
-            "data": p.date_collected
-        } 
-        for p, pr in results
-    ]
+            return [
+                {
+                    "id": p.id,
+                    "produto": pr.name,
+                    "medida": pr.width,
+                    "marca_interna": pr.marca_interna,
+                    "modelo_interno": pr.model_interno,
+                    "marca_concorrente": p.competitor_brand,
+                    "modelo_concorrente": p.competitor_model,
+                    "aro": pr.rim,
+                    "origin": p.origin,
+                    "concorrente": p.competitor,
+                    "city": p.city,
+                    "preco": p.price,
+                    "sell_in": p.sell_in,
+                    "mkp": p.mkp,
+                    "data": p.date_collected
+                } 
+                for p, pr in results
+            ]
+
+    return com_cache(request, chave, calcular)
+
+@app.get("/summary")
+def get_summary(
+    request: Request,
+    region: str = None, 
+    brand: str = None, 
+    rim: str = None, 
+    competitor: str = None, 
+    competitor_brand: str = None,
+    origin: str = None, 
+    search: str = None, 
+    date_from: str = None,
+    date_to: str = None,
+    latest: bool = False,
+    db: Session = Depends(get_db)
+):
+    # Estatísticas do dashboard calculadas no banco (sem baixar a lista inteira)
+    filtros = normalizar_filtros(region, brand, rim, competitor, competitor_brand, origin, search)
+    try:
+        periodo = interpretar_periodo(date_from, date_to)
+    except ParametroInvalido as e:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    brutos = (region, brand, rim, competitor, competitor_brand, origin, search)
+
+    def calcular():
+        with historico_completo(db, brutos, periodo, latest):
+            with etapa("montagem"):
+                query = db.query(PriceHistory).join(Product)
+                query = aplicar_filtros(query, *brutos, periodo=periodo, ultimos=latest)
+            with etapa("execucao"):
+                return calcular_resumo(db, query)
+
+    return com_cache(request, ("summary", filtros, periodo, latest), calcular)
 
 @app.get("/analytics")
 def get_analytics(
+    request: Request,
     region: str = None, 
     brand: str = None, 
     rim: str = None, 
@@ -344,61 +357,159 @@ def get_analytics(
     competitor_brand: str = None,  # NOVO PARÂMETRO
     origin: str = None, 
     search: str = None, 
+    date_from: str = None,
+    date_to: str = None,
+    latest: bool = False,
     db: Session = Depends(get_db)
 ):
-    query = db.query(PriceHistory).join(Product)
-    query = aplicar_filtros(query, region, brand, rim, competitor, competitor_brand, origin, search)  # ATUALIZADO
+    filtros = normalizar_filtros(region, brand, rim, competitor, competitor_brand, origin, search)
+    try:
+        periodo = interpretar_periodo(date_from, date_to)
+    except ParametroInvalido as e:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    brutos = (region, brand, rim, competitor, competitor_brand, origin, search)
 
-    total = query.count()
-    all_competitors = db.query(PriceHistory.competitor).distinct().all()
-    competitors_list = sorted([c[0] for c in all_competitors if c[0]])
-    
-    all_brands = db.query(Product.marca_interna).distinct().all()
-    brands_list = sorted([b[0] for b in all_brands if b[0]])
-    
-    # NOVO: Lista de marcas concorrentes
-    all_concorrente_brands = db.query(PriceHistory.competitor_brand).distinct().all()
-    concorrente_brands_list = sorted([cb[0] for cb in all_concorrente_brands if cb[0]])
-    
-    # NOVO: Lista de medidas
-    all_measures = db.query(Product.width).distinct().all()
-    measures_list = sorted([m[0] for m in all_measures if m[0]])
+    def calcular():
+        # Sem "search" nem "latest" os números saem do resumo diário (price_daily), que não
+        # é arquivado; a janela padrão é a mesma do /timeseries nos dois caminhos
+        janela = periodo if latest else janela_padrao(periodo)
+        if not search and not latest:
+            with etapa("execucao"):
+                indicadores = calcular_indicadores_diarios(db, brutos, janela)
+        else:
+            with historico_completo(db, brutos, janela, latest):
+                with etapa("montagem"):
+                    query = db.query(PriceHistory).join(Product)
+                    query = aplicar_filtros(query, *brutos, periodo=janela, ultimos=latest)  # ATUALIZADO
+
+                with etapa("execucao"):
+                    indicadores = calcular_indicadores(db, query)
+
+        # Listas dos filtros vêm do cache de facetas (atualizado a cada upload);
+        # fora do bloco acima, que encobre o price_history com a fatia do arquivo
+        with etapa("execucao"):
+            listas, _, _, _ = cache_facetas.obter(db)
 
-    if total == 0:
         return {
-            "total": 0, 
-            "media": 0, 
-            "minimo": 0, 
-            "top_aro": "-", 
-            "top_concorrente": "-", 
-            "competitors_list": competitors_list, 
-            "brands_list": brands_list,
-            "concorrente_brands_list": concorrente_brands_list,  # NOVO
-            "measures_list": measures_list  # NOVO
+            **indicadores,
+            **listas
         }
 
-    media = query.with_entities(func.avg(PriceHistory.price)).scalar()
-    minimo = query.with_entities(func.min(PriceHistory.price)).scalar()
-    
-    top_aro_q = db.query(Product.rim, func.count(PriceHistory.id))\
-        .join(Product)\
-        .filter(PriceHistory.id.in_([p.id for p in query.all()]))\
-        .group_by(Product.rim)\
-        .order_by(desc(func.count(PriceHistory.id)))\
-        .first()
-    aro_mais_vendido = top_aro_q[0] if top_aro_q else "-"
-    
-    mais_barato = query.order_by(PriceHistory.price.asc()).first()
-    concorrente_top = mais_barato.competitor if mais_barato else "-"
+    return com_cache(request, ("analytics", filtros, periodo, latest), calcular)
 
-    return {
-        "total": total, 
-        "media": round(media, 2), 
-        "minimo": round(minimo, 2), 
-        "top_aro": aro_mais_vendido, 
-        "top_concorrente": concorrente_top, 
-        "competitors_list": competitors_list, 
-        "brands_list": brands_list,
-        "concorrente_brands_list": concorrente_brands_list,  # NOVO
-        "measures_list": measures_list  # NOVO
-    }
\ No newline at end of file
+@app.get("/timeseries")
+def get_timeseries(
+    request: Request,
+    region: str = None, 
+    brand: str = None, 
+    rim: str = None, 
+    competitor: str = None, 
+    competitor_brand: str = None,
+    origin: str = None, 
+    search: str = None, 
+    date_from: str = None,
+    date_to: str = None,
+    bucket: str = "day",  # day, week ou month
+    group_by: str = None,  # ex.: "medida", "concorrente", "region"
+    db: Session = Depends(get_db)
+):
+    # Evolução de preço (mín/média/máx/último) lida do resumo diário. Sem date_from,
+    # mesma regra das outras rotas: só a janela quente (a partir do limite do arquivo)
+    if bucket not in BUCKETS:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": f"Bucket inválido: {bucket}. Use {', '.join(BUCKETS)}."})
+    if group_by and group_by not in AGRUPAMENTOS:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": f"Agrupamento inválido: {group_by}. Use {', '.join(AGRUPAMENTOS)}."})
+    filtros = normalizar_filtros(region, brand, rim, competitor, competitor_brand, origin, search)
+    try:
+        periodo = interpretar_periodo(date_from, date_to)
+    except ParametroInvalido as e:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    brutos = (region, brand, rim, competitor, competitor_brand, origin, search)
+
+    def calcular():
+        # O resumo diário não é arquivado; só a busca (que lê o price_history) precisa do arquivo
+        janela = janela_padrao(periodo)
+        with historico_completo(db, brutos, janela) if search else nullcontext():
+            with etapa("execucao"):
+                series = calcular_serie(db, brutos, bucket, group_by, janela)
+        return {"bucket": bucket, "group_by": group_by, "series": series}
+
+    return com_cache(request, ("timeseries", filtros, periodo, bucket, group_by), calcular)
+
+@app.get("/price-gap")
+def get_price_gap(
+    request: Request,
+    region: str = None, 
+    brand: str = None, 
+    rim: str = None, 
+    competitor: str = None, 
+    competitor_brand: str = None,
+    origin: str = None, 
+    search: str = None, 
+    date_from: str = None,
+    date_to: str = None,
+    latest: bool = False,
+    db: Session = Depends(get_db)
+):
+    # Matriz medida/aro x marca concorrente: último preço, mediana e gap % contra o preço interno
+    filtros = normalizar_filtros(region, brand, rim, competitor, competitor_brand, origin, search)
+    try:
+        periodo = interpretar_periodo(date_from, date_to)
+    except ParametroInvalido as e:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    brutos = (region, brand, rim, competitor, competitor_brand, origin, search)
+
+    def calcular():
+        # Só marca interna e aro (colunas da célula): a matriz sai pronta do price_gap.
+        # Filtro por coleta (região, concorrente, origem, período, busca, latest) relê o histórico
+        region_n, origin_n, _, _, concorrentes, marcas_concorrentes, search_n = filtros
+        if not (region_n or origin_n or concorrentes or marcas_concorrentes or search_n or periodo or latest):
+            with etapa("execucao"):
+                return calcular_gap_resumido(db, brand, rim)
+        with historico_completo(db, brutos, periodo, latest):
+            with etapa("montagem"):
+                query = db.query(PriceHistory).join(Product)
+                query = aplicar_filtros(query, *brutos, periodo=periodo, ultimos=latest)
+            with etapa("execucao"):
+                return calcular_gap_precos(db, query)
+
+    return com_cache(request, ("price-gap", filtros, periodo, latest), calcular, serializar=para_json)
+
+@app.get("/export")
+def export_data(
+    format: str = "csv",
+    region: str = None, 
+    brand: str = None, 
+    rim: str = None, 
+    competitor: str = None, 
+    competitor_brand: str = None,
+    origin: str = None, 
+    search: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    latest: bool = False
+):
+    # Exportação em streaming (mesmas colunas da planilha de upload)
+    if format not in EXPORTADORES:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": f"Formato inválido: {format}. Use csv, ndjson ou xlsx."})
+    try:
+        periodo = interpretar_periodo(date_from, date_to)
+    except ParametroInvalido as e:
+        return JSONResponse(status_code=400, content={"status": "erro", "message": str(e)})
+    tipo, extensao = FORMATOS[format]
+    filtros = (region, brand, rim, competitor, competitor_brand, origin, search)
+    return StreamingResponse(
+        EXPORTADORES[format](filtros, periodo, latest),
+        media_type=tipo,
+        headers={"Content-Disposition": f'attachment; filename="exportacao_precos.{extensao}"'}
+    )
+
+@app.get("/facets")
+def get_facets(request: Request, counts: bool = False, db: Session = Depends(get_db)):
+    # Listas dos filtros com ETag: o cliente manda If-None-Match e recebe 304 se nada mudou
+    listas, contagens, etag_listas, etag_contagens = cache_facetas.obter(db)
+    etag = etag_contagens if counts else etag_listas
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    corpo = {**listas, "counts": contagens} if counts else listas
+    return JSONResponse(content=corpo, headers={"ETag": etag})
\ No newline at end of file
@@ -0,0 +1,240 @@
+from collections import defaultdict, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import event
+
+# --- MÉTRICAS (formato Prometheus em /metrics) ---
+# Contadores e histogramas em memória, por processo. Cada requisição (ou job de
+# importação) abre uma Medicao: as etapas nomeadas e as consultas SQL feitas
+# dentro dela somam ali (vira o cabeçalho Server-Timing / o resumo do job) e
+# também nos histogramas globais.
+
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos) + "}"
+
+class Metricas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ajuda = {}
+        self.tipos = {}
+        self.valores = defaultdict(float)  # (nome, rótulos) -> valor (contador/gauge)
+        self.histogramas = {}  # (nome, rótulos) -> [contagem por balde..., soma, total]
+
+    def _registrar(self, nome, tipo, ajuda):
+        if nome not in self.tipos:
+            self.tipos[nome] = tipo
+            self.ajuda[nome] = ajuda
+
+    def somar(self, nome, valor=1, ajuda="", **rotulos):
+        with self.lock:
+            self._registrar(nome, "counter", ajuda)
+            self.valores[(nome, tuple(sorted(rotulos.items())))] += valor
+
+    def definir(self, nome, valor, ajuda="", **rotulos):
+        with self.lock:
+            self._registrar(nome, "gauge", ajuda)
+            self.valores[(nome, tuple(sorted(rotulos.items())))] = valor
+
+    def observar(self, nome, segundos, ajuda="", **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self.lock:
+            self._registrar(nome, "histogram", ajuda)
+            serie = self.histogramas.get(chave)
+            if serie is None:
+                serie = self.histogramas[chave] = [0] * len(BALDES_SEGUNDOS) + [0.0, 0]
+            for i, limite in enumerate(BALDES_SEGUNDOS):
+                if segundos <= limite:
+                    serie[i] += 1
+            serie[-2] += segundos
+            serie[-1] += 1
+
+    def texto(self):
+        # Exposição no formato texto do Prometheus (0.0.4)
+        with self.lock:
+            valores = sorted(self.valores.items())
+            histogramas = sorted((chave, list(serie)) for chave, serie in self.histogramas.items())
+        por_nome = defaultdict(list)
+        for (nome, rotulos), valor in valores:
+            por_nome[nome].append(f"{nome}{_rotulos(rotulos)} {valor:g}")
+        for (nome, rotulos), serie in histogramas:
+            for limite, contagem in zip(BALDES_SEGUNDOS, serie):
+                por_nome[nome].append(f"{nome}_bucket{_rotulos(rotulos + (('le', f'{limite:g}'),))} {contagem}")
+            por_nome[nome].append(f"{nome}_bucket{_rotulos(rotulos + (('le', '+Inf'),))} {serie[-1]}")
+            por_nome[nome].append(f"{nome}_sum{_rotulos(rotulos)} {serie[-2]:.6f}")
+            por_nome[nome].append(f"{nome}_count{_rotulos(rotulos)} {serie[-1]}")
+        linhas = []
+        for nome in sorted(por_nome):
+            linhas.append(f"# HELP {nome} {self.ajuda[nome]}")
+            linhas.append(f"# TYPE {nome} {self.tipos[nome]}")
+            linhas.extend(por_nome[nome])
+        return "\n".join(linhas) + "\n"
+
+metricas = Metricas()
+
+# --- MEDIÇÃO POR REQUISIÇÃO / JOB ---
+
+class Medicao:
+    def __init__(self):
+        self.etapas = defaultdict(float)  # nome -> segundos
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.threads = set()  # threads que trabalharam para esta medição (usado pelo perfilador)
+
+    def resumo(self):
+        return {
+            "etapas": {nome: round(segundos, 4) for nome, segundos in self.etapas.items()},
+            "consultas_sql": self.consultas,
+            "tempo_sql": round(self.tempo_sql, 4),
+        }
+
+    def server_timing(self):
+        partes = [f"{nome};dur={segundos * 1000:.1f}" for nome, segundos in self.etapas.items()]
+        partes.append(f'sql;dur={self.tempo_sql * 1000:.1f};desc="{self.consultas} consultas"')
+        return ", ".join(partes)
+
+_medicao_atual = ContextVar("medicao_atual", default=None)
+
+@contextmanager
+def medicao():
+    atual = Medicao()
+    token = _medicao_atual.set(atual)
+    try:
+        yield atual
+    finally:
+        _medicao_atual.reset(token)
+
+@contextmanager
+def etapa(nome):
+    # Etapa nomeada: soma na medição corrente e no histograma tireforce_etapa_segundos
+    atual = _medicao_atual.get()
+    if atual is not None:
+        atual.threads.add(threading.get_ident())
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        decorrido = time.perf_counter() - inicio
+        if atual is not None:
+            atual.etapas[nome] += decorrido
+        metricas.observar("tireforce_etapa_segundos", decorrido, "Duração das etapas nomeadas (importação e leituras)", etapa=nome)
+
+def contar_erro(motivo, quantidade=1):
+    # Erros por linha viram contador (em vez de um print por linha)
+    if quantidade:
+        metricas.somar("tireforce_importacao_erros_total", quantidade, "Linhas com problema na importação, por motivo", motivo=motivo)
+
+# --- CONSULTAS SQL (eventos do SQLAlchemy) ---
+
+def instrumentar_engine(engine, nome):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, sql, parametros, contexto, executemany):
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, sql, parametros, contexto, executemany):
+        decorrido = time.perf_counter() - conn.info["inicio_consulta"].pop()
+        atual = _medicao_atual.get()
+        if atual is not None:
+            atual.consultas += 1
+            atual.tempo_sql += decorrido
+            atual.threads.add(threading.get_ident())
+        metricas.somar("tireforce_sql_consultas_total", 1, "Consultas SQL executadas", engine=nome)
+        metricas.somar("tireforce_sql_segundos_total", decorrido, "Tempo gasto em consultas SQL", engine=nome)
+
+# --- MIDDLEWARE DE TEMPO POR REQUISIÇÃO ---
+# ASGI puro (o BaseHTTPMiddleware atrapalharia o StreamingResponse do /export)
+
+TIREFORCE_PROFILER = os.getenv("TIREFORCE_PROFILER", "") not in ("", "0")
+PASTA_PERFIS = os.getenv("TIREFORCE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "tireforce_perfis"))
+INTERVALO_AMOSTRAGEM = float(os.getenv("TIREFORCE_PROFILER_INTERVALO_MS", "5")) / 1000
+
+class MedirRequisicoes:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        inicio = time.perf_counter()
+        estado = {"status": 500}
+        with medicao() as atual:
+            perfilador = Perfilador(atual) if TIREFORCE_PROFILER and _pediu_perfil(scope) else None
+
+            async def enviar(mensagem):
+                if mensagem["type"] == "http.response.start":
+                    estado["status"] = mensagem["status"]
+                    cabecalhos = list(mensagem.get("headers", []))
+                    cabecalhos.append((b"server-timing", atual.server_timing().encode()))
+                    cabecalhos.append((b"x-consultas-sql", str(atual.consultas).encode()))
+                    if perfilador:
+                        cabecalhos.append((b"x-profile", perfilador.parar(scope["path"]).encode()))
+                    mensagem = {**mensagem, "headers": cabecalhos}
+                await send(mensagem)
+
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                if perfilador:
+                    perfilador.parar(scope["path"])
+                rota = getattr(scope.get("route"), "path", "outra")
+                decorrido = time.perf_counter() - inicio
+                metricas.somar("tireforce_http_requisicoes_total", 1, "Requisições HTTP", metodo=scope["method"], rota=rota, status=estado["status"])
+                metricas.observar("tireforce_http_segundos", decorrido, "Duração das requisições HTTP", metodo=scope["method"], rota=rota)
+                metricas.somar("tireforce_http_consultas_sql_total", atual.consultas, "Consultas SQL feitas pelas requisições", rota=rota)
+
+def _pediu_perfil(scope):
+    # ?profile=1 ou cabeçalho X-Profile: 1 (só vale com TIREFORCE_PROFILER=1)
+    if b"profile=1" in scope.get("query_string", b"").split(b"&"):
+        return True
+    return (b"x-profile", b"1") in scope.get("headers", [])
+
+# --- PERFILADOR POR AMOSTRAGEM (opt-in, uma requisição) ---
+# Uma thread lê sys._current_frames() a cada INTERVALO_AMOSTRAGEM e conta as
+# pilhas das threads que trabalharam para a requisição. Grava no formato
+# "collapsed" (a;b;c contagem), que o speedscope e o flamegraph.pl abrem.
+
+class Perfilador:
+    def __init__(self, atual):
+        self.atual = atual
+        self.pilhas = Counter()
+        self.caminho = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True, name="perfilador")
+        self._thread.start()
+
+    def _amostrar(self):
+        while not self._parar.wait(INTERVALO_AMOSTRAGEM):
+            quadros = sys._current_frames()
+            for ident in list(self.atual.threads):
+                quadro = quadros.get(ident)
+                pilha = []
+                while quadro is not None:
+                    codigo = quadro.f_code
+                    pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{quadro.f_lineno})")
+                    quadro = quadro.f_back
+                if pilha:
+                    self.pilhas[";".join(reversed(pilha))] += 1
+
+    def parar(self, rota):
+        if self.caminho is None:
+            self._parar.set()
+            self._thread.join()
+            os.makedirs(PASTA_PERFIS, exist_ok=True)
+            nome = f"{time.strftime('%Y%m%d_%H%M%S')}_{rota.strip('/').replace('/', '_') or 'raiz'}_{threading.get_ident()}.txt"
+            self.caminho = os.path.join(PASTA_PERFIS, nome)
+            with open(self.caminho, "w", encoding="utf-8") as f:
+                for pilha, contagem in self.pilhas.most_common():
+                    f.write(f"{pilha} {contagem}\n")
+        return self.caminho
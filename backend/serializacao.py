@@ -0,0 +1,52 @@
+import gzip
+import json
+from datetime import datetime
+
+# --- SERIALIZAÇÃO RÁPIDA ---
+# orjson (se instalado) codifica listas de tuplas e datetime direto em bytes,
+# sem passar pelo jsonable_encoder. brotli é opcional; gzip sempre existe.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TAMANHO_MINIMO_COMPRESSAO = 1024
+NIVEL_GZIP = 5
+QUALIDADE_BROTLI = 4
+
+def _padrao(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def para_json(objeto):
+    if orjson is not None:
+        return orjson.dumps(objeto)
+    return json.dumps(objeto, default=_padrao, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def colunar(campos, linhas):
+    # {"columns": [...], "data": [[valores da coluna 1], [valores da coluna 2], ...]}
+    colunas = [list(valores) for valores in zip(*linhas)] if linhas else [[] for _ in campos]
+    return {"columns": list(campos), "data": colunas}
+
+def escolher_codificacao(accept_encoding):
+    aceitas = {parte.split(";")[0].strip().lower() for parte in (accept_encoding or "").split(",")}
+    if "br" in aceitas and brotli is not None:
+        return "br"
+    if "gzip" in aceitas:
+        return "gzip"
+    return None
+
+def comprimir(corpo, codificacao):
+    # Devolve (corpo, codificação usada); corpos pequenos vão sem compressão
+    if not codificacao or len(corpo) < TAMANHO_MINIMO_COMPRESSAO:
+        return corpo, None
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=QUALIDADE_BROTLI), "br"
+    return gzip.compress(corpo, compresslevel=NIVEL_GZIP), "gzip"
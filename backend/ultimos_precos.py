@@ -0,0 +1,88 @@
+from sqlalchemy import select, insert, delete, func, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import pandas as pd
+from database import engine, PriceHistory, PriceLatest
+
+# --- ÚLTIMO PREÇO (snapshot) ---
+# price_latest guarda, por produto/concorrente/modelo concorrente/cidade, a coleta
+# mais recente (data, e id no empate). A ingestão faz upsert só quando a linha
+# nova é mais recente, então "latest=true" nas rotas lê uma linha por chave em
+# vez do histórico inteiro (custo pelo tamanho do catálogo, não da história).
+
+CHAVE_ULTIMO = ["product_id", "competitor", "competitor_model", "city"]
+TAMANHO_LOTE_ULTIMO = 5000
+
+_pronto = False
+
+def _chave_bruta():
+    # Mesma chave do price_latest, calculada sobre price_history
+    return [
+        PriceHistory.product_id,
+        func.coalesce(PriceHistory.competitor, ""),
+        func.coalesce(PriceHistory.competitor_model, ""),
+        func.coalesce(PriceHistory.city, ""),
+    ]
+
+def reconstruir_ultimos_precos(conn):
+    # Refaz o price_latest inteiro a partir do price_history
+    chave = _chave_bruta()
+    base = select(
+        *[coluna.label(nome) for coluna, nome in zip(chave, CHAVE_ULTIMO)],
+        PriceHistory.id, PriceHistory.price, PriceHistory.date_collected,
+        func.row_number().over(
+            partition_by=chave, order_by=(PriceHistory.date_collected.desc(), PriceHistory.id.desc())
+        ).label("pos"),
+    ).where(PriceHistory.price.isnot(None), PriceHistory.date_collected.isnot(None)).subquery()
+
+    conn.execute(delete(PriceLatest))
+    conn.execute(insert(PriceLatest).from_select(
+        CHAVE_ULTIMO + ["price_id", "price", "date_collected"],
+        select(*[base.c[nome] for nome in CHAVE_ULTIMO], base.c.id, base.c.price, base.c.date_collected)
+        .where(base.c.pos == 1)
+    ))
+
+def garantir_ultimos_precos():
+    # Banco antigo (sem price_latest populado): monta o snapshot uma vez no startup
+    global _pronto
+    if _pronto:
+        return
+    with engine.begin() as conn:
+        vazio = conn.execute(select(PriceLatest.id).limit(1)).first() is None
+        if vazio and conn.execute(select(PriceHistory.id).limit(1)).first() is not None:
+            reconstruir_ultimos_precos(conn)
+            print("Snapshot de últimos preços reconstruído.")
+    _pronto = True
+
+def atualizar_ultimos(db, linhas, primeiro_id):
+    # linhas: DataFrame recém-inserido no price_history, na ordem de inserção
+    # (ids primeiro_id, primeiro_id + 1, ...). Upsert só onde a linha é mais recente.
+    quadro = linhas[["product_id", "competitor", "competitor_model", "city", "price"]].copy()
+    for coluna in ("competitor", "competitor_model", "city"):
+        quadro[coluna] = quadro[coluna].fillna("")
+    quadro["date_collected"] = pd.to_datetime(linhas["date_collected"])
+    quadro["price_id"] = range(primeiro_id, primeiro_id + len(quadro))
+    quadro = quadro[quadro["price"].notna() & quadro["date_collected"].notna()]
+    if quadro.empty:
+        return 0
+
+    # Dentro do lote, fica só a mais recente de cada chave
+    quadro = quadro.sort_values(["date_collected", "price_id"], kind="stable")
+    quadro = quadro.drop_duplicates(CHAVE_ULTIMO, keep="last")
+    registros = quadro.to_dict("records")
+    for registro in registros:
+        registro["date_collected"] = registro["date_collected"].to_pydatetime()
+
+    comando = sqlite_insert(PriceLatest)
+    novo = comando.excluded
+    comando = comando.on_conflict_do_update(
+        index_elements=CHAVE_ULTIMO,
+        set_={"price_id": novo.price_id, "price": novo.price, "date_collected": novo.date_collected},
+        where=tuple_(novo.date_collected, novo.price_id) > tuple_(PriceLatest.date_collected, PriceLatest.price_id),
+    )
+    for inicio in range(0, len(registros), TAMANHO_LOTE_ULTIMO):
+        db.execute(comando, registros[inicio:inicio + TAMANHO_LOTE_ULTIMO])
+    return len(registros)
+
+def filtro_ultimos():
+    # Só a coleta mais recente de cada chave (o SQLite percorre o snapshot e busca pelo id)
+    return PriceHistory.id.in_(select(PriceLatest.price_id))
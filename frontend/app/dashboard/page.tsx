@@ -15,6 +15,7 @@ interface AnalyticsData {
   competitors_list: string[];
   brands_list: string[];
   concorrentes_brands_list: string[];
+  concorrente_brands_list?: string[];
 }
 
 interface TableData {
@@ -35,6 +36,24 @@ interface TableData {
   data: string;
 }
 
+interface PrecoCompetitivo {
+  preco: number;
+  medida: string;
+  marca: string;
+  concorrente: string;
+}
+
+// Linhas por página da tabela (paginação por cursor do /dashboard-data)
+const LIMITE_PAGINA = 100;
+
+interface PaginaDados {
+  items: TableData[];
+  total: number;
+  next_cursor: string | null;
+}
+
+const PRECO_COMPETITIVO_VAZIO: PrecoCompetitivo = { preco: 0, medida: '', marca: '', concorrente: '' };
+
 interface Filters {
   region: string;
   marca_interna: string[];
@@ -108,6 +127,8 @@ const DropdownMultiSelect = ({ label, options, selected, onChange }: {
 export default function Dashboard() {
   const fileInputRef = useRef<HTMLInputElement>(null);
   const [data, setData] = useState<TableData[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(false);
   const [companyName, setCompanyName] = useState('Visitante');
 
@@ -125,6 +146,8 @@ export default function Dashboard() {
     concorrentes_brands_list: []
   });
 
+  const [precoCompetitivo, setPrecoCompetitivo] = useState<PrecoCompetitivo>(PRECO_COMPETITIVO_VAZIO);
+
   const [filters, setFilters] = useState<Filters>({
     region: 'Todas', 
     marca_interna: [],
@@ -149,7 +172,7 @@ export default function Dashboard() {
     setFilters({ ...filters, [key]: newSelected });
   };
 
-  const fetchData = async () => {
+  const buildParams = () => {
     const params = new URLSearchParams();
     if (filters.region !== 'Todas') params.append('region', filters.region);
     
@@ -161,52 +184,53 @@ export default function Dashboard() {
     
     if (filters.origin !== 'Todos') params.append('origin', filters.origin);
     if (filters.search) params.append('search', filters.search);
+    return params;
+  };
+
+  const fetchPage = async (cursor: string | null): Promise<PaginaDados> => {
+    // Só uma página por vez; as seguintes vêm pelo next_cursor
+    const params = buildParams();
+    params.append('limit', String(LIMITE_PAGINA));
+    if (cursor) params.append('cursor', cursor);
+    const res = await fetch(`https://pricetireforce.onrender.com/dashboard-data?${params.toString()}`, { cache: 'no-store' });
+    return res.json();
+  };
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
     try {
-      const res = await fetch(`https://pricetireforce.onrender.com/dashboard-data?${params.toString()}`, { cache: 'no-store' });
-      const json: TableData[] = await res.json();
-      setData(json);
-
-      // Calcula valores adicionais
-      if (json.length > 0) {
-        const precos = json.map((item: TableData) => item.preco);
-        const minimo = Math.min(...precos);
-        const maximo = Math.max(...precos);
-        const media = precos.reduce((a: number, b: number) => a + b, 0) / precos.length;
-        
-        // Calcula margem média (MKP)
-        const margens = json.filter((item: TableData) => item.mkp).map((item: TableData) => item.mkp);
-        const margemMedia = margens.length > 0 
-          ? (margens.reduce((a: number, b: number) => a + b, 0) / margens.length) * 100 
-          : 0;
-        
-        // Encontra marca concorrente mais frequente
-        const marcasCount: {[key: string]: number} = {};
-        json.forEach((item: TableData) => {
-          const marca = item.marca_concorrente;
-          if (marca) {
-            marcasCount[marca] = (marcasCount[marca] || 0) + 1;
-          }
-        });
-        
-        const topMarcaConcorrente = Object.entries(marcasCount)
-          .sort((a: [string, number], b: [string, number]) => b[1] - a[1])[0]?.[0] || '-';
-        
-        // Extrai lista única de marcas concorrentes
-        const marcasConcorrentes = [...new Set(json.map((item: TableData) => item.marca_concorrente).filter(Boolean))].sort() as string[];
-        
-        // Atualiza analytics com novos dados
-        setAnalytics(prev => ({
-          ...prev,
-          total: json.length,
-          media: media || 0,
-          minimo: minimo || 0,
-          maximo: maximo || 0,
-          margem_media: margemMedia || 0,
-          top_marca_concorrente: topMarcaConcorrente,
-          concorrentes_brands_list: marcasConcorrentes
-        }));
-      }
+      const pagina = await fetchPage(nextCursor);
+      setData(prev => [...prev, ...(pagina.items || [])]);
+      setNextCursor(pagina.next_cursor || null);
+    } catch (err) {
+      console.error("Erro ao buscar mais dados", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const fetchData = async () => {
+    const params = buildParams();
+
+    try {
+      const pagina = await fetchPage(null);
+      setData(pagina.items || []);
+      setNextCursor(pagina.next_cursor || null);
+
+      // Estatísticas calculadas no servidor (/summary), sem percorrer a lista aqui
+      const resResumo = await fetch(`https://pricetireforce.onrender.com/summary?${params.toString()}`, { cache: 'no-store' });
+      const resumo: Partial<AnalyticsData> & { preco_competitivo?: PrecoCompetitivo } = await resResumo.json();
+      setAnalytics(prev => ({
+        ...prev,
+        total: resumo.total || 0,
+        media: resumo.media || 0,
+        minimo: resumo.minimo || 0,
+        maximo: resumo.maximo || 0,
+        margem_media: resumo.margem_media || 0,
+        top_marca_concorrente: resumo.top_marca_concorrente || '-'
+      }));
+      setPrecoCompetitivo(resumo.preco_competitivo || PRECO_COMPETITIVO_VAZIO);
       
       // Pega dados do endpoint /analytics para outras informações
       const resAnal = await fetch(`https://pricetireforce.onrender.com/analytics?${params.toString()}`, { cache: 'no-store' });
@@ -216,7 +240,8 @@ export default function Dashboard() {
         top_aro: jsonAnal.top_aro || '-',
         top_concorrente: jsonAnal.top_concorrente || '-',
         competitors_list: jsonAnal.competitors_list || [],
-        brands_list: jsonAnal.brands_list || []
+        brands_list: jsonAnal.brands_list || [],
+        concorrentes_brands_list: jsonAnal.concorrente_brands_list || []
       }));
       
     } catch (err) { 
@@ -242,44 +267,18 @@ export default function Dashboard() {
     formData.append('file', file);
     try {
       const res = await fetch('https://pricetireforce.onrender.com:8000/upload', { method: 'POST', body: formData });
-      const result = await res.json();
-      alert(result.mensagem);
+      let result = await res.json();
+      // A importação roda em segundo plano: acompanha o job até terminar
+      while (result.job_id && (result.status === 'sucesso' || result.status === 'na_fila' || result.status === 'processando')) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const resJob = await fetch(`https://pricetireforce.onrender.com:8000/upload/${result.job_id}`, { cache: 'no-store' });
+        result = await resJob.json();
+      }
+      alert(result.mensagem || result.message);
       fetchData();
     } catch { alert("Erro no upload."); } finally { setLoading(false); }
   };
 
-  // Calcula preço mais competitivo (baseado no menor preço por medida)
-  const getPrecoCompetitivo = () => {
-    if (data.length === 0) return { preco: 0, medida: '', marca: '', concorrente: '' };
-    
-    // Agrupa por medida e encontra o menor preço
-    const porMedida: {[key: string]: {preco: number, medida: string, marca: string, concorrente: string}} = {};
-    
-    data.forEach((item: TableData) => {
-      const medida = item.medida;
-      if (!porMedida[medida] || item.preco < porMedida[medida].preco) {
-        porMedida[medida] = {
-          preco: item.preco,
-          medida: item.medida,
-          marca: item.marca_concorrente,
-          concorrente: item.concorrente
-        };
-      }
-    });
-    
-    // Encontra o menor preço entre todas as medidas
-    let maisCompetitivo = Object.values(porMedida)[0];
-    Object.values(porMedida).forEach((item) => {
-      if (item.preco < maisCompetitivo.preco) {
-        maisCompetitivo = item;
-      }
-    });
-    
-    return maisCompetitivo || { preco: 0, medida: '', marca: '', concorrente: '' };
-  };
-
-  const precoCompetitivo = getPrecoCompetitivo();
-
   return (
     <div className="min-h-screen bg-slate-100">
       <nav className="bg-slate-900 text-white p-4 shadow-md sticky top-0 z-50">
@@ -625,6 +624,18 @@ export default function Dashboard() {
               </tbody>
             </table>
           </div>
+          {nextCursor && (
+            <div className="p-4 border-t border-slate-100 flex items-center justify-between text-xs text-slate-500">
+              <span>Mostrando {data.length} de {analytics.total} coletas</span>
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="bg-slate-900 hover:bg-slate-700 disabled:opacity-50 text-white font-bold px-4 py-2 rounded transition"
+              >
+                {loadingMore ? 'Carregando...' : 'Carregar mais'}
+              </button>
+            </div>
+          )}
         </div>
 
         {/* RESUMO ESTATÍSTICO */}